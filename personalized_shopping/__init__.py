@@ -13,13 +13,14 @@
 # limitations under the License.
 
 import os
-
-import google.auth
+import sys
 
 # Only set up Google Cloud credentials if using Vertex AI
 use_vertexai = os.environ.get("GOOGLE_GENAI_USE_VERTEXAI", "False").upper() in ["TRUE", "1"]
 if use_vertexai:
     try:
+        import google.auth
+
         _, project_id = google.auth.default()
         os.environ.setdefault("GOOGLE_CLOUD_PROJECT", project_id)
         os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "global")
@@ -29,17 +30,23 @@ if use_vertexai:
 else:
     os.environ.setdefault("GOOGLE_GENAI_USE_VERTEXAI", "False")
 
-import torch
+# Workaround to Resolve the PyTorch-Streamlit Incompatibility Issue. torch is
+# not imported here (it is only needed for image features and is patched
+# wherever it gets loaded); patch it if something else already did.
+if "torch" in sys.modules:
+    sys.modules["torch"].classes.__path__ = []
+
 
-# Workaround to Resolve the PyTorch-Streamlit Incompatibility Issue
-torch.classes.__path__ = []
+def __getattr__(name):
+    # Importing the package stays cheap: the agent module, which pulls in ADK
+    # and starts the search engine prewarm, is only loaded when the ADK server
+    # asks for `personalized_shopping.agent`
+    if name == "agent":
+        from . import agent
 
-# Initialize webshop environment (requires Java)
-# If Java is not available (e.g., in CI), set webshop_env to None
-try:
-    from .shared_libraries.init_env import init_env, webshop_env
-except Exception:
-    webshop_env = None
-    init_env = None
+        return agent
+    if name in ("get_webshop_env", "init_env"):
+        from .shared_libraries import init_env
 
-from . import agent
+        return getattr(init_env, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
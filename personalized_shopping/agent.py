@@ -20,6 +20,7 @@ from .tools.click import click
 from .tools.show_payment_qr import show_payment_qr
 
 from .prompt import personalized_shopping_agent_instruction
+from .shared_libraries.init_env import start_prewarm
 
 root_agent = Agent(
     model="gemini-2.5-flash",
@@ -37,3 +38,7 @@ root_agent = Agent(
         ),
     ],
 )
+
+# The ADK server loads this module at start-up; warm the search engine while
+# it finishes starting so the first search doesn't wait for the JVM
+start_prewarm()
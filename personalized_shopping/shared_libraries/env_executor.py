@@ -0,0 +1,74 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bounded worker pool that keeps environment steps off the ADK event loop.
+
+A WebShop step runs a Lucene query over JNI, renders Jinja templates and parses
+HTML, all synchronously. The tools hand that work to `run_env_call`, which runs
+it on a shared thread pool and awaits the result with a timeout, so one slow
+search never stalls the other conversations served by the same worker.
+
+Configuration (environment variables):
+
+    WEBSHOP_ENV_WORKERS  -- size of the worker pool (default 8)
+    WEBSHOP_ENV_TIMEOUT  -- seconds a tool waits for a step, 0 to wait forever
+                            (default 60)
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import os
+import threading
+
+ENV_WORKERS = int(os.environ.get("WEBSHOP_ENV_WORKERS", "8"))
+ENV_TIMEOUT = float(os.environ.get("WEBSHOP_ENV_TIMEOUT", "60")) or None
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_env_executor():
+    """Returns the process-wide pool that runs environment steps"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=ENV_WORKERS, thread_name_prefix="webshop-env"
+                )
+    return _executor
+
+
+async def run_env_call(fn, *args, timeout=ENV_TIMEOUT, **kwargs):
+    """Run `fn(*args, **kwargs)` on the environment pool and await its result
+
+    Raises `asyncio.TimeoutError` once `timeout` seconds have passed. The step
+    itself cannot be interrupted and finishes in the background; it keeps its
+    session locked until then, so the session's next call waits for it.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(
+        get_env_executor(), functools.partial(fn, *args, **kwargs)
+    )
+    return await asyncio.wait_for(future, timeout)
+
+
+def shutdown_env_executor(wait=True):
+    """Stop the pool; a new one is created on the next call"""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
@@ -12,8 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from contextlib import contextmanager
 import gym
 import os
+import threading
 
 gym.envs.registration.register(
     id="WebAgentTextEnv-v0",
@@ -23,37 +25,180 @@ gym.envs.registration.register(
 )
 
 
-def init_env(num_products, file_path=None):
+def init_env(num_products, file_path=None, server=None, session=None):
     # Use smaller data file for faster loading
     if file_path is None:
         base_dir = os.path.dirname(os.path.abspath(__file__))
+        small_file_path = os.path.join(base_dir, "data/items_shuffle_1000.json")
+        full_file_path = os.path.join(base_dir, "data/items_shuffle.json")
         if num_products and num_products <= 1000:
-            file_path = os.path.join(base_dir, "data/items_shuffle_1000.json")
-        elif num_products and num_products <= 10000:
-            # Use 1000 item file and let the environment slice to 10k
-            # This is faster than loading the full 5.2GB file
-            file_path = os.path.join(base_dir, "data/items_shuffle_1000.json")
+            file_path = small_file_path
+        elif os.path.exists(full_file_path) or not os.path.exists(small_file_path):
+            # Products are streamed and loading stops after `num_products`, so
+            # the full 5.2GB file is only read as far as needed
+            file_path = full_file_path
         else:
-            file_path = os.path.join(base_dir, "data/items_shuffle.json")
+            file_path = small_file_path
+
+        # Prefer a precompiled catalog (see `engine/catalog.py`) when present
+        catalog_path = os.path.splitext(file_path)[0] + ".catalog"
+        if os.path.exists(catalog_path):
+            file_path = catalog_path
 
     env = gym.make(
         "WebAgentTextEnv-v0",
         observation_mode="text",
         num_products=num_products,
         file_path=file_path,
+        server=server,
+        session=session,
     )
     return env
 
 
 num_product_items = 1000  # Use 1,000 items for fast performance
-_webshop_env = None
+DEFAULT_SESSION_ID = "default"
+
+
+class WebshopEnvManager:
+    """Session-scoped WebShop environments backed by one shared `SimServer`
+
+    Products, the search index and goals are loaded once; every ADK session
+    gets its own lightweight `WebAgentTextEnv` (browser, current page and
+    instruction text) on top of them. Hold `session(session_id)` while
+    stepping an environment so a session's turns are applied one at a time,
+    while different sessions proceed in parallel.
+
+    Environments live as long as their session in the server's `SessionStore`:
+    when the store evicts a session (LRU or TTL), its environment is dropped
+    too, and the session starts over if it comes back.
+    """
+
+    def __init__(self, num_products=num_product_items, file_path=None):
+        self.num_products = num_products
+        self.file_path = file_path
+        self._server = None
+        self._envs = dict()
+        self._session_locks = dict()
+        # Reentrant: creating an environment can evict another session, whose
+        # callback runs on the same thread
+        self._lock = threading.RLock()
+
+    @property
+    def server(self):
+        """The shared `SimServer`, loaded on first access"""
+        if self._server is None:
+            self.get_env(DEFAULT_SESSION_ID)
+        return self._server
+
+    def get_env(self, session_id=DEFAULT_SESSION_ID):
+        """Returns the environment of `session_id`, creating it on first use"""
+        env = self._envs.get(session_id)
+        if env is not None:
+            return env
+        with self._lock:
+            if session_id not in self._envs:
+                # `WebAgentTextEnv` resets itself into `session_id` when it is
+                # built; the gym wrappers would only insist on a second reset
+                env = init_env(
+                    self.num_products,
+                    file_path=self.file_path,
+                    server=self._server,
+                    session=session_id,
+                ).unwrapped
+                if self._server is None:
+                    self._server = env.server
+                    self._server.user_sessions.on_evict = self._on_session_evicted
+                    print(
+                        f"Finished initializing WebshopEnv with {self.num_products} items."
+                    )
+                self._envs[session_id] = env
+                self._session_locks[session_id] = threading.RLock()
+            return self._envs[session_id]
+
+    @contextmanager
+    def session(self, session_id=DEFAULT_SESSION_ID):
+        """Yield the environment of `session_id` with its session lock held"""
+        env = self.get_env(session_id)
+        with self._lock:
+            # The session may have been closed or evicted since `get_env`
+            lock = self._session_locks.setdefault(session_id, threading.RLock())
+        with lock:
+            yield env
+
+    def _on_session_evicted(self, session_id):
+        """Drop the environment of a session the server's store evicted"""
+        with self._lock:
+            self._envs.pop(session_id, None)
+            self._session_locks.pop(session_id, None)
+
+    def close_session(self, session_id):
+        """Forget the environment and server-side state of a session"""
+        with self._lock:
+            env = self._envs.pop(session_id, None)
+            lock = self._session_locks.pop(session_id, None)
+        if env is not None:
+            with lock:
+                env.server.end_session(env.session)
+
+    def __len__(self):
+        return len(self._envs)
+
+
+env_manager = WebshopEnvManager(num_product_items)
+
+
+def get_session_id(tool_context):
+    """Returns the ADK session id a tool call belongs to"""
+    return tool_context._invocation_context.session.id
+
+
+def prewarm(num_products=num_product_items):
+    """Boot the JVM, open the search index and run a first query ahead of time."""
+    from .web_agent_site.engine.search_pool import prewarm as prewarm_searcher
+
+    return prewarm_searcher(num_products=num_products)
+
+
+def _prewarm_in_background(num_products):
+    try:
+        prewarm(num_products)
+    except Exception as e:
+        print(f"Search engine prewarm failed: {e}")
+
+
+_prewarm_thread = None
+_prewarm_lock = threading.Lock()
+
+
+def start_prewarm(num_products=num_product_items):
+    """Run `prewarm` on a background thread, once per process
+
+    Called by the agent at server start-up so the first search doesn't pay for
+    the JVM; importing this module never opens an index. Set WEBSHOP_PREWARM=0
+    to skip it. Returns the prewarm thread, or None when skipped.
+    """
+    global _prewarm_thread
+    if os.environ.get("WEBSHOP_PREWARM", "1").lower() in ("0", "false"):
+        return None
+    with _prewarm_lock:
+        if _prewarm_thread is None:
+            # The imports happen on the worker thread too
+            _prewarm_thread = threading.Thread(
+                target=_prewarm_in_background,
+                args=(num_products,),
+                name="searcher-prewarm",
+                daemon=True,
+            )
+            _prewarm_thread.start()
+    return _prewarm_thread
+
+
+def get_webshop_env(session_id=DEFAULT_SESSION_ID):
+    """Lazy-load the webshop environment of a session on first access."""
+    return env_manager.get_env(session_id)
 
 
-def get_webshop_env():
-    """Lazy-load the webshop environment on first access."""
-    global _webshop_env
-    if _webshop_env is None:
-        _webshop_env = init_env(num_product_items)
-        _webshop_env.reset()
-        print(f"Finished initializing WebshopEnv with {num_product_items} items.")
-    return _webshop_env
+def webshop_session(tool_context):
+    """Context manager yielding the calling ADK session's environment, locked"""
+    return env_manager.session(get_session_id(tool_context))
@@ -0,0 +1,137 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the BM25 backend with Lucene: result overlap, startup and latency.
+
+Usage: python benchmark_bm25.py --size all [--num-products 1000]
+
+Queries are the search queries of the collection's products plus the first
+words of sampled titles, or the lines of `--queries`. For each query, the
+top-k ASINs of `bm25_<size>.npz` are compared with those of `indexes_<size>`:
+recall is the share of Lucene's hits that BM25 also returns, and a query is
+"identical" when both return the same ASINs in the same order.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, "../")
+
+RECALL_CUTOFFS = (1, 10, 50)
+
+
+def load_queries(collection_dir, num_queries, seed=0):
+    """Product search queries and title prefixes of a collection, in a fixed order"""
+    queries, titles = set(), []
+    for name in sorted(os.listdir(collection_dir)):
+        if not name.endswith((".jsonl", ".json")):
+            continue
+        with open(os.path.join(collection_dir, name)) as f:
+            for line in f:
+                if line.strip():
+                    product = json.loads(line)["product"]
+                    if product.get("query"):
+                        queries.add(product["query"])
+                    titles.append(product.get("Title") or "")
+    rng = random.Random(seed)
+    queries = sorted(queries)
+    for title in rng.sample(titles, min(len(titles), num_queries)):
+        words = title.split()
+        queries.append(" ".join(words[: rng.randint(1, 6)]))
+    rng.shuffle(queries)
+    return [q for q in queries if q.strip()][:num_queries]
+
+
+def timed_search(search_engine, queries, k):
+    hits, latencies = [], []
+    for q in queries:
+        start = time.perf_counter()
+        hits.append(search_engine.search(q, k=k))
+        latencies.append(time.perf_counter() - start)
+    return hits, np.array(latencies) * 1000
+
+
+def latency_summary(latencies):
+    return (
+        f"mean {latencies.mean():.2f} ms, p50 {np.percentile(latencies, 50):.2f} ms, "
+        f"p95 {np.percentile(latencies, 95):.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="all", help="collection size, e.g. 1k")
+    parser.add_argument("--num-products", type=int, default=None)
+    parser.add_argument("--queries", default=None, help="file with one query per line")
+    parser.add_argument("--num-queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    from web_agent_site.engine import search_pool
+    from web_agent_site.engine.engine import hits_to_asins
+
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+        queries = queries[: args.num_queries]
+    else:
+        queries = load_queries(f"resources_{args.size}", args.num_queries)
+    print(f"{len(queries)} queries, top {args.k}")
+
+    start = time.perf_counter()
+    bm25 = search_pool.get_searcher(f"bm25_{args.size}.npz")
+    bm25_startup = time.perf_counter() - start
+    start = time.perf_counter()
+    lucene = search_pool.get_searcher(f"indexes_{args.size}")
+    lucene_startup = time.perf_counter() - start
+    if args.num_products is not None and args.num_products < bm25.num_docs:
+        bm25 = bm25.restrict(args.num_products)
+        lucene = search_pool.RankFilteredSearcher(lucene, args.num_products)
+    print(f"Startup: BM25 {bm25_startup * 1000:.1f} ms, Lucene {lucene_startup:.2f} s")
+
+    # The first Lucene query loads the index readers; keep it out of the latencies
+    lucene.search(search_pool.WARMUP_QUERY, k=1)
+    bm25_hits, bm25_latencies = timed_search(bm25, queries, args.k)
+    lucene_hits, lucene_latencies = timed_search(lucene, queries, args.k)
+    docid_table = search_pool.get_docid_table(lucene)
+    bm25_asins = [hits_to_asins(hits) for hits in bm25_hits]
+    lucene_asins = [hits_to_asins(hits, docid_table) for hits in lucene_hits]
+
+    recalls = {cutoff: [] for cutoff in RECALL_CUTOFFS if cutoff <= args.k}
+    identical = 0
+    for expected, got in zip(lucene_asins, bm25_asins):
+        identical += expected == got
+        for cutoff, values in recalls.items():
+            if expected[:cutoff]:
+                overlap = set(expected[:cutoff]) & set(got[:cutoff])
+                values.append(len(overlap) / len(expected[:cutoff]))
+    for cutoff, values in recalls.items():
+        print(f"Recall@{cutoff} of Lucene's hits: {np.mean(values):.4f}")
+    print(f"Identical rankings: {identical}/{len(queries)}")
+
+    print(f"BM25 search: {latency_summary(bm25_latencies)}")
+    print(f"Lucene search: {latency_summary(lucene_latencies)}")
+    qids = [str(i) for i in range(len(queries))]
+    for name, search_engine in (("BM25", bm25), ("Lucene", lucene)):
+        start = time.perf_counter()
+        search_engine.batch_search(queries, qids, k=args.k, threads=args.threads)
+        elapsed = time.perf_counter() - start
+        print(f"{name} batch_search: {len(queries) / elapsed:.0f} queries/s")
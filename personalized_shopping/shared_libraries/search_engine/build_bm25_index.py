@@ -0,0 +1,56 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Build the JVM-free BM25 index of a collection.
+
+Usage: python build_bm25_index.py resources_all [resources_1k ...]
+
+Every `resources_<size>` collection is written to `bm25_<size>.npz`, which the
+search engine memory-maps when `WEBSHOP_SEARCH_BACKEND` is "bm25" (or "auto";
+the default is "lucene"). Building needs NumPy and SciPy, but no Java.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, "../")
+
+COLLECTION_PREFIX = "resources_"
+INDEX_PREFIX = "bm25_"
+INDEX_SUFFIX = ".npz"
+
+
+def get_output_path(collection_dir):
+    """`resources_<size>` -> `bm25_<size>.npz`, next to the collection"""
+    collection_dir = os.path.normpath(collection_dir)
+    name = os.path.basename(collection_dir)
+    if name.startswith(COLLECTION_PREFIX):
+        name = name[len(COLLECTION_PREFIX) :]
+    return os.path.join(
+        os.path.dirname(collection_dir), INDEX_PREFIX + name + INDEX_SUFFIX
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("collection_dirs", nargs="+")
+    parser.add_argument("--workers", type=int, default=None, help="analyzer processes")
+    args = parser.parse_args()
+
+    from web_agent_site.engine.bm25 import build_index
+
+    for collection_dir in args.collection_dirs:
+        output_path = get_output_path(collection_dir)
+        build_index(collection_dir, output_path, workers=args.workers)
@@ -0,0 +1,101 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Write the internal Lucene docid -> ASIN table next to a built index.
+
+Usage: python build_docid_table.py indexes_1k [indexes_100 ...]
+       python build_docid_table.py indexes_all --collection resources_all
+
+The table is a fixed-width NumPy byte array saved as `docid_to_asin.npy`
+inside the index directory. The search engine memory-maps it and maps every
+hit to its product with an array lookup, so it never has to fetch stored
+documents (and the index can be built without `--storeRaw`).
+
+With `--collection`, the shuffle rank of every document (its position in the
+catalog, i.e. in the collection's shards read in name order) is also saved as
+`docid_to_rank.npy`. A `num_products=N` search on that index only keeps the
+documents ranked below N, so a single full-catalog index serves any size.
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+from pyserini.index.lucene import LuceneIndexReader
+from tqdm import tqdm
+
+DOCID_TABLE_NAME = "docid_to_asin.npy"
+RANK_TABLE_NAME = "docid_to_rank.npy"
+ID_PREFIX = '{"id": '  # how convert_product_file_format.py starts every doc
+
+
+def read_collection_asins(collection_dir):
+    """Yield the ASINs of a JSONL collection in catalog order"""
+    decoder = json.JSONDecoder()
+    for name in sorted(os.listdir(collection_dir)):
+        if not name.endswith((".jsonl", ".json")):
+            continue
+        with open(os.path.join(collection_dir, name)) as f:
+            for line in f:
+                if line.startswith(ID_PREFIX):
+                    # Decode only the id, not the whole product
+                    yield decoder.raw_decode(line, len(ID_PREFIX))[0]
+                elif line.strip():
+                    yield json.loads(line)["id"]
+
+
+def build_rank_table(index_dir, asins, collection_dir):
+    """Save the catalog rank of every docid; `asins` are the docids' ASINs"""
+    asin_to_rank = {
+        asin: rank for rank, asin in enumerate(read_collection_asins(collection_dir))
+    }
+    missing = [asin for asin in asins if asin not in asin_to_rank]
+    if missing:
+        raise ValueError(
+            f"{len(missing)} documents of {index_dir} are not in {collection_dir}"
+        )
+    table = np.array([asin_to_rank[asin] for asin in asins], dtype=np.int32)
+    table_path = os.path.join(index_dir, RANK_TABLE_NAME)
+    np.save(table_path, table)
+    print(f"Wrote {table_path} with {len(table)} ranks")
+    return table_path
+
+
+def build_docid_table(index_dir, collection_dir=None):
+    reader = LuceneIndexReader(index_dir)
+    num_docs = reader.stats()["documents"]
+    asins = [
+        reader.convert_internal_docid_to_collection_docid(docid)
+        for docid in tqdm(range(num_docs), total=num_docs)
+    ]
+    width = max((len(asin) for asin in asins), default=1)
+    table = np.array(asins, dtype=f"S{width}")
+    table_path = os.path.join(index_dir, DOCID_TABLE_NAME)
+    np.save(table_path, table)
+    print(f"Wrote {table_path} with {num_docs} docids")
+    if collection_dir is not None:
+        build_rank_table(index_dir, asins, collection_dir)
+    return table_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("index_dirs", nargs="+")
+    parser.add_argument(
+        "--collection", default=None, help="collection the index was built from"
+    )
+    args = parser.parse_args()
+    for index_dir in args.index_dirs:
+        build_docid_table(index_dir, args.collection)
@@ -12,13 +12,36 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+"""Convert the product catalog into the JSONL collections indexed by Lucene.
+
+Products are streamed from the catalog and cut into shards that never
+straddle a collection size, so the nested collections `resources_100`,
+`resources_1k`, `resources_10k` and `resources_50k` are prefixes of the same
+shards as `resources_all`, the whole catalog. Shards are written once into
+`shards/`, and each collection directory holds links to its shards; with
+several input files, `pyserini.index.lucene --threads N` indexes them in
+parallel.
+
+The parent streams the raw records and deduplicates them by ASIN, which fixes
+where shards are cut; a process pool normalizes each shard's records, builds
+their docs, hashes and writes them. Every shard's SHA-256 is kept in
+`shards/manifest.json`, so the disk write of a shard whose content did not
+change is skipped on rebuild (it is still normalized and hashed). Each
+collection also gets a
+`resources_<size>.sha256` stamp over its shard hashes, which `run_indexing.sh`
+compares with the stamp of the built index to skip unchanged indexes.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 import json
 import os
 import sys
 import platform
+import shutil
 import subprocess
 from pathlib import Path
-from tqdm import tqdm
 
 # Auto-detect and set JAVA_HOME if not already set
 if not os.environ.get('JAVA_HOME'):
@@ -50,34 +73,36 @@ if not os.environ.get('JAVA_HOME'):
 
 sys.path.insert(0, "../")
 
-from web_agent_site.engine.engine import load_products
+# Collection sizes; every collection is a prefix of the next one
+SIZES = {"100": 100, "1k": 1000, "10k": 10000, "50k": 50000}
+FULL_SIZE_NAME = "all"  # collection of the whole catalog
+SHARD_SIZE = 5000  # products per shard, shards are also cut at every size
+SHARD_DIR = "shards"
+MANIFEST_NAME = "manifest.json"
+STAMP_SUFFIX = ".sha256"
 
-# Auto-detect the available items_shuffle file
-data_dir = Path(__file__).parent.parent / "data"
-possible_files = [
-    data_dir / "items_shuffle_1000.json",  # Try 1k first (recommended)
-    data_dir / "items_shuffle.json",        # Full dataset
-    data_dir / "items_shuffle_10000.json",  # 10k dataset
-]
+_attributes = None  # `normalize_product` attributes of a worker process
 
-items_file = None
-for file_path in possible_files:
-    if file_path.exists():
-        items_file = file_path
-        print(f"Using data file: {file_path.name}")
-        break
 
-if items_file is None:
+def find_items_file():
+    """Auto-detect the available items_shuffle file"""
+    data_dir = Path(__file__).parent.parent / "data"
+    possible_files = [
+        data_dir / "items_shuffle_1000.json",  # Try 1k first (recommended)
+        data_dir / "items_shuffle.json",        # Full dataset
+        data_dir / "items_shuffle_10000.json",  # 10k dataset
+    ]
+    for file_path in possible_files:
+        if file_path.exists():
+            print(f"Using data file: {file_path.name}")
+            return file_path
     raise FileNotFoundError(
         f"Could not find any items_shuffle*.json file in {data_dir}\n"
         f"Please download the data file. See README.md for instructions."
     )
 
-# Load products without human_goals to avoid requiring items_human_ins.json
-all_products, *_ = load_products(filepath=str(items_file), human_goals=False)
 
-docs = []
-for p in tqdm(all_products, total=len(all_products)):
+def product_to_doc(p):
     option_texts = []
     options = p.get("options", {})
     for option_name, option_contents in options.items():
@@ -96,40 +121,171 @@ for p in tqdm(all_products, total=len(all_products)):
         ]
     ).lower()
     doc["product"] = p
-    docs.append(doc)
-
-# Write documents to different sized resource files
-# Only create directories and files for sizes we actually have data for
-total_docs = len(docs)
-
-# Always create 100 and 1k if we have enough data
-if total_docs >= 100:
-    os.makedirs("./resources_100", exist_ok=True)
-    with open("./resources_100/documents.jsonl", "w+") as f:
-        for doc in docs[:100]:
-            f.write(json.dumps(doc) + "\n")
-    print(f"Created resources_100/documents.jsonl with 100 products")
-
-if total_docs >= 1000:
-    os.makedirs("./resources_1k", exist_ok=True)
-    with open("./resources_1k/documents.jsonl", "w+") as f:
-        for doc in docs[:1000]:
-            f.write(json.dumps(doc) + "\n")
-    print(f"Created resources_1k/documents.jsonl with 1000 products")
-
-# Only create 10k and 50k if we have that much data
-if total_docs >= 10000:
-    os.makedirs("./resources_10k", exist_ok=True)
-    with open("./resources_10k/documents.jsonl", "w+") as f:
-        for doc in docs[:10000]:
-            f.write(json.dumps(doc) + "\n")
-    print(f"Created resources_10k/documents.jsonl with 10000 products")
-
-if total_docs >= 50000:
-    os.makedirs("./resources_50k", exist_ok=True)
-    with open("./resources_50k/documents.jsonl", "w+") as f:
-        for doc in docs[:50000]:
-            f.write(json.dumps(doc) + "\n")
-    print(f"Created resources_50k/documents.jsonl with 50000 products")
-
-print(f"\nTotal: Created resources for {total_docs} products")
+    return doc
+
+
+def shard_bounds(shard_size=SHARD_SIZE):
+    """Yield `(start, end)` product ranges of the shards, cut at every size"""
+    start = 0
+    while True:
+        end = min(
+            [start - start % shard_size + shard_size]
+            + [size for size in SIZES.values() if size > start]
+        )
+        yield start, end
+        start = end
+
+
+def shard_name(index):
+    return f"shard_{index:05d}.jsonl"
+
+
+def write_shard(path, products, previous_sha256=None):
+    """Build the docs of a shard and write them unless the content is unchanged
+
+    Returns `(sha256, written)`.
+    """
+    data = "".join(json.dumps(product_to_doc(p)) + "\n" for p in products).encode()
+    sha256 = hashlib.sha256(data).hexdigest()
+    if sha256 == previous_sha256 and os.path.exists(path):
+        return sha256, False
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return sha256, True
+
+
+def _init_worker(attributes):
+    global _attributes
+    _attributes = attributes
+
+
+def build_shard(path, raw_products, previous_sha256=None):
+    """Normalize the raw records of a shard, then `write_shard` them"""
+    from web_agent_site.engine.engine import normalize_product
+
+    products = [normalize_product(p, _attributes, {}, False) for p in raw_products]
+    return write_shard(path, products, previous_sha256)
+
+
+def iter_shards(products, shard_size=SHARD_SIZE):
+    """Group the product stream into `(start, products)` shards"""
+    bounds = shard_bounds(shard_size)
+    start, end = next(bounds)
+    batch = []
+    for p in products:
+        batch.append(p)
+        if start + len(batch) == end:
+            yield start, batch
+            batch = []
+            start, end = next(bounds)
+    if batch:
+        yield start, batch
+
+
+def load_manifest(shard_dir):
+    try:
+        with open(os.path.join(shard_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"shards": []}
+
+
+def build_shards(items_file, shard_dir=SHARD_DIR, workers=None, shard_size=SHARD_SIZE):
+    """Stream the catalog into hashed shards; returns the new manifest"""
+    # Imported on use from the `../` put on sys.path above
+    from web_agent_site.engine.engine import iter_raw_products, load_product_attributes
+
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(shard_dir, exist_ok=True)
+    previous = {
+        shard["name"]: shard["sha256"] for shard in load_manifest(shard_dir)["shards"]
+    }
+    # Normalize without human_goals to avoid requiring items_human_ins.json
+    attributes, _ = load_product_attributes(human_goals=False)
+    products = iter_raw_products(str(items_file))
+
+    shards = []
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(attributes,)
+    ) as executor:
+        pending = []
+        max_pending = 2 * workers  # bounds the records held in memory
+        for index, (start, batch) in enumerate(iter_shards(products, shard_size)):
+            name = shard_name(index)
+            path = os.path.join(shard_dir, name)
+            future = executor.submit(build_shard, path, batch, previous.get(name))
+            shard = {"name": name, "start": start, "end": start + len(batch)}
+            shards.append(shard)
+            pending.append((shard, future))
+            while len(pending) >= max_pending:
+                _finish_shard(*pending.pop(0))
+        for shard, future in pending:
+            _finish_shard(shard, future)
+
+    names = {shard["name"] for shard in shards}
+    for name in os.listdir(shard_dir):
+        if name.endswith(".jsonl") and name not in names:
+            os.remove(os.path.join(shard_dir, name))
+
+    manifest = {"shards": shards}
+    with open(os.path.join(shard_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _finish_shard(shard, future):
+    shard["sha256"], written = future.result()
+    status = "written" if written else "unchanged"
+    print(f"{shard['name']}: products {shard['start']}-{shard['end']} {status}")
+
+
+def _link(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def link_collections(manifest, shard_dir=SHARD_DIR):
+    """Fill `resources_<size>/` with the shards of every complete size"""
+    total_docs = manifest["shards"][-1]["end"] if manifest["shards"] else 0
+    sizes = list(SIZES.items()) + [(FULL_SIZE_NAME, total_docs)]
+    for size_name, size in sizes:
+        if not total_docs or total_docs < size:
+            continue
+        resource_dir = f"resources_{size_name}"
+        os.makedirs(resource_dir, exist_ok=True)
+        for name in os.listdir(resource_dir):
+            if name.endswith((".jsonl", ".json")):
+                os.remove(os.path.join(resource_dir, name))
+        shards = [shard for shard in manifest["shards"] if shard["end"] <= size]
+        for shard in shards:
+            _link(
+                os.path.join(shard_dir, shard["name"]),
+                os.path.join(resource_dir, shard["name"]),
+            )
+        stamp = hashlib.sha256(
+            "".join(f"{shard['sha256']}\n" for shard in shards).encode()
+        ).hexdigest()
+        with open(resource_dir + STAMP_SUFFIX, "w") as f:
+            f.write(stamp + "\n")
+        print(f"Created {resource_dir}/ with {size} products in {len(shards)} shards")
+    print(f"\nTotal: Created resources for {total_docs} products")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items-file", type=Path, default=None)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="shard builder processes"
+    )
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    args = parser.parse_args()
+
+    items_file = args.items_file or find_items_file()
+    manifest = build_shards(
+        items_file, workers=args.workers, shard_size=args.shard_size
+    )
+    link_collections(manifest)
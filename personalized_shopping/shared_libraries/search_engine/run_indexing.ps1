@@ -12,40 +12,104 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-Write-Host "Indexing 100 products..." -ForegroundColor Green
-python -m pyserini.index.lucene `
-  --collection JsonCollection `
-  --input resources_100 `
-  --index indexes_100 `
-  --generator DefaultLuceneDocumentGenerator `
-  --threads 1 `
-  --storePositions --storeDocvectors --storeRaw
-
-Write-Host "Indexing 1k products..." -ForegroundColor Green
-python -m pyserini.index.lucene `
-  --collection JsonCollection `
-  --input resources_1k `
-  --index indexes_1k `
-  --generator DefaultLuceneDocumentGenerator `
-  --threads 1 `
-  --storePositions --storeDocvectors --storeRaw
-
-Write-Host "Indexing 10k products..." -ForegroundColor Green
-python -m pyserini.index.lucene `
-  --collection JsonCollection `
-  --input resources_10k `
-  --index indexes_10k `
-  --generator DefaultLuceneDocumentGenerator `
-  --threads 1 `
-  --storePositions --storeDocvectors --storeRaw
-
-Write-Host "Indexing 50k products..." -ForegroundColor Green
-python -m pyserini.index.lucene `
-  --collection JsonCollection `
-  --input resources_50k `
-  --index indexes_50k `
-  --generator DefaultLuceneDocumentGenerator `
-  --threads 1 `
-  --storePositions --storeDocvectors --storeRaw
+# Raw documents are no longer needed at search time (hits are mapped to ASINs
+# through docid_to_asin.npy), so they are only stored when STORE_RAW=1.
+$storeRawFlag = @()
+if ($env:STORE_RAW -eq "1") {
+  $storeRawFlag = @("--storeRaw")
+}
+
+# Collections to index. The full catalog index serves every catalog size
+# through its rank table; the exact-size indexes ($env:SIZES = "100 1k 10k 50k")
+# are only needed where there is no indexes_all.
+$sizes = if ($env:SIZES) { $env:SIZES -split "\s+" } else { @("all") }
+
+# Indexing threads per size; Lucene indexes the shards of a size in parallel
+$threads = if ($env:THREADS) { $env:THREADS } else { [Environment]::ProcessorCount }
+
+# Search backends to build: the Lucene index indexes_<size>\ and/or the
+# JVM-free BM25 index bm25_<size>.npz ($env:BACKENDS = "lucene bm25" builds both)
+$backends = if ($env:BACKENDS) { $env:BACKENDS -split "\s+" } else { @("lucene") }
+
+# An index is rebuilt only when the shard hashes of its collection changed
+# (resources_<size>.sha256 is written by convert_product_file_format.py).
+$indexSize = {
+  param($dir, $size, $threads, $storeRawFlag)
+  Set-Location $dir
+  Remove-Item "indexes_$size\resources.sha256" -ErrorAction SilentlyContinue
+  python -m pyserini.index.lucene `
+    --collection JsonCollection `
+    --input "resources_$size" `
+    --index "indexes_$size" `
+    --generator DefaultLuceneDocumentGenerator `
+    --threads $threads `
+    --storePositions --storeDocvectors @storeRawFlag
+  if ($LASTEXITCODE -ne 0) { throw "Indexing $size products failed" }
+
+  python build_docid_table.py "indexes_$size" --collection "resources_$size"
+  if ($LASTEXITCODE -ne 0) { throw "Docid table of $size products failed" }
+
+  if (Test-Path "resources_$size.sha256") {
+    Copy-Item "resources_$size.sha256" "indexes_$size\resources.sha256"
+  }
+}
+
+$bm25IndexSize = {
+  param($dir, $size, $threads)
+  Set-Location $dir
+  Remove-Item "bm25_$size.sha256" -ErrorAction SilentlyContinue
+  python build_bm25_index.py "resources_$size" --workers $threads
+  if ($LASTEXITCODE -ne 0) { throw "BM25 index of $size products failed" }
+
+  if (Test-Path "resources_$size.sha256") {
+    Copy-Item "resources_$size.sha256" "bm25_$size.sha256"
+  }
+}
+
+# The sizes are independent indexes, so they are built concurrently
+$jobs = @()
+foreach ($size in $sizes) {
+  if (-not (Test-Path "resources_$size")) {
+    continue
+  }
+  foreach ($backend in $backends) {
+    if ($backend -eq "bm25") {
+      $index = "bm25_$size.npz"
+      $indexStamp = "bm25_$size.sha256"
+    } else {
+      $index = "indexes_$size"
+      $indexStamp = "indexes_$size\resources.sha256"
+    }
+    $stamp = "resources_$size.sha256"
+    if ((Test-Path $stamp) -and (Test-Path $index) -and (Test-Path $indexStamp) -and
+        ((Get-Content $stamp -Raw) -eq (Get-Content $indexStamp -Raw))) {
+      Write-Host "$index is up to date" -ForegroundColor Green
+      continue
+    }
+
+    Write-Host "Building $index of $size products..." -ForegroundColor Green
+    if ($backend -eq "bm25") {
+      $jobs += Start-Job -ScriptBlock $bm25IndexSize `
+        -ArgumentList $PWD.Path, $size, $threads
+    } else {
+      $jobs += Start-Job -ScriptBlock $indexSize `
+        -ArgumentList $PWD.Path, $size, $threads, $storeRawFlag
+    }
+  }
+}
+
+$failed = $false
+foreach ($job in $jobs) {
+  Receive-Job -Job $job -Wait -ErrorAction Continue
+  if ($job.State -eq "Failed") {
+    $failed = $true
+  }
+}
+$jobs | Remove-Job
+
+if ($failed) {
+  Write-Host "Indexing failed!" -ForegroundColor Red
+  exit 1
+}
 
 Write-Host "Indexing complete!" -ForegroundColor Green
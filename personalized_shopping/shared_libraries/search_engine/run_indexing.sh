@@ -14,34 +14,81 @@
 # limitations under the License.
 
 
-python -m pyserini.index.lucene \
-  --collection JsonCollection \
-  --input resources_100 \
-  --index indexes_100 \
-  --generator DefaultLuceneDocumentGenerator \
-  --threads 1 \
-  --storePositions --storeDocvectors --storeRaw
-
-python -m pyserini.index.lucene \
-  --collection JsonCollection \
-  --input resources_1k \
-  --index indexes_1k \
-  --generator DefaultLuceneDocumentGenerator \
-  --threads 1 \
-  --storePositions --storeDocvectors --storeRaw
-
-python -m pyserini.index.lucene \
-  --collection JsonCollection \
-  --input resources_10k \
-  --index indexes_10k \
-  --generator DefaultLuceneDocumentGenerator \
-  --threads 1 \
-  --storePositions --storeDocvectors --storeRaw
-
-python -m pyserini.index.lucene \
-  --collection JsonCollection \
-  --input resources_50k \
-  --index indexes_50k \
-  --generator DefaultLuceneDocumentGenerator \
-  --threads 1 \
-  --storePositions --storeDocvectors --storeRaw
+# Raw documents are no longer needed at search time (hits are mapped to ASINs
+# through docid_to_asin.npy), so they are only stored when STORE_RAW=1.
+STORE_RAW_FLAG=""
+if [ "${STORE_RAW:-0}" = "1" ]; then
+  STORE_RAW_FLAG="--storeRaw"
+fi
+
+# Collections to index. The full catalog index serves every catalog size
+# through its rank table; the exact-size indexes (SIZES="100 1k 10k 50k") are
+# only needed where there is no indexes_all.
+SIZES="${SIZES:-all}"
+
+# Indexing threads per size; Lucene indexes the shards of a size in parallel
+THREADS="${THREADS:-$(nproc 2>/dev/null || echo 4)}"
+
+# Search backends to build: the Lucene index indexes_<size>/ and/or the
+# JVM-free BM25 index bm25_<size>.npz (BACKENDS="lucene bm25" builds both)
+BACKENDS="${BACKENDS:-lucene}"
+
+# An index is rebuilt only when the shard hashes of its collection changed
+# (resources_<size>.sha256 is written by convert_product_file_format.py).
+index_size() {
+  local size="$1"
+  rm -f "indexes_${size}/resources.sha256"
+  python -m pyserini.index.lucene \
+    --collection JsonCollection \
+    --input "resources_${size}" \
+    --index "indexes_${size}" \
+    --generator DefaultLuceneDocumentGenerator \
+    --threads "${THREADS}" \
+    --storePositions --storeDocvectors ${STORE_RAW_FLAG} || return 1
+  python build_docid_table.py "indexes_${size}" \
+    --collection "resources_${size}" || return 1
+  if [ -f "resources_${size}.sha256" ]; then
+    cp "resources_${size}.sha256" "indexes_${size}/resources.sha256"
+  fi
+}
+
+bm25_index_size() {
+  local size="$1"
+  rm -f "bm25_${size}.sha256"
+  python build_bm25_index.py "resources_${size}" --workers "${THREADS}" || return 1
+  if [ -f "resources_${size}.sha256" ]; then
+    cp "resources_${size}.sha256" "bm25_${size}.sha256"
+  fi
+}
+
+# The sizes are independent indexes, so they are built concurrently
+pids=()
+for size in ${SIZES}; do
+  if [ ! -d "resources_${size}" ]; then
+    continue
+  fi
+  for backend in ${BACKENDS}; do
+    if [ "${backend}" = "bm25" ]; then
+      index="bm25_${size}.npz"
+      stamp="bm25_${size}.sha256"
+      build=bm25_index_size
+    else
+      index="indexes_${size}"
+      stamp="indexes_${size}/resources.sha256"
+      build=index_size
+    fi
+    if [ -f "resources_${size}.sha256" ] && [ -e "${index}" ] &&
+      cmp -s "resources_${size}.sha256" "${stamp}"; then
+      echo "${index} is up to date"
+      continue
+    fi
+    "${build}" "${size}" &
+    pids+=("$!")
+  done
+done
+
+status=0
+for pid in "${pids[@]}"; do
+  wait "${pid}" || status=1
+done
+exit "${status}"
@@ -0,0 +1,716 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-process BM25 search backend, without a JVM.
+
+Reproduces what Pyserini's `LuceneSearcher` does on the indexes built by
+`search_engine/run_indexing.sh`:
+
+- Text is analyzed like Anserini's default English analyzer: Unicode word
+  segmentation (`StandardTokenizer`), possessive removal, lowercasing, Lucene's
+  English stopwords and the Porter stemmer.
+- Queries are bags of words, where a repeated term is boosted by its count.
+- Scoring is Lucene's BM25 (k1=0.9, b=0.4) in the same float32 arithmetic,
+  including the one-byte quantized document lengths.
+- Ties are broken by ASIN, and the returned scores are rounded the way
+  Anserini's `ScoreTiesAdjusterReranker` does.
+
+`build_index` turns a JSONL collection (`resources_<size>/`) into a term x
+document CSR matrix, written as one uncompressed `.npz` (`bm25_<size>.npz`).
+Its arrays are memory-mapped by `BM25Searcher`, so opening an index takes
+milliseconds and its pages are shared by every process. Queries are scored in
+batches with vectorized NumPy: the postings of all query terms are gathered at
+once and summed per document.
+
+Documents keep their collection order, so a document's id is its rank in the
+catalog, and `restrict(num_products)` serves the first products of a
+full-catalog index by cutting every posting list at `num_products`.
+"""
+
+import bisect
+from collections import Counter, namedtuple
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+import copy
+from functools import lru_cache
+import itertools
+import json
+import os
+import re
+import struct
+import unicodedata
+import zipfile
+
+import numpy as np
+from rich import print
+
+K1 = 0.9  # Anserini's BM25 defaults
+B = 0.4
+# Queries matching more than 1/DENSE_SCORING_RATIO of the documents are summed
+# into a dense score array instead of sorting their postings
+DENSE_SCORING_RATIO = 16
+
+# Lucene's EnglishAnalyzer.ENGLISH_STOP_WORDS_SET
+STOPWORDS = frozenset(
+    "a an and are as at be but by for if in into is it no not of on or such "
+    "that the their then there these they this to was will with".split()
+)
+MAX_TOKEN_LENGTH = 255  # StandardTokenizer splits longer tokens
+
+# Unicode word segmentation (UAX #29) as applied by Lucene's StandardTokenizer:
+# letters and digits join into words, ideographs and hiragana are single-char
+# tokens, katakana runs and emoji sequences are tokens of their own, and the
+# "mid" punctuation joins two letters or two digits
+_IDEOGRAPHIC = (
+    "\u3040-\u309f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\U00020000-\U0002fa1f"
+)
+_KATAKANA = "\u30a1-\u30fa\u30fc-\u30ff\u31f0-\u31ff\uff66-\uff9f"
+_NUMBER_OTHER = (
+    "\u00b2\u00b3\u00b9\u00bc-\u00be\u2070-\u2079\u2080-\u2089\u2150-\u215f"
+    "\u2189\u2460-\u249b\u24ea-\u24ff\u2776-\u2793\u3220-\u3229"
+)
+_LETTER = rf"(?:[^\W\d_{_IDEOGRAPHIC}{_KATAKANA}{_NUMBER_OTHER}]|[\u24b6-\u24e9])"
+_DIGIT = r"\d"
+_EXTEND_NUM_LET = "_\u203f\u2040\u2054\ufe33\ufe34\ufe4d-\ufe4f\uff3f"
+_MID_LETTER = ":\u00b7\u0387\u05f4\u2027\ufe13\ufe55\uff1a"
+_MID_NUM_LET = ".\u2018\u2019\u2024\ufe52\uff07\uff0e'"
+_MID_NUM = (
+    ",;\u037e\u0589\u060c\u060d\u066c\u07f8\u2044\ufe10\ufe14\ufe50\ufe54\uff0c\uff1b"
+)
+# Extended_Pictographic, without the skin tone modifiers and regional indicators
+_PICTOGRAPHIC = (
+    "\u00a9\u00ae\u203c\u2049\u2122\u2139\u2194-\u2199\u21a9\u21aa\u231a\u231b"
+    "\u2328\u2388\u23cf\u23e9-\u23f3\u23f8-\u23fa\u24c2\u25aa\u25ab\u25b6\u25c0"
+    "\u25fb-\u25fe\u2600-\u2605\u2607-\u2612\u2614-\u2685\u2690-\u2705"
+    "\u2708-\u2712\u2714\u2716\u271d\u2721\u2728\u2733\u2734\u2744\u2747\u274c"
+    "\u274e\u2753-\u2755\u2757\u2763-\u2767\u2795-\u2797\u27a1\u27b0\u27bf"
+    "\u2934\u2935\u2b05-\u2b07\u2b1b\u2b1c\u2b50\u2b55\u3030\u303d\u3297\u3299"
+    "\U0001f000-\U0001f0ff\U0001f10d-\U0001f10f\U0001f12f\U0001f16c-\U0001f171"
+    "\U0001f17e\U0001f17f\U0001f18e\U0001f191-\U0001f19a\U0001f1ad-\U0001f1e5"
+    "\U0001f201-\U0001f20f\U0001f21a\U0001f22f\U0001f232-\U0001f23a"
+    "\U0001f23c-\U0001f23f\U0001f249-\U0001f3fa\U0001f400-\U0001f53d"
+    "\U0001f546-\U0001f64f\U0001f680-\U0001f6ff\U0001f774-\U0001f77f"
+    "\U0001f7d5-\U0001f7ff\U0001f80c-\U0001f80f\U0001f848-\U0001f84f"
+    "\U0001f85a-\U0001f85f\U0001f888-\U0001f88f\U0001f8ae-\U0001f8ff"
+    "\U0001f90c-\U0001f93a\U0001f93c-\U0001f945\U0001f947-\U0001faff"
+    "\U0001fc00-\U0001fffd"
+)
+_EMOJI = (
+    rf"(?:[{_PICTOGRAPHIC}][\ufe0f\U0001f3fb-\U0001f3ff]?|[\U0001f3fb-\U0001f3ff])"
+    r"[\U000e0020-\U000e007f]*"  # tag sequences of subdivision flags
+)
+_POSSESSIVE_RE = re.compile("['\u2019\uff07][sS]$")
+# Java lowercases code point by code point, without special casing
+_LOWER_SPECIAL = str.maketrans({"\u0130": "i", "\u03a3": "\u03c3"})
+
+Hit = namedtuple("Hit", ["docid", "lucene_docid", "score"])
+
+
+def _extend_chars():
+    """Character class of the combining marks (categories Mn, Mc and Me)"""
+    ranges = []
+    for code in itertools.chain(range(0x300, 0x20000), range(0xE0100, 0xE01F0)):
+        if unicodedata.category(chr(code)) in ("Mn", "Mc", "Me"):
+            if ranges and ranges[-1][1] == code - 1:
+                ranges[-1][1] = code
+            else:
+                ranges.append([code, code])
+    return "".join(f"{chr(lo)}-{chr(hi)}" for lo, hi in ranges) + "\u200c\u200d"
+
+
+@lru_cache(maxsize=None)
+def _token_re():
+    """StandardTokenizer's tokens; compiled on first use, it takes a few dozen ms"""
+    word = rf"(?:{_LETTER}|{_DIGIT}|[{_EXTEND_NUM_LET}{_extend_chars()}])"
+    return re.compile(
+        r"[0-9#*]\ufe0f?\u20e3"
+        r"|[\U0001f1e6-\U0001f1ff]{2}"
+        rf"|{_EMOJI}(?:\u200d{_EMOJI})*"
+        rf"|[{_IDEOGRAPHIC}]"
+        rf"|[{_KATAKANA}]+"
+        rf"|[{_EXTEND_NUM_LET}]*(?:{_LETTER}|{_DIGIT}){word}*"
+        rf"(?:(?:(?<={_LETTER})[{_MID_LETTER}{_MID_NUM_LET}](?={_LETTER})"
+        rf"|(?<={_DIGIT})[{_MID_NUM}{_MID_NUM_LET}](?={_DIGIT})){word}+)*"
+    )
+
+
+class _PorterStemmer:
+    """Lucene's `PorterStemmer`, i.e. Martin Porter's reference implementation"""
+
+    def stem(self, word):
+        if len(word) <= 2:
+            return word
+        self.b = list(word)
+        self.k = len(word) - 1
+        self.j = 0
+        self._step1()
+        self._step2()
+        self._step3()
+        self._step4()
+        self._step5()
+        self._step6()
+        return "".join(self.b[: self.k + 1])
+
+    def _cons(self, i):
+        ch = self.b[i]
+        if ch in "aeiou":
+            return False
+        if ch == "y":
+            return i == 0 or not self._cons(i - 1)
+        return True
+
+    def _m(self):
+        n = 0
+        i = 0
+        while True:
+            if i > self.j:
+                return n
+            if not self._cons(i):
+                break
+            i += 1
+        i += 1
+        while True:
+            while True:
+                if i > self.j:
+                    return n
+                if self._cons(i):
+                    break
+                i += 1
+            i += 1
+            n += 1
+            while True:
+                if i > self.j:
+                    return n
+                if not self._cons(i):
+                    break
+                i += 1
+            i += 1
+
+    def _vowel_in_stem(self):
+        return any(not self._cons(i) for i in range(self.j + 1))
+
+    def _doublec(self, j):
+        return j >= 1 and self.b[j] == self.b[j - 1] and self._cons(j)
+
+    def _cvc(self, i):
+        if i < 2 or not self._cons(i) or self._cons(i - 1) or not self._cons(i - 2):
+            return False
+        return self.b[i] not in "wxy"
+
+    def _ends(self, s):
+        o = self.k - len(s) + 1
+        if o < 0 or "".join(self.b[o : self.k + 1]) != s:
+            return False
+        self.j = self.k - len(s)
+        return True
+
+    def _setto(self, s):
+        o = self.j + 1
+        self.b[o:] = list(s)
+        self.k = self.j + len(s)
+
+    def _r(self, s):
+        if self._m() > 0:
+            self._setto(s)
+
+    def _step1(self):
+        b = self.b
+        if b[self.k] == "s":
+            if self._ends("sses"):
+                self.k -= 2
+            elif self._ends("ies"):
+                self._setto("i")
+            elif b[self.k - 1] != "s":
+                self.k -= 1
+        del b[self.k + 1 :]
+        if self._ends("eed"):
+            if self._m() > 0:
+                self.k -= 1
+        elif (self._ends("ed") or self._ends("ing")) and self._vowel_in_stem():
+            self.k = self.j
+            if self._ends("at"):
+                self._setto("ate")
+            elif self._ends("bl"):
+                self._setto("ble")
+            elif self._ends("iz"):
+                self._setto("ize")
+            elif self._doublec(self.k):
+                ch = b[self.k]
+                self.k -= 1
+                if ch in "lsz":
+                    self.k += 1
+            elif self._m() == 1 and self._cvc(self.k):
+                self._setto("e")
+        del b[self.k + 1 :]
+
+    def _step2(self):
+        if self._ends("y") and self._vowel_in_stem():
+            self.b[self.k] = "i"
+
+    _STEP3 = {
+        "a": (("ational", "ate"), ("tional", "tion")),
+        "c": (("enci", "ence"), ("anci", "ance")),
+        "e": (("izer", "ize"),),
+        "l": (
+            ("bli", "ble"),
+            ("alli", "al"),
+            ("entli", "ent"),
+            ("eli", "e"),
+            ("ousli", "ous"),
+        ),
+        "o": (("ization", "ize"), ("ation", "ate"), ("ator", "ate")),
+        "s": (
+            ("alism", "al"),
+            ("iveness", "ive"),
+            ("fulness", "ful"),
+            ("ousness", "ous"),
+        ),
+        "t": (("aliti", "al"), ("iviti", "ive"), ("biliti", "ble")),
+        "g": (("logi", "log"),),
+    }
+    _STEP4 = {
+        "e": (("icate", "ic"), ("ative", ""), ("alize", "al")),
+        "i": (("iciti", "ic"),),
+        "l": (("ical", "ic"), ("ful", "")),
+        "s": (("ness", ""),),
+    }
+    _STEP5 = {
+        "a": ("al",),
+        "c": ("ance", "ence"),
+        "e": ("er",),
+        "i": ("ic",),
+        "l": ("able", "ible"),
+        "n": ("ant", "ement", "ment", "ent"),
+        "o": ("ion", "ou"),
+        "s": ("ism",),
+        "t": ("ate", "iti"),
+        "u": ("ous",),
+        "v": ("ive",),
+        "z": ("ize",),
+    }
+
+    def _replace_suffix(self, rules):
+        for suffix, replacement in rules:
+            if self._ends(suffix):
+                self._r(replacement)
+                return
+
+    def _step3(self):
+        if self.k == 0:
+            return
+        self._replace_suffix(self._STEP3.get(self.b[self.k - 1], ()))
+        del self.b[self.k + 1 :]
+
+    def _step4(self):
+        self._replace_suffix(self._STEP4.get(self.b[self.k], ()))
+        del self.b[self.k + 1 :]
+
+    def _step5(self):
+        if self.k == 0:
+            return
+        for suffix in self._STEP5.get(self.b[self.k - 1], ()):
+            if self._ends(suffix):
+                if suffix == "ion" and self.b[self.j] not in "st":
+                    continue
+                break
+        else:
+            return
+        if self._m() > 1:
+            self.k = self.j
+
+    def _step6(self):
+        self.j = self.k
+        if self.b[self.k] == "e":
+            a = self._m()
+            if a > 1 or (a == 1 and not self._cvc(self.k - 1)):
+                self.k -= 1
+        if self.b[self.k] == "l" and self._doublec(self.k) and self._m() > 1:
+            self.k -= 1
+
+
+@lru_cache(maxsize=2**18)
+def stem(word):
+    return _PorterStemmer().stem(word)
+
+
+def _split_long(token):
+    return [
+        token[i : i + MAX_TOKEN_LENGTH] for i in range(0, len(token), MAX_TOKEN_LENGTH)
+    ]
+
+
+def _lower(token):
+    return token.translate(_LOWER_SPECIAL).lower()
+
+
+def analyze(text):
+    """Returns the index terms of `text`, as Anserini's English analyzer does"""
+    terms = []
+    for token in _token_re().findall(text):
+        for token in _split_long(token) if len(token) > MAX_TOKEN_LENGTH else (token,):
+            token = _POSSESSIVE_RE.sub("", token)
+            token = token.lower() if token.isascii() else _lower(token)
+            if token and token not in STOPWORDS:
+                terms.append(stem(token))
+    return terms
+
+
+def _long_to_int4(i):
+    num_bits = i.bit_length()
+    if num_bits < 4:
+        return i
+    shift = num_bits - 4
+    return ((i >> shift) & 0x07) | ((shift + 1) << 3)
+
+
+def _int4_to_long(i):
+    bits = i & 0x07
+    shift = (i >> 3) - 1
+    return bits if shift == -1 else (bits | 0x08) << shift
+
+
+_NUM_FREE_VALUES = 255 - _long_to_int4(2**31 - 1)
+
+
+def encode_length(length):
+    """Lucene's `SmallFloat.intToByte4`: the one-byte norm of a field length"""
+    if length < _NUM_FREE_VALUES:
+        return length
+    return _NUM_FREE_VALUES + _long_to_int4(length - _NUM_FREE_VALUES)
+
+
+def decode_length(norm):
+    """Lucene's `SmallFloat.byte4ToInt`"""
+    if norm < _NUM_FREE_VALUES:
+        return norm
+    return _NUM_FREE_VALUES + _int4_to_long(norm - _NUM_FREE_VALUES)
+
+
+def norm_inverse_cache(avgdl, k1=K1, b=B):
+    """`BM25Similarity`'s float32 `1 / (k1 * (1 - b + b * dl / avgdl))` per norm"""
+    k1, b, avgdl = np.float32(k1), np.float32(b), np.float32(avgdl)
+    lengths = np.array([decode_length(i) for i in range(256)], dtype=np.float32)
+    return np.float32(1) / (k1 * ((np.float32(1) - b) + b * lengths / avgdl))
+
+
+def idf(doc_freq, doc_count):
+    return np.float32(np.log(1 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5)))
+
+
+def adjust_score_ties(scores):
+    """Anserini's `ScoreTiesAdjusterReranker` on ranked float32 scores
+
+    Scores are rounded to 4 decimals, and each run of scores within 1e-4 of
+    the previous one is lowered by 1e-6 per position so that it stays strict.
+    """
+    scores = (np.floor(scores.astype(np.float64) * 10000.0 + 0.5) / 10000.0).astype(
+        np.float32
+    )
+    dup = 0
+    for i in range(1, len(scores)):
+        if scores[i - 1] - scores[i] > np.float32(1e-4):
+            dup = 0
+        else:
+            dup += 1
+            scores[i] -= np.float32(1e-6) * np.float32(dup)
+    return scores
+
+
+def _collection_files(collection_dir):
+    return [
+        os.path.join(collection_dir, name)
+        for name in sorted(os.listdir(collection_dir))
+        if name.endswith((".jsonl", ".json"))
+    ]
+
+
+def _analyze_file(path):
+    """Per-shard postings: `(asins, vocab, doc_indptr, term_ids, tfs, lengths)`"""
+    asins, lengths = [], []
+    vocab = dict()
+    doc_indptr, term_ids, tfs = [0], [], []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            doc = json.loads(line)
+            terms = analyze(doc["contents"])
+            asins.append(doc["id"])
+            lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                tfs.append(tf)
+            doc_indptr.append(len(term_ids))
+    return (
+        asins,
+        list(vocab),
+        np.array(doc_indptr, dtype=np.int64),
+        np.array(term_ids, dtype=np.int32),
+        np.array(tfs, dtype=np.int32),
+        np.array(lengths, dtype=np.int64),
+    )
+
+
+def build_index(collection_dir, output_path, k1=K1, b=B, workers=None):
+    """Build a BM25 index of a JSONL collection and save it to `output_path`"""
+    from scipy import sparse
+
+    vocab = dict()
+    asins, doc_indptrs, term_ids, tfs, lengths = [], [], [], [], []
+    num_postings = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        shards = executor.map(_analyze_file, _collection_files(collection_dir))
+        for (
+            shard_asins,
+            shard_vocab,
+            doc_indptr,
+            shard_term_ids,
+            shard_tfs,
+            shard_lengths,
+        ) in shards:
+            local_to_global = np.array(
+                [vocab.setdefault(term, len(vocab)) for term in shard_vocab],
+                dtype=np.int32,
+            )
+            asins.extend(shard_asins)
+            doc_indptrs.append(doc_indptr[1:] + num_postings)
+            term_ids.append(local_to_global[shard_term_ids])
+            tfs.append(shard_tfs)
+            lengths.append(shard_lengths)
+            num_postings += len(shard_term_ids)
+            print(f"Analyzed {len(asins)} documents")
+
+    num_docs = len(asins)
+    lengths = np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int64)
+    doc_count = int(np.count_nonzero(lengths))
+    avgdl = np.float32(lengths.sum() / doc_count) if doc_count else np.float32(1)
+
+    # Terms are numbered in sorted order so that lookups are a binary search
+    terms = sorted(vocab)
+    term_order = np.empty(len(terms), dtype=np.int32)
+    term_order[[vocab[term] for term in terms]] = np.arange(len(terms), dtype=np.int32)
+    doc_term_matrix = sparse.csr_matrix(
+        (
+            np.concatenate(tfs) if tfs else np.zeros(0, dtype=np.int32),
+            term_order[np.concatenate(term_ids)] if term_ids else np.zeros(0, np.int32),
+            np.concatenate([np.zeros(1, dtype=np.int64)] + doc_indptrs),
+        ),
+        shape=(num_docs, len(terms)),
+    )
+    # Term-major postings with documents in ascending order
+    postings = doc_term_matrix.T.tocsr()
+    postings.sort_indices()
+
+    # Each posting stores Lucene's `1 + freq * normInverse` of its document
+    norms = np.array([encode_length(int(n)) for n in lengths], dtype=np.uint8)
+    cache = norm_inverse_cache(avgdl, k1, b)
+    doc_ids = postings.indices.astype(np.int32)
+    tf_norms = np.float32(1) + postings.data.astype(np.float32) * cache[norms[doc_ids]]
+
+    term_bytes = [term.encode() for term in terms]
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(t) for t in term_bytes], out=term_offsets[1:])
+    asin_width = max((len(asin) for asin in asins), default=1)
+    asin_table = np.array(asins, dtype=f"S{asin_width}")
+    tie_order = np.empty(num_docs, dtype=np.int32)
+    tie_order[np.argsort(asin_table, kind="stable")] = np.arange(num_docs)
+
+    # Written uncompressed so that `load_npz` can memory-map every array
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            terms=np.frombuffer(b"".join(term_bytes), dtype=np.uint8),
+            term_offsets=term_offsets,
+            indptr=postings.indptr.astype(np.int64),
+            doc_ids=doc_ids,
+            tf_norms=tf_norms.astype(np.float32),
+            asins=asin_table,
+            tie_order=tie_order,
+            doc_count=np.int64(doc_count),
+            params=np.array([k1, b], dtype=np.float32),
+        )
+    os.replace(tmp_path, output_path)
+    print(
+        f"Wrote {output_path}: {num_docs} documents, {len(terms)} terms, "
+        f"{len(doc_ids)} postings"
+    )
+    return output_path
+
+
+def load_npz(path):
+    """Memory-map every array of an uncompressed `.npz` file"""
+    arrays = dict()
+    with zipfile.ZipFile(path) as zf:
+        infos = zf.infolist()
+    with open(path, "rb") as f:
+        for info in infos:
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path} is compressed and can't be memory-mapped")
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[: -len(".npy")]
+            if not shape or 0 in shape:  # np.memmap can't map these
+                count = int(np.prod(shape))
+                arrays[name] = np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+            else:
+                arrays[name] = np.memmap(
+                    path,
+                    dtype=dtype,
+                    mode="r",
+                    offset=f.tell(),
+                    shape=shape,
+                    order="F" if fortran_order else "C",
+                )
+    return arrays
+
+
+class _Terms(Sequence):
+    """Sorted index terms, decoded on access from the memory-mapped blob"""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i] : self.offsets[i + 1]].tobytes()
+
+    def index(self, term):
+        term = term.encode()
+        i = bisect.bisect_left(self, term)
+        return i if i < len(self) and self[i] == term else None
+
+
+class BM25Searcher:
+    """BM25 searcher over an index written by `build_index`
+
+    Mirrors the parts of Pyserini's `LuceneSearcher` used by the engine:
+    `search`, `batch_search` and `num_docs`. Hits carry the ASIN as `docid`
+    and the document's catalog rank as `lucene_docid`.
+    """
+
+    def __init__(self, index_path):
+        arrays = load_npz(index_path)
+        self.index_path = index_path
+        self._terms = _Terms(arrays["terms"], arrays["term_offsets"])
+        self._indptr = arrays["indptr"]
+        self._doc_ids = arrays["doc_ids"]
+        self._tf_norms = arrays["tf_norms"]
+        self._asins = arrays["asins"]
+        self._tie_order = arrays["tie_order"]
+        self._doc_count = int(arrays["doc_count"])
+        self.k1, self.b = (float(p) for p in arrays["params"])
+        self.max_docs = len(self._asins)
+        self._idf = dict()
+
+    @property
+    def num_docs(self):
+        return self.max_docs
+
+    def restrict(self, num_products):
+        """A searcher over the first `num_products` documents, sharing this index"""
+        searcher = copy.copy(self)
+        searcher.max_docs = min(num_products, len(self._asins))
+        return searcher
+
+    def _query_terms(self, q):
+        """`(term id, weight)` pairs of the bag-of-words query `q`"""
+        query_terms = []
+        for term, count in Counter(analyze(q)).items():
+            term_id = self._terms.index(term)
+            if term_id is None:
+                continue
+            weight = self._idf.get(term_id)
+            if weight is None:
+                doc_freq = int(self._indptr[term_id + 1] - self._indptr[term_id])
+                weight = self._idf[term_id] = idf(doc_freq, self._doc_count)
+            query_terms.append((term_id, np.float32(count) * weight))
+        return query_terms
+
+    def _postings_range(self, term_id):
+        start, end = int(self._indptr[term_id]), int(self._indptr[term_id + 1])
+        if self.max_docs < len(self._asins):
+            # Postings are in document order, i.e. in catalog rank order
+            end = start + int(np.searchsorted(self._doc_ids[start:end], self.max_docs))
+        return start, end
+
+    def _score_batch(self, queries):
+        """Gather the postings of every query term at once; returns per-query scores"""
+        starts, lengths, weights = [], [], []
+        query_bounds = [0]
+        for q in queries:
+            for term_id, weight in self._query_terms(q):
+                start, end = self._postings_range(term_id)
+                if end > start:
+                    starts.append(start)
+                    lengths.append(end - start)
+                    weights.append(weight)
+            query_bounds.append(len(starts))
+        lengths = np.array(lengths, dtype=np.int64)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.repeat(np.array(starts, dtype=np.int64) - offsets[:-1], lengths)
+        positions += np.arange(offsets[-1], dtype=np.int64)
+        weight = np.repeat(np.array(weights, dtype=np.float32), lengths)
+        # Lucene's per-term BM25Scorer: weight - weight / (1 + freq * normInverse)
+        term_scores = weight - weight / self._tf_norms[positions]
+        doc_ids = self._doc_ids[positions]
+        return [
+            self._sum_scores(doc_ids[lo:hi], term_scores[lo:hi])
+            for lo, hi in zip(offsets[query_bounds[:-1]], offsets[query_bounds[1:]])
+        ]
+
+    def _sum_scores(self, doc_ids, term_scores):
+        """Sum the term scores of each document, in double like Lucene, then round"""
+        if len(doc_ids) > self.max_docs // DENSE_SCORING_RATIO:
+            dense = np.bincount(
+                doc_ids, weights=term_scores.astype(np.float64), minlength=self.max_docs
+            )
+            doc_ids = np.flatnonzero(dense)  # every term score is positive
+            scores = dense[doc_ids]
+        else:
+            doc_ids, inverse = np.unique(doc_ids, return_inverse=True)
+            scores = np.bincount(inverse, weights=term_scores.astype(np.float64))
+        return doc_ids, scores.astype(np.float32)
+
+    def _top_k(self, doc_ids, scores, k):
+        if len(scores) > k:
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+            keep = scores >= threshold
+            doc_ids, scores = doc_ids[keep], scores[keep]
+        order = np.lexsort((self._tie_order[doc_ids], -scores))[:k]
+        return [
+            Hit(self._asins[d].decode(), int(d), float(s))
+            for d, s in zip(doc_ids[order], adjust_score_ties(scores[order]))
+        ]
+
+    def batch_search(self, queries, qids, k=10, threads=1):
+        """Score all queries in one vectorized pass; `threads` is ignored"""
+        return {
+            qid: self._top_k(doc_ids, scores, k)
+            for qid, (doc_ids, scores) in zip(qids, self._score_batch(queries))
+        }
+
+    def search(self, q, k=10):
+        doc_ids, scores = self._score_batch([q])[0]
+        return self._top_k(doc_ids, scores, k)
@@ -0,0 +1,279 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Precompiled, memory-mapped product catalog.
+
+`compile_catalog` runs the `load_products` normalization once and writes the
+result to a single file laid out as
+
+    MAGIC | record 0 | record 1 | ... | index (JSON) | index offset (uint64)
+
+where every record is one compact JSON-encoded product and the index maps each
+ASIN to the (offset, length) of its record. `load_catalog` opens the file with
+mmap and returns the same tuple as `load_products`, except that products are
+only decoded when they are accessed. The pages are read-only and shared by all
+processes that open the same catalog.
+
+The index also keeps the fields goals are built from for every product that
+has goals (see `get_goal_products`), so opening a catalog decodes no records.
+"""
+
+import argparse
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping, Sequence
+import json
+import mmap
+import os
+import struct
+import threading
+
+from rich import print
+
+from .engine import generate_product_prices, iter_products
+
+CATALOG_SUFFIX = ".catalog"
+CATALOG_MAGIC_PREFIX = b"WSCAT"
+CATALOG_MAGIC = CATALOG_MAGIC_PREFIX + b"02\n"  # bump when the format changes
+CATALOG_CACHE_SIZE = 1024  # number of decoded products kept per catalog
+
+# Product fields read by `get_human_goals`/`get_synthetic_goals`
+GOAL_FIELDS = (
+    "asin",
+    "category",
+    "query",
+    "name",
+    "product_category",
+    "Title",
+    "options",
+    "instructions",
+    "instruction_text",
+    "instruction_attributes",
+)
+
+_TRAILER = struct.Struct("<Q")
+
+
+def get_catalog_path(file_path):
+    """Returns the compiled catalog path that corresponds to a raw catalog file"""
+    return os.path.splitext(file_path)[0] + CATALOG_SUFFIX
+
+
+def is_catalog(file_path):
+    """Returns whether `file_path` points at a compiled catalog"""
+    if not os.path.isfile(file_path):
+        return False
+    with open(file_path, "rb") as f:
+        return f.read(len(CATALOG_MAGIC_PREFIX)) == CATALOG_MAGIC_PREFIX
+
+
+def has_goals(product, human_goals=True):
+    """Returns whether goals are generated for a normalized product"""
+    if human_goals:
+        return "instructions" in product
+    return product.get("instruction_text") is not None
+
+
+def compile_catalog(filepath, output_path, num_products=None, human_goals=True):
+    """Normalize a raw catalog file once and write it as a compiled catalog"""
+    asins, offsets, lengths, pricing = [], [], [], []
+    attribute_to_asins = defaultdict(list)
+    goal_products = []
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(CATALOG_MAGIC)
+        for p in iter_products(filepath, num_products, human_goals=human_goals):
+            record = json.dumps(p, separators=(",", ":")).encode()
+            asins.append(p["asin"])
+            offsets.append(f.tell())
+            lengths.append(len(record))
+            pricing.append(p["pricing"])
+            for a in p["Attributes"]:
+                attribute_to_asins[a].append(p["asin"])
+            if has_goals(p, human_goals):
+                goal_products.append({k: p[k] for k in GOAL_FIELDS if k in p})
+            f.write(record)
+
+        index_offset = f.tell()
+        index = {
+            "human_goals": bool(human_goals),
+            "asins": asins,
+            "offsets": offsets,
+            "lengths": lengths,
+            "pricing": pricing,
+            "attribute_to_asins": attribute_to_asins,
+            "goal_products": goal_products,
+        }
+        f.write(json.dumps(index, separators=(",", ":")).encode())
+        f.write(_TRAILER.pack(index_offset))
+    os.replace(tmp_path, output_path)
+    print(f"Compiled {len(asins)} products into {output_path}.")
+    return output_path
+
+
+class ProductCatalog:
+    """Read-only view over a compiled catalog file"""
+
+    def __init__(self, path, cache_size=CATALOG_CACHE_SIZE):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic = self._mm[: len(CATALOG_MAGIC)]
+        if magic != CATALOG_MAGIC:
+            self._mm.close()
+            if magic.startswith(CATALOG_MAGIC_PREFIX):
+                raise ValueError(
+                    f"{path} was compiled with another catalog format version, "
+                    "compile it again."
+                )
+            raise ValueError(f"{path} is not a compiled product catalog.")
+
+        (index_offset,) = _TRAILER.unpack(self._mm[-_TRAILER.size :])
+        index = json.loads(self._mm[index_offset : -_TRAILER.size])
+        self.human_goals = index["human_goals"]
+        self.asins = index["asins"]
+        self.pricing = index["pricing"]
+        self.attribute_to_asins = index["attribute_to_asins"]
+        self.goal_products = index["goal_products"]
+        self._records = {
+            asin: (offset, length)
+            for asin, offset, length in zip(
+                self.asins, index["offsets"], index["lengths"]
+            )
+        }
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.asins)
+
+    def __contains__(self, asin):
+        return asin in self._records
+
+    def get(self, asin):
+        """Decode the product record for `asin`, keeping recent ones cached"""
+        with self._lock:
+            product = self._cache.get(asin)
+            if product is not None:
+                self._cache.move_to_end(asin)
+                return product
+        offset, length = self._records[asin]
+        product = json.loads(self._mm[offset : offset + length])
+        with self._lock:
+            self._cache[asin] = product
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return product
+
+    def close(self):
+        self._cache.clear()
+        self._mm.close()
+
+
+class LazyProductList(Sequence):
+    """`all_products` backed by a catalog; products are decoded on access"""
+
+    def __init__(self, catalog, asins, goal_products=None):
+        self.catalog = catalog
+        self.asins = asins
+        self.goal_products = goal_products
+
+    def __len__(self):
+        return len(self.asins)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return LazyProductList(self.catalog, self.asins[idx])
+        return self.catalog.get(self.asins[idx])
+
+
+class LazyProductDict(Mapping):
+    """`product_item_dict` backed by a catalog; products are decoded on access"""
+
+    def __init__(self, catalog, asins):
+        self.catalog = catalog
+        self.asins = asins if len(asins) == len(catalog) else set(asins)
+
+    def __getitem__(self, asin):
+        if asin not in self:
+            raise KeyError(asin)
+        return self.catalog.get(asin)
+
+    def __contains__(self, asin):
+        if isinstance(self.asins, set):
+            return asin in self.asins
+        return asin in self.catalog
+
+    def __iter__(self):
+        return iter(self.asins)
+
+    def __len__(self):
+        return len(self.asins)
+
+
+def load_catalog(filepath, num_products=None, human_goals=True):
+    """Open a compiled catalog, mirroring the return value of `load_products`"""
+    catalog = ProductCatalog(filepath)
+    if catalog.human_goals != bool(human_goals):
+        raise ValueError(
+            f"{filepath} was compiled with human_goals={catalog.human_goals}, "
+            f"but human_goals={bool(human_goals)} was requested."
+        )
+    asins = catalog.asins[:num_products]
+    product_item_dict = LazyProductDict(catalog, asins)
+    goal_products = catalog.goal_products
+    if len(asins) < len(catalog):
+        goal_products = [p for p in goal_products if p["asin"] in product_item_dict]
+    all_products = LazyProductList(catalog, asins, goal_products)
+    product_prices = generate_product_prices(
+        {"asin": asin, "pricing": pricing}
+        for asin, pricing in zip(asins, catalog.pricing)
+    )
+    attribute_to_asins = defaultdict(set)
+    for a, attribute_asins in catalog.attribute_to_asins.items():
+        attribute_asins = {
+            asin for asin in attribute_asins if asin in product_item_dict
+        }
+        if attribute_asins:
+            attribute_to_asins[a] = attribute_asins
+    print(f"Catalog opened with {len(asins)} products.")
+    return all_products, product_item_dict, product_prices, attribute_to_asins
+
+
+def get_goal_products(all_products):
+    """Products to build goals from, in catalog order
+
+    For a compiled catalog these are the indexed goal fields of the products
+    that have goals, so no product record needs to be decoded.
+    """
+    goal_products = getattr(all_products, "goal_products", None)
+    return all_products if goal_products is None else goal_products
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a WebShop product catalog.")
+    parser.add_argument("input", help="raw items_shuffle*.json catalog")
+    parser.add_argument(
+        "--output", default=None, help="defaults to the input path with .catalog"
+    )
+    parser.add_argument("--num_products", type=int, default=None)
+    parser.add_argument("--human_goals", action="store_true")
+    args = parser.parse_args()
+
+    compile_catalog(
+        args.input,
+        args.output or get_catalog_path(args.input),
+        num_products=args.num_products,
+        human_goals=args.human_goals,
+    )
@@ -15,35 +15,63 @@
 """ """
 
 from ast import literal_eval
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from decimal import Decimal
+import functools
 import json
 import os
 import random
 import re
+import threading
+import time
+from urllib.parse import quote, quote_plus
 
-from flask import render_template_string
-from pyserini.search.lucene import LuceneSearcher
+from flask import current_app
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from rich import print
 from tqdm import tqdm
 
+from .. import instrumentation
 from ..utils import (
     BASE_DIR,
     DEFAULT_ATTR_PATH,
     HUMAN_ATTR_PATH,
 )
+from .search_pool import get_docid_table, get_search_engine
 
 TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
+# Re-read templates whenever they change on disk (development only)
+TEMPLATE_AUTO_RELOAD = os.environ.get("WEBSHOP_TEMPLATE_RELOAD", "0") == "1"
+# "fast" renders with a plain Jinja environment; "flask" uses the Flask app's
+# environment and `url_for`, which need an app and request context per render
+RENDER_MODE = os.environ.get("WEBSHOP_RENDER_MODE", "fast")
+RENDER_MODES = ("fast", "flask")
 
 SEARCH_RETURN_N = 50
 PRODUCT_WINDOW = 10
 TOP_K_ATTR = 10
+SEARCH_THREADS = 8  # Lucene worker threads used by batched searches
+SEARCH_CACHE_SIZE = 1024  # search results kept per SimServer
+SEARCH_CACHE_TTL = None  # seconds before a cached result expires; None = never
+
+# Keyword prefixes that select products directly instead of running a search
+SPECIAL_KEYWORDS = ("<r>", "<a>", "<c>", "<q>")
+
+JSON_CHUNK_SIZE = 1 << 20  # characters read per chunk when streaming catalogs
 
 END_BUTTON = "Buy Now"
 NEXT_PAGE = "Next >"
 PREV_PAGE = "< Prev"
 BACK_TO_SEARCH = "Back to Search"
 
+# Every page of the simulated app is routed at "/" (see `SimServer`)
+PAGE_ENDPOINTS = ("index", "search_results", "item_page", "item_sub_page", "done")
+STATIC_URL_PATH = "/static"
+# Characters werkzeug leaves unquoted in paths and query strings
+PATH_SAFE_CHARS = "!$&'()*+,/:;=@"
+QUERY_SAFE_CHARS = "!$'()*,/:;?@"
+URL_CACHE_SIZE = 1 << 14  # quoted query string parts kept
+
 ACTION_TO_TEMPLATE = {
     "Description": "description_page.html",
     "Features": "features_page.html",
@@ -52,19 +80,126 @@ ACTION_TO_TEMPLATE = {
 }
 
 
+@functools.lru_cache(maxsize=URL_CACHE_SIZE)
+def _quote_query(value):
+    return quote_plus(value, QUERY_SAFE_CHARS)
+
+
+def build_url(endpoint, **values):
+    """Returns the URL `flask.url_for` builds for a WebShop page, without Flask
+
+    Page arguments go to the query string exactly as werkzeug encodes them:
+    `None` values are dropped, lists repeat their key and other values are
+    formatted with `str`.
+    """
+    if endpoint == "static":
+        path = f"{STATIC_URL_PATH}/{quote(values.pop('filename'), PATH_SAFE_CHARS)}"
+    elif endpoint in PAGE_ENDPOINTS:
+        path = "/"
+    else:
+        raise ValueError(f"Unknown endpoint {endpoint}.")
+    # Keywords, session ids and option dicts repeat across the links of a page
+    items = []
+    for key, value in values.items():
+        if isinstance(value, (list, tuple, set)):
+            items.extend(f"{_quote_query(key)}={_quote_query(str(v))}" for v in value)
+        elif value is not None:
+            items.append(f"{_quote_query(key)}={_quote_query(str(value))}")
+    if not items:
+        return path
+    return f"{path}?{'&'.join(items)}"
+
+
+class TemplateRegistry:
+    """Loads and compiles the page templates once per process.
+
+    Templates are compiled lazily on first use (or eagerly via `preload`). In
+    the "fast" mode they live in a plain Jinja environment whose `url_for` is
+    `build_url`, so rendering needs no Flask context. In the "flask" mode they
+    are compiled into an overlay of the Flask app's Jinja environment and must
+    be rendered inside an app and request context. Both produce the same HTML.
+    With `auto_reload` the template files are checked for changes on every
+    render, which is handy while editing them.
+    """
+
+    def __init__(
+        self,
+        template_dir=TEMPLATE_DIR,
+        auto_reload=TEMPLATE_AUTO_RELOAD,
+        mode=RENDER_MODE,
+    ):
+        if mode not in RENDER_MODES:
+            raise ValueError(f"Render mode {mode} not supported.")
+        self.template_dir = template_dir
+        self.auto_reload = auto_reload
+        self.mode = mode
+        self._jinja_envs = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def needs_app_context(self):
+        return self.mode == "flask"
+
+    def _create_jinja_env(self):
+        # Same autoescaping and `tojson` behaviour as Flask's environment
+        jinja_env = Environment(
+            loader=FileSystemLoader(self.template_dir),
+            autoescape=select_autoescape(("html", "htm", "xml", "xhtml", "svg")),
+            auto_reload=self.auto_reload,
+        )
+        jinja_env.globals["url_for"] = build_url
+        return jinja_env
+
+    def _get_jinja_env(self):
+        if self.mode == "fast":
+            jinja_env = self._jinja_envs.get(None)
+            if jinja_env is None:
+                with self._lock:
+                    if None not in self._jinja_envs:
+                        self._jinja_envs[None] = self._create_jinja_env()
+                    jinja_env = self._jinja_envs[None]
+            return jinja_env
+        app_jinja_env = current_app.jinja_env
+        jinja_env = self._jinja_envs.get(id(app_jinja_env))
+        if jinja_env is None:
+            with self._lock:
+                jinja_env = self._jinja_envs.setdefault(
+                    id(app_jinja_env),
+                    app_jinja_env.overlay(
+                        loader=FileSystemLoader(self.template_dir),
+                        auto_reload=self.auto_reload,
+                    ),
+                )
+        return jinja_env
+
+    def get_template(self, name):
+        return self._get_jinja_env().get_template(name)
+
+    def render(self, name, **context):
+        with instrumentation.timer("render"):
+            return self.get_template(name).render(**context)
+
+    def preload(self):
+        """Compile every template up front (the "flask" mode needs an app context)"""
+        for name in sorted(os.listdir(self.template_dir)):
+            if name.endswith(".html"):
+                self.get_template(name)
+
+
+template_registry = TemplateRegistry()
+
+
 def map_action_to_html(action, **kwargs):
     action_name, action_arg = parse_action(action)
     if action_name == "start":
-        path = os.path.join(TEMPLATE_DIR, "search_page.html")
-        html = render_template_string(
-            read_html_template(path=path),
+        html = template_registry.render(
+            "search_page.html",
             session_id=kwargs["session_id"],
             instruction_text=kwargs["instruction_text"],
         )
     elif action_name == "search":
-        path = os.path.join(TEMPLATE_DIR, "results_page.html")
-        html = render_template_string(
-            read_html_template(path=path),
+        html = template_registry.render(
+            "results_page.html",
             session_id=kwargs["session_id"],
             products=kwargs["products"],
             keywords=kwargs["keywords"],
@@ -73,9 +208,8 @@ def map_action_to_html(action, **kwargs):
             instruction_text=kwargs["instruction_text"],
         )
     elif action_name == "click" and action_arg == END_BUTTON:
-        path = os.path.join(TEMPLATE_DIR, "done_page.html")
-        html = render_template_string(
-            read_html_template(path),
+        html = template_registry.render(
+            "done_page.html",
             session_id=kwargs["session_id"],
             reward=kwargs["reward"],
             asin=kwargs["asin"],
@@ -90,9 +224,8 @@ def map_action_to_html(action, **kwargs):
             product_category=kwargs.get("product_category"),
         )
     elif action_name == "click" and action_arg in ACTION_TO_TEMPLATE:
-        path = os.path.join(TEMPLATE_DIR, ACTION_TO_TEMPLATE[action_arg])
-        html = render_template_string(
-            read_html_template(path),
+        html = template_registry.render(
+            ACTION_TO_TEMPLATE[action_arg],
             session_id=kwargs["session_id"],
             product_info=kwargs["product_info"],
             keywords=kwargs["keywords"],
@@ -102,9 +235,8 @@ def map_action_to_html(action, **kwargs):
             instruction_text=kwargs.get("instruction_text"),
         )
     elif action_name == "click":
-        path = os.path.join(TEMPLATE_DIR, "item_page.html")
-        html = render_template_string(
-            read_html_template(path),
+        html = template_registry.render(
+            "item_page.html",
             session_id=kwargs["session_id"],
             product_info=kwargs["product_info"],
             keywords=kwargs["keywords"],
@@ -175,15 +307,148 @@ def get_top_n_product_from_keywords(
         top_n_products = [p for p in all_products if p["query"] == query]
     else:
         keywords = " ".join(keywords)
-        hits = search_engine.search(keywords, k=SEARCH_RETURN_N)
-        docs = [search_engine.doc(hit.docid) for hit in hits]
-        top_n_asins = [json.loads(doc.raw())["id"] for doc in docs]
-        top_n_products = [
-            product_item_dict[asin] for asin in top_n_asins if asin in product_item_dict
-        ]
+        with instrumentation.timer("search"):
+            hits = search_engine.search(keywords, k=SEARCH_RETURN_N)
+        with instrumentation.timer("doc_fetch"):
+            top_n_asins = hits_to_asins(hits, get_docid_table(search_engine))
+            top_n_products = asins_to_products(top_n_asins, product_item_dict)
     return top_n_products
 
 
+def get_top_n_products_from_keywords_batch(
+    keywords_list,
+    search_engine,
+    all_products,
+    product_item_dict,
+    attribute_to_asins=None,
+    threads=SEARCH_THREADS,
+):
+    """Batched `get_top_n_product_from_keywords` for many keyword lists at once.
+
+    Plain keyword queries are sent to Lucene in a single multi-threaded
+    `batch_search` call; special (`<r>`, `<a>`, `<c>`, `<q>`) queries fall back to
+    the single-query path. Results are returned in the order of `keywords_list`.
+    """
+    results = [None] * len(keywords_list)
+    batch_idxs = []
+    for i, keywords in enumerate(keywords_list):
+        if keywords[0] in SPECIAL_KEYWORDS:
+            results[i] = get_top_n_product_from_keywords(
+                keywords,
+                search_engine,
+                all_products,
+                product_item_dict,
+                attribute_to_asins,
+            )
+        else:
+            batch_idxs.append(i)
+
+    batch_asins = search_asins_batch(
+        [keywords_list[i] for i in batch_idxs], search_engine, threads=threads
+    )
+    for i, top_n_asins in zip(batch_idxs, batch_asins):
+        results[i] = asins_to_products(top_n_asins, product_item_dict)
+    return results
+
+
+def search_asins_batch(
+    keywords_list, search_engine, k=SEARCH_RETURN_N, threads=SEARCH_THREADS
+):
+    """Run many keyword queries through Pyserini's `batch_search`, returning ASINs"""
+    if not keywords_list:
+        return []
+    queries = [" ".join(keywords) for keywords in keywords_list]
+    qids = [str(i) for i in range(len(queries))]
+    hits = search_engine.batch_search(queries, qids, k=k, threads=threads)
+    docid_table = get_docid_table(search_engine)
+    return [hits_to_asins(hits.get(qid, []), docid_table) for qid in qids]
+
+
+def hits_to_asins(hits, docid_table=None):
+    """Map search hits to ASINs without fetching the stored documents.
+
+    With a docid table (see `search_engine/build_docid_table.py`) the internal
+    Lucene docid indexes straight into it. Otherwise the collection docid of
+    every hit is used, which is the `id` field written by
+    `convert_product_file_format.py`, i.e. the product ASIN.
+    """
+    if docid_table is not None:
+        return [docid_table[hit.lucene_docid].decode() for hit in hits]
+    return [hit.docid for hit in hits]
+
+
+def asins_to_products(asins, product_item_dict):
+    return [product_item_dict[asin] for asin in asins if asin in product_item_dict]
+
+
+class SearchCache:
+    """Bounded LRU cache of search results with an optional time-to-live"""
+
+    def __init__(self, maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the cached value for `key`, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (
+                self.ttl is None or time.time() - entry[0] <= self.ttl
+            ):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def get_search_cache_key(keywords, search_engine):
+    """Cache key for a search: the index identity plus the normalized keywords.
+
+    Returns None for searches whose results must not be cached (`<r>`).
+    """
+    keywords = tuple(k.strip() for k in keywords if k.strip())
+    if not keywords or keywords[0] == "<r>":
+        return None
+    if keywords[0] not in SPECIAL_KEYWORDS:
+        # Lucene's analyzer is case-insensitive, so plain queries are too
+        keywords = tuple(k.lower() for k in keywords)
+    return id(search_engine), keywords
+
+
+def get_product_record(product):
+    """Summary of a product as shown on the results and item pages"""
+    return {
+        "asin": product["asin"],
+        "title": product["Title"],
+        "price": product["Price"],
+        "rating": product["Rating"],
+        "image": product["MainImage"],
+    }
+
+
 def get_product_per_page(top_n_products, page):
     return top_n_products[(page - 1) * PRODUCT_WINDOW : page * PRODUCT_WINDOW]
 
@@ -204,61 +469,93 @@ def generate_product_prices(all_products):
 
 
 def init_search_engine(num_products=None):
-    if num_products == 100:
-        indexes = "indexes_100"
-    elif num_products == 1000:
-        indexes = "indexes_1k"
-    elif num_products == 10000:
-        indexes = "indexes_10k"
-    elif num_products == 50000:
-        indexes = "indexes_50k"
-    elif num_products is None:
-        indexes = "indexes_1k"
-    else:
-        raise NotImplementedError(
-            f"num_products being {num_products} is not supported yet."
-        )
-    search_engine = LuceneSearcher(
-        os.path.join(BASE_DIR, f"../search_engine/{indexes}")
-    )
+    # Searchers are shared process-wide, so only the first env pays for the JVM
+    search_engine = get_search_engine(num_products)
     return search_engine
 
 
+def clean_product_key(product):
+    """Drop the raw scrape fields that are never used by the environment."""
+    product.pop("product_information", None)
+    product.pop("brand", None)
+    product.pop("brand_url", None)
+    product.pop("list_price", None)
+    product.pop("availability_quantity", None)
+    product.pop("availability_status", None)
+    product.pop("total_reviews", None)
+    product.pop("total_answered_questions", None)
+    product.pop("seller_id", None)
+    product.pop("seller_name", None)
+    product.pop("fulfilled_by_amazon", None)
+    product.pop("fast_track_message", None)
+    product.pop("aplus_present", None)
+    product.pop("small_description_old", None)
+    return product
+
+
 def clean_product_keys(products):
     for product in products:
-        product.pop("product_information", None)
-        product.pop("brand", None)
-        product.pop("brand_url", None)
-        product.pop("list_price", None)
-        product.pop("availability_quantity", None)
-        product.pop("availability_status", None)
-        product.pop("total_reviews", None)
-        product.pop("total_answered_questions", None)
-        product.pop("seller_id", None)
-        product.pop("seller_name", None)
-        product.pop("fulfilled_by_amazon", None)
-        product.pop("fast_track_message", None)
-        product.pop("aplus_present", None)
-        product.pop("small_description_old", None)
+        clean_product_key(product)
     print("Keys cleaned.")
     return products
 
 
-def load_products(filepath, num_products=None, human_goals=True):
-    # TODO: move to preprocessing step -> enforce single source of truth
+def iter_json_array(filepath, chunk_size=JSON_CHUNK_SIZE):
+    """Incrementally yield the elements of a file holding one top-level JSON array.
+
+    Only the current element and one read chunk are held in memory, so the full
+    `items_shuffle.json` catalog can be consumed without `json.load`-ing it.
+    """
+    decoder = json.JSONDecoder()
     with open(filepath) as f:
-        products = json.load(f)
-    print("Products loaded.")
-    products = clean_product_keys(products)
+        buffer, pos, eof = "", 0, False
+        expect = "["
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos >= len(buffer):
+                if eof:
+                    raise ValueError(f"Unexpected end of JSON array in {filepath}")
+                chunk = f.read(chunk_size)
+                buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+                continue
+
+            char = buffer[pos]
+            if expect == "[":
+                if char != "[":
+                    raise ValueError(f"{filepath} does not contain a JSON array")
+                pos += 1
+                expect = "value_or_end"
+            elif expect in ("separator", "value_or_end") and char == "]":
+                return
+            elif expect == "separator":
+                if char != ",":
+                    raise ValueError(f"Expected ',' or ']' in {filepath}")
+                pos += 1
+                expect = "value"
+            else:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    end = None
+                if end is None or (
+                    not eof and (end == len(buffer) or buffer[end] not in ",] \t\r\n")
+                ):
+                    # Element may be split across chunks: read more and decode again
+                    if eof:
+                        raise ValueError(f"Malformed JSON element in {filepath}")
+                    chunk = f.read(chunk_size)
+                    buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+                    continue
+                yield value
+                pos = end
+                expect = "separator"
+                if pos > chunk_size:
+                    buffer, pos = buffer[pos:], 0
 
-    # with open(DEFAULT_REVIEW_PATH) as f:
-    #     reviews = json.load(f)
-    all_reviews = dict()
-    all_ratings = dict()
-    # for r in reviews:
-    #     all_reviews[r['asin']] = r['reviews']
-    #     all_ratings[r['asin']] = r['average_rating']
 
+def load_product_attributes(human_goals=True):
+    """Returns the `(attributes, human_attributes)` read by `normalize_product`"""
     if human_goals:
         with open(HUMAN_ATTR_PATH) as f:
             human_attributes = json.load(f)
@@ -269,14 +566,15 @@ def load_products(filepath, num_products=None, human_goals=True):
         attributes = json.load(f)
 
     print("Attributes loaded.")
+    return attributes, human_attributes
+
 
+def iter_raw_products(filepath, num_products=None):
+    """Yield the raw catalog records `iter_products` normalizes, deduplicated"""
+    # Products are streamed one record at a time; using item_shuffle.json, we
+    # assume products are already shuffled so the first `num_products` are kept
     asins = set()
-    all_products = []
-    attribute_to_asins = defaultdict(set)
-    if num_products is not None:
-        # using item_shuffle.json, we assume products already shuffled
-        products = products[:num_products]
-    for i, p in tqdm(enumerate(products), total=len(products)):
+    for p in tqdm(iter_json_array(filepath), total=num_products):
         asin = p["asin"]
         if asin == "nan" or len(asin) > 10:
             continue
@@ -286,97 +584,42 @@ def load_products(filepath, num_products=None, human_goals=True):
         else:
             asins.add(asin)
 
-        products[i]["category"] = p["category"]
-        products[i]["query"] = p["query"]
-        products[i]["product_category"] = p["product_category"]
-
-        products[i]["Title"] = p["name"]
-        products[i]["Description"] = p["full_description"]
-        products[i]["Reviews"] = all_reviews.get(asin, [])
-        products[i]["Rating"] = all_ratings.get(asin, "N.A.")
-        for r in products[i]["Reviews"]:
-            if "score" not in r:
-                r["score"] = r.pop("stars")
-            if "review" not in r:
-                r["body"] = ""
-            else:
-                r["body"] = r.pop("review")
-        products[i]["BulletPoints"] = (
-            p["small_description"]
-            if isinstance(p["small_description"], list)
-            else [p["small_description"]]
-        )
+        clean_product_key(p)
+        yield p
+        if num_products is not None and len(asins) >= num_products:
+            break
 
-        pricing = p.get("pricing")
-        if pricing is None or not pricing:
-            pricing = [100.0]
-            price_tag = "$100.0"
-        else:
-            pricing = [
-                float(Decimal(re.sub(r"[^\d.]", "", price)))
-                for price in pricing.split("$")[1:]
-            ]
-            if len(pricing) == 1:
-                price_tag = f"${pricing[0]}"
-            else:
-                price_tag = f"${pricing[0]} to ${pricing[1]}"
-                pricing = pricing[:2]
-        products[i]["pricing"] = pricing
-        products[i]["Price"] = price_tag
-
-        options = dict()
-        customization_options = p["customization_options"]
-        option_to_image = dict()
-        if customization_options:
-            for option_name, option_contents in customization_options.items():
-                if option_contents is None:
-                    continue
-                option_name = option_name.lower()
-
-                option_values = []
-                for option_content in option_contents:
-                    option_value = (
-                        option_content["value"].strip().replace("/", " | ").lower()
-                    )
-                    option_image = option_content.get("image", None)
-
-                    option_values.append(option_value)
-                    option_to_image[option_value] = option_image
-                options[option_name] = option_values
-        products[i]["options"] = options
-        products[i]["option_to_image"] = option_to_image
-
-        # without color, size, price, availability
-        # if asin in attributes and 'attributes' in attributes[asin]:
-        #     products[i]['Attributes'] = attributes[asin]['attributes']
-        # else:
-        #     products[i]['Attributes'] = ['DUMMY_ATTR']
-        # products[i]['instruction_text'] = \
-        #     attributes[asin].get('instruction', None)
-        # products[i]['instruction_attributes'] = \
-        #     attributes[asin].get('instruction_attributes', None)
-
-        # without color, size, price, availability
-        if asin in attributes and "attributes" in attributes[asin]:
-            products[i]["Attributes"] = attributes[asin]["attributes"]
-        else:
-            products[i]["Attributes"] = ["DUMMY_ATTR"]
 
-        if human_goals:
-            if asin in human_attributes:
-                products[i]["instructions"] = human_attributes[asin]
-        else:
-            products[i]["instruction_text"] = attributes[asin].get("instruction", None)
+def iter_products(filepath, num_products=None, human_goals=True):
+    """Yield normalized products from a raw catalog file, one record at a time."""
+    # TODO: move to preprocessing step -> enforce single source of truth
+    # with open(DEFAULT_REVIEW_PATH) as f:
+    #     reviews = json.load(f)
+    all_reviews = dict()
+    all_ratings = dict()
+    # for r in reviews:
+    #     all_reviews[r['asin']] = r['reviews']
+    #     all_ratings[r['asin']] = r['average_rating']
 
-            products[i]["instruction_attributes"] = attributes[asin].get(
-                "instruction_attributes", None
-            )
+    attributes, human_attributes = load_product_attributes(human_goals)
+    for p in iter_raw_products(filepath, num_products):
+        yield normalize_product(
+            p,
+            attributes,
+            human_attributes,
+            human_goals,
+            all_reviews=all_reviews,
+            all_ratings=all_ratings,
+        )
 
-        products[i]["MainImage"] = p["images"][0]
-        products[i]["query"] = p["query"].lower().strip()
 
-        all_products.append(products[i])
+def load_products(filepath, num_products=None, human_goals=True):
+    all_products = list(
+        iter_products(filepath, num_products=num_products, human_goals=human_goals)
+    )
+    print("Products loaded.")
 
+    attribute_to_asins = defaultdict(set)
     for p in all_products:
         for a in p["Attributes"]:
             attribute_to_asins[a].add(p["asin"])
@@ -384,3 +627,98 @@ def load_products(filepath, num_products=None, human_goals=True):
     product_item_dict = {p["asin"]: p for p in all_products}
     product_prices = generate_product_prices(all_products)
     return all_products, product_item_dict, product_prices, attribute_to_asins
+
+
+def normalize_product(
+    p, attributes, human_attributes, human_goals, all_reviews=None, all_ratings=None
+):
+    """Normalize a single raw catalog record in place and return it."""
+    asin = p["asin"]
+    all_reviews = all_reviews or {}
+    all_ratings = all_ratings or {}
+
+    p["Title"] = p["name"]
+    p["Description"] = p["full_description"]
+    p["Reviews"] = all_reviews.get(asin, [])
+    p["Rating"] = all_ratings.get(asin, "N.A.")
+    for r in p["Reviews"]:
+        if "score" not in r:
+            r["score"] = r.pop("stars")
+        if "review" not in r:
+            r["body"] = ""
+        else:
+            r["body"] = r.pop("review")
+    p["BulletPoints"] = (
+        p["small_description"]
+        if isinstance(p["small_description"], list)
+        else [p["small_description"]]
+    )
+
+    pricing = p.get("pricing")
+    if pricing is None or not pricing:
+        pricing = [100.0]
+        price_tag = "$100.0"
+    else:
+        pricing = [
+            float(Decimal(re.sub(r"[^\d.]", "", price)))
+            for price in pricing.split("$")[1:]
+        ]
+        if len(pricing) == 1:
+            price_tag = f"${pricing[0]}"
+        else:
+            price_tag = f"${pricing[0]} to ${pricing[1]}"
+            pricing = pricing[:2]
+    p["pricing"] = pricing
+    p["Price"] = price_tag
+
+    options = dict()
+    customization_options = p["customization_options"]
+    option_to_image = dict()
+    if customization_options:
+        for option_name, option_contents in customization_options.items():
+            if option_contents is None:
+                continue
+            option_name = option_name.lower()
+
+            option_values = []
+            for option_content in option_contents:
+                option_value = (
+                    option_content["value"].strip().replace("/", " | ").lower()
+                )
+                option_image = option_content.get("image", None)
+
+                option_values.append(option_value)
+                option_to_image[option_value] = option_image
+            options[option_name] = option_values
+    p["options"] = options
+    p["option_to_image"] = option_to_image
+
+    # without color, size, price, availability
+    # if asin in attributes and 'attributes' in attributes[asin]:
+    #     p['Attributes'] = attributes[asin]['attributes']
+    # else:
+    #     p['Attributes'] = ['DUMMY_ATTR']
+    # p['instruction_text'] = \
+    #     attributes[asin].get('instruction', None)
+    # p['instruction_attributes'] = \
+    #     attributes[asin].get('instruction_attributes', None)
+
+    # without color, size, price, availability
+    if asin in attributes and "attributes" in attributes[asin]:
+        p["Attributes"] = attributes[asin]["attributes"]
+    else:
+        p["Attributes"] = ["DUMMY_ATTR"]
+
+    if human_goals:
+        if asin in human_attributes:
+            p["instructions"] = human_attributes[asin]
+    else:
+        p["instruction_text"] = attributes[asin].get("instruction", None)
+
+        p["instruction_attributes"] = attributes[asin].get(
+            "instruction_attributes", None
+        )
+
+    p["MainImage"] = p["images"][0]
+    p["query"] = p["query"].lower().strip()
+    return p
@@ -14,24 +14,121 @@
 
 """Functions for specifying goals and reward calculations."""
 
+import bisect
 from collections import defaultdict
-import itertools
+from collections.abc import Sequence
+import functools
+from importlib import metadata
+import json
+import math
+import os
 import random
+import threading
+import numpy as np
+from rapidfuzz import fuzz as rapidfuzz_fuzz
+from rapidfuzz.process import cdist
 from rich import print
-import spacy
 from thefuzz import fuzz
+from thefuzz.utils import full_process
 from .normalize import normalize_color
-
-nlp = spacy.load("en_core_web_sm")
+from .sampler import AliasSampler
 
 PRICE_RANGE = [10.0 * i for i in range(1, 100)]
+NLP_MODEL = "en_core_web_sm"
+# `pos_` only needs tok2vec, tagger and attribute_ruler; the rest is skipped
+NLP_DISABLE = ("parser", "ner", "lemmatizer")
+NOUN_POS = ("PNOUN", "NOUN", "PROPN")
+NOUN_PIPE_BATCH_SIZE = 256
+FUZZY_MATCH_THRESHOLD = 85  # `token_set_ratio` score an option/attribute must beat
+FUZZY_CHUNK_SIZE = 1024  # rows of the fuzzy score matrix computed at a time
+FUZZY_CACHE_SIZE = 1 << 16  # memoized (choice, query) fuzzy matches
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+# goal attribute -> product attributes that fuzzy-match it, for every product
+# attribute in `attribute_match_vocab` (see `build_attribute_match_table`)
+attribute_match_table = dict()
+attribute_match_vocab = frozenset()
+
+# asin -> lowercased noun tokens of the product name (duplicates kept, since
+# `title_score` divides by the number of goal nouns)
+noun_index = dict()
+
+
+def get_nlp():
+    """Load the spaCy model on first use; importing spaCy alone takes seconds"""
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+
+                _nlp = spacy.load(NLP_MODEL, disable=NLP_DISABLE)
+    return _nlp
+
+
+def index_product_nouns(products, batch_size=NOUN_PIPE_BATCH_SIZE):
+    """Parse the names of `products` ({asin: name}) missing from the noun index"""
+    missing = {
+        asin: name for asin, name in products.items() if asin not in noun_index
+    }
+    if not missing:
+        return 0
+    docs = get_nlp().pipe(missing.values(), batch_size=batch_size)
+    for asin, doc in zip(missing, docs):
+        noun_index[asin] = [t.text.lower() for t in doc if t.pos_ in NOUN_POS]
+    return len(missing)
+
+
+def get_product_nouns(product):
+    """Returns the noun tokens of a product's (or goal's) name"""
+    nouns = noun_index.get(product["asin"])
+    if nouns is None:
+        index_product_nouns({product["asin"]: product["name"]})
+        nouns = noun_index[product["asin"]]
+    return nouns
+
+
+def _get_nlp_model_name():
+    # Read from the package metadata so checking a saved index loads no model
+    try:
+        return f"{NLP_MODEL}-{metadata.version(NLP_MODEL)}"
+    except metadata.PackageNotFoundError:
+        return NLP_MODEL
+
+
+def load_noun_index(path):
+    """Merge a noun index saved by `save_noun_index` into the in-memory one"""
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("model") != _get_nlp_model_name():
+        print(f"Ignoring {path}, it was built with another spaCy model.")
+        return 0
+    noun_index.update(data["nouns"])
+    return len(data["nouns"])
+
+
+def save_noun_index(path):
+    """Write the noun index to `path` so later processes can skip parsing"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"model": _get_nlp_model_name(), "nouns": noun_index}, f)
+    os.replace(tmp_path, path)
 
 
 def get_goals(all_products, product_prices, human_goals=True):
     if human_goals:
-        return get_human_goals(all_products, product_prices)
+        goals = get_human_goals(all_products, product_prices)
     else:
-        return get_synthetic_goals(all_products, product_prices)
+        goals = get_synthetic_goals(all_products, product_prices)
+    # Every reward compares against a goal's product name, so parse them now
+    index_product_nouns(
+        {goal["asin"]: goal["name"] for goal in iter_goal_products(goals)}
+    )
+    return goals
 
 
 def get_human_goals(all_products, product_prices):
@@ -83,12 +180,12 @@ def get_human_goals(all_products, product_prices):
 
 
 def get_synthetic_goals(all_products, product_prices):
-    goals = []
+    """Returns every (product, option combination) goal as a lazy sequence"""
+    templates = []
     cnt_atts = defaultdict(int)
     for product in all_products:
         if "instruction_text" not in product or product["instruction_text"] is None:
             continue
-        product_goals = []
         asin = product["asin"]
         attributes = product["instruction_attributes"]
         assert len(attributes) > 0
@@ -106,42 +203,132 @@ def get_synthetic_goals(all_products, product_prices):
             price_upper = 1000000
             price_text = ""
 
-        instruction_text = product["instruction_text"]
-
         options = product["options"]
         option_names = sorted(options)
-        combinations = list(
-            itertools.product(*(options[option_name] for option_name in option_names))
+        option_values = [list(options[option_name]) for option_name in option_names]
+        num_goals = math.prod(len(values) for values in option_values)
+        if num_goals == 0:
+            continue
+        templates.append(
+            {
+                "asin": asin,
+                "category": product["category"],
+                "query": product["query"],
+                "name": product["name"],
+                "product_category": product["product_category"],
+                "instruction_text": product["instruction_text"],
+                "price_text": price_text,
+                "attributes": attributes,
+                "price_upper": price_upper,
+                "title": product["Title"],
+                "option_names": option_names,
+                "option_values": option_values,
+                "num_goals": num_goals,
+            }
         )
-        for combination in combinations:
-            goal_options = dict()
-            for i, o in enumerate(combination):
-                #                option_text.append(f'{option_names[i]}: {o}')
-                goal_options[option_names[i]] = o
-            option_text = ", and ".join([f"{k}: {v}" for k, v in goal_options.items()])
-            option_text = " with " + option_text if option_text else ""
-            product_goals.append(
-                {
-                    "asin": asin,
-                    "category": product["category"],
-                    "query": product["query"],
-                    "name": product["name"],
-                    "product_category": product["product_category"],
-                    "instruction_text": f"{instruction_text}{option_text}{price_text}",
-                    "attributes": attributes,
-                    "price_upper": price_upper,
-                    "goal_options": goal_options,
-                    "title": product["Title"],
-                }
-            )
-            for att in attributes:
-                cnt_atts[att] += 1
-        goals += product_goals
-    for goal in goals:
-        goal["weight"] = sum(1.0 / cnt_atts[att] for att in goal["attributes"]) / len(
-            goal["attributes"]
+        for att in attributes:
+            cnt_atts[att] += num_goals
+    for template in templates:
+        template["weight"] = sum(
+            1.0 / cnt_atts[att] for att in template["attributes"]
+        ) / len(template["attributes"])
+    return SyntheticGoalSpace(templates)
+
+
+class SyntheticGoalSpace(Sequence):
+    """Synthetic goals decoded on demand from their index
+
+    Goals are numbered product by product. Within a product, the index is
+    read as a mixed-radix number whose digits pick a value for each (sorted)
+    option name, last option fastest, which is the `itertools.product` order.
+    Only one template per product is kept, so memory and startup no longer
+    grow with the number of option combinations.
+    """
+
+    def __init__(self, templates):
+        self.templates = templates
+        self.offsets = [0]
+        for template in templates:
+            self.offsets.append(self.offsets[-1] + template["num_goals"])
+        # Every goal of a product has the product's weight
+        weights = [t["weight"] * t["num_goals"] for t in templates]
+        self._sampler = AliasSampler(weights) if templates else None
+        self._stride, self._shift = 1, 0
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("goal index out of range")
+        return self._decode((self._stride * idx + self._shift) % len(self))
+
+    def _decode(self, goal_id):
+        product_idx = bisect.bisect_right(self.offsets, goal_id) - 1
+        template = self.templates[product_idx]
+        combination = goal_id - self.offsets[product_idx]
+        values = []
+        for option_values in reversed(template["option_values"]):
+            combination, digit = divmod(combination, len(option_values))
+            values.append(option_values[digit])
+        goal_options = dict(zip(template["option_names"], reversed(values)))
+
+        option_text = ", and ".join([f"{k}: {v}" for k, v in goal_options.items()])
+        option_text = " with " + option_text if option_text else ""
+        return {
+            "asin": template["asin"],
+            "category": template["category"],
+            "query": template["query"],
+            "name": template["name"],
+            "product_category": template["product_category"],
+            "instruction_text": (
+                f'{template["instruction_text"]}{option_text}{template["price_text"]}'
+            ),
+            "attributes": template["attributes"],
+            "price_upper": template["price_upper"],
+            "goal_options": goal_options,
+            "title": template["title"],
+            "weight": template["weight"],
+        }
+
+    def shuffle(self, rng=random):
+        """Permute the goal order with an affine map of the index, in O(1) memory"""
+        n = len(self)
+        if n < 2:
+            return
+        stride = rng.randrange(1, n)
+        while math.gcd(stride, n) != 1:
+            stride = rng.randrange(1, n)
+        self._stride, self._shift = stride, rng.randrange(n)
+
+    def sample(self, rng=random):
+        """Draw a goal index with probability proportional to the goal weight"""
+        product_idx = self._sampler.sample(rng)
+        goal_id = self.offsets[product_idx] + rng.randrange(
+            self.templates[product_idx]["num_goals"]
         )
-    return goals
+        # Invert the shuffle to find the position of this goal
+        inverse = pow(self._stride, -1, len(self))
+        return (inverse * (goal_id - self._shift)) % len(self)
+
+    def sample_without_replacement(self, k, rng=random):
+        """Draw `k` distinct goal indices by weight; cost grows with `k` only"""
+        idxs = dict()
+        while len(idxs) < min(k, len(self)):
+            idxs.setdefault(self.sample(rng))
+        return list(idxs)
+
+
+def iter_goal_products(goals):
+    """Yield one goal per product, enough to read the product's goal fields"""
+    if isinstance(goals, SyntheticGoalSpace):
+        yield from goals.templates
+    else:
+        yield from goals
 
 
 def get_type_reward(purchased_product, goal):
@@ -158,22 +345,8 @@ def get_type_reward(purchased_product, goal):
     )
 
     # Determine whether types align based on product name similarity
-    purchased_type = purchased_product["name"]
-    desired_type = goal["name"]
-
-    purchased_type_parse = nlp(purchased_type)
-    desired_type_parse = nlp(desired_type)
-
-    purchased_type_parse = [
-        t.text.lower()
-        for t in purchased_type_parse
-        if t.pos_ in ("PNOUN", "NOUN", "PROPN")
-    ]
-    desired_type_parse = [
-        t.text.lower()
-        for t in desired_type_parse
-        if t.pos_ in ("PNOUN", "NOUN", "PROPN")
-    ]
+    purchased_type_parse = get_product_nouns(purchased_product)
+    desired_type_parse = get_product_nouns(goal)
 
     n_intersect_type = len(set(purchased_type_parse) & set(desired_type_parse))
     if len(desired_type_parse) == 0:
@@ -202,6 +375,58 @@ def get_type_reward(purchased_product, goal):
     )
 
 
+@functools.lru_cache(maxsize=FUZZY_CACHE_SIZE)
+def fuzzy_match(choice, query):
+    """Whether `fuzz.token_set_ratio(choice, query) > 85`, memoized per pair"""
+    return fuzz.token_set_ratio(choice, query) > FUZZY_MATCH_THRESHOLD
+
+
+def match_attribute(p_attr, g_attr):
+    """Whether a product attribute fuzzy-matches a goal attribute"""
+    matches = attribute_match_table.get(g_attr)
+    if matches is not None and p_attr in attribute_match_vocab:
+        return p_attr in matches
+    return fuzzy_match(p_attr, g_attr)
+
+
+def build_attribute_match_table(product_attributes, goals):
+    """Precompute the fuzzy matches of every product and goal attribute pair
+
+    `product_attributes` is the attribute vocabulary of the catalog (the keys
+    of `attribute_to_asins`). Replaces the table of any earlier call.
+    """
+    global attribute_match_table, attribute_match_vocab
+    product_attributes = list(product_attributes)
+    goal_attributes = list(
+        dict.fromkeys(
+            a for goal in iter_goal_products(goals) for a in goal["attributes"]
+        )
+    )
+    matches = _fuzzy_match_matrix(product_attributes, goal_attributes)
+    attribute_match_table = {
+        g_attr: {product_attributes[i] for i in np.flatnonzero(matches[:, j])}
+        for j, g_attr in enumerate(goal_attributes)
+    }
+    attribute_match_vocab = frozenset(product_attributes)
+    print(
+        f"Attribute match table built for {len(product_attributes)} x "
+        f"{len(goal_attributes)} attributes."
+    )
+
+
+def get_fuzzy_match_stats():
+    """Returns hit/miss counts of the fuzzy match memo and the table size"""
+    info = fuzzy_match.cache_info()
+    return dict(
+        hits=info.hits,
+        misses=info.misses,
+        size=info.currsize,
+        maxsize=info.maxsize,
+        table_goal_attributes=len(attribute_match_table),
+        table_product_attributes=len(attribute_match_vocab),
+    )
+
+
 def get_attribute_reward(purchased_product, goal):
     """Determines whether purchased products shares same attributes as goal"""
     purchased_attrs = purchased_product["Attributes"]
@@ -212,8 +437,7 @@ def get_attribute_reward(purchased_product, goal):
         matched = False
         # Check whether goal attribute found in purchased product attribute list
         for p_attr in purchased_attrs:
-            score = fuzz.token_set_ratio(p_attr, g_attr)
-            if score > 85:
+            if match_attribute(p_attr, g_attr):
                 num_attr_matches += 1
                 matched = True
                 break
@@ -239,8 +463,7 @@ def get_option_reward(purchased_options, goal_options):
     num_option_matches = 0
     for g_option in goal_options:
         for p_option in purchased_options:
-            score = fuzz.token_set_ratio(p_option, g_option)
-            if score > 85:
+            if fuzzy_match(p_option, g_option):
                 num_option_matches += 1
                 break
 
@@ -266,6 +489,29 @@ def get_reward(purchased_product, goal, price, options, **kwargs):
         ),
     )
 
+    return _combine_rewards(
+        goal,
+        r_type_dict,
+        r_price,
+        r_att,
+        num_attr_matches,
+        r_option,
+        num_option_matches,
+        kwargs.get("verbose", False),
+    )
+
+
+def _combine_rewards(
+    goal,
+    r_type_dict,
+    r_price,
+    r_att,
+    num_attr_matches,
+    r_option,
+    num_option_matches,
+    verbose=False,
+):
+    """Weigh the reward components into the total (and `info` if verbose)"""
     total_reward = (num_attr_matches + num_option_matches + r_price) / (
         len(goal["attributes"]) + len(goal["goal_options"]) + 1
     )
@@ -273,7 +519,7 @@ def get_reward(purchased_product, goal, price, options, **kwargs):
     total_reward *= r_type_dict["r_type"]
 
     # If verbose flag enabled, store score sub-components into dictionary
-    if kwargs.get("verbose", False):
+    if verbose:
         info = {
             "r_type": r_type_dict["r_type"],
             "r_att": r_att,
@@ -295,3 +541,120 @@ def get_reward(purchased_product, goal, price, options, **kwargs):
             )
         return total_reward, info
     return total_reward
+
+
+def _fuzzy_match_matrix(choices, queries):
+    """Whether `fuzz.token_set_ratio(choice, query) > 85`, for every pair
+
+    Strings go through the same preprocessing and int rounding as `thefuzz`,
+    so the result equals the per-pair loops of the single-reward functions.
+    """
+    matches = np.zeros((len(choices), len(queries)), dtype=bool)
+    if not choices or not queries:
+        return matches
+    queries = [full_process(q, force_ascii=True) for q in queries]
+    for start in range(0, len(choices), FUZZY_CHUNK_SIZE):
+        chunk = [
+            full_process(c, force_ascii=True)
+            for c in choices[start : start + FUZZY_CHUNK_SIZE]
+        ]
+        scores = cdist(
+            chunk, queries, scorer=rapidfuzz_fuzz.token_set_ratio, dtype=np.float64
+        )
+        matches[start : start + len(chunk)] = np.rint(scores) > FUZZY_MATCH_THRESHOLD
+    return matches
+
+
+def get_rewards(episodes, product_item_dict, product_prices, verbose=False):
+    """Score many purchases at once, as `get_reward` would score each of them
+
+    Product texts are lowercased once per ASIN and all fuzzy comparisons of
+    the batch run as a few `rapidfuzz.process.cdist` matrices.
+
+    Arguments:
+
+    episodes -- iterable of (purchased_asin, options, goal), where `options`
+      are the {option_name: value} selected at purchase
+    product_item_dict -- asin -> product, as loaded by `load_products`
+    product_prices -- asin -> price paid
+    verbose (`bool`) -- return (reward, info) pairs instead of rewards
+    """
+    episodes = [
+        (
+            asin,
+            [normalize_color(o) for o in options.values()],
+            [
+                normalize_color(o)
+                for o in (
+                    goal["goal_options"].items()
+                    if isinstance(goal["goal_options"], dict)
+                    else goal["goal_options"]
+                )
+            ],
+            goal,
+        )
+        for asin, options, goal in episodes
+    ]
+    products = {asin: product_item_dict[asin] for asin, _, _, _ in episodes}
+    index_product_nouns({asin: p["name"] for asin, p in products.items()})
+    index_product_nouns({goal["asin"]: goal["name"] for _, _, _, goal in episodes})
+
+    # Attribute matches, one score matrix per purchased product
+    goal_attrs = defaultdict(dict)
+    for asin, _, _, goal in episodes:
+        goal_attrs[asin].update(dict.fromkeys(goal["attributes"]))
+    attr_matches = dict()
+    for asin, attrs in goal_attrs.items():
+        product = products[asin]
+        attrs = list(attrs)
+        texts = (
+            product["Title"].lower(),
+            " ".join(product["BulletPoints"]).lower(),
+            product["Description"].lower(),
+        )
+        matched = _fuzzy_match_matrix(product["Attributes"], attrs).any(axis=0)
+        for g_attr, is_match in zip(attrs, matched):
+            # If not in purchased attrs, check Title, Bullet Points (Features), Desc
+            attr_matches[asin, g_attr] = bool(is_match) or any(
+                g_attr in text for text in texts
+            )
+
+    # Option matches, one score matrix over all distinct options of the batch
+    p_options = list(dict.fromkeys(o for _, opts, _, _ in episodes for o in opts))
+    g_options = list(dict.fromkeys(o for _, _, opts, _ in episodes for o in opts))
+    option_matches = _fuzzy_match_matrix(p_options, g_options)
+    p_option_ids = {o: i for i, o in enumerate(p_options)}
+    g_option_ids = {o: i for i, o in enumerate(g_options)}
+
+    rewards = []
+    for asin, purchased_options, goal_options, goal in episodes:
+        product = products[asin]
+        r_type_dict = get_type_reward(product, goal)
+
+        price = product_prices.get(asin)
+        r_price = (price <= goal["price_upper"]) if goal["price_upper"] > 0 else None
+
+        num_attr_matches = sum(attr_matches[asin, a] for a in goal["attributes"])
+        r_att = num_attr_matches / len(goal["attributes"])
+
+        p_ids = [p_option_ids[o] for o in purchased_options]
+        num_option_matches = sum(
+            bool(option_matches[p_ids, g_option_ids[o]].any()) for o in goal_options
+        )
+        r_option = (
+            num_option_matches / len(goal_options) if len(goal_options) > 0 else None
+        )
+
+        rewards.append(
+            _combine_rewards(
+                goal,
+                r_type_dict,
+                r_price,
+                r_att,
+                num_attr_matches,
+                r_option,
+                num_option_matches,
+                verbose,
+            )
+        )
+    return rewards
@@ -12,8 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import re
-from typing import Tuple
+from typing import Iterable, Optional, Tuple
 
 COLOR_SET = [
     "alabaster",
@@ -168,12 +169,116 @@ SIZE_PATTERNS = [
 SIZE_PATTERNS = [re.compile(s) for s in SIZE_SET] + SIZE_PATTERNS
 
 
+NORMALIZE_CACHE_SIZE = 1 << 16  # memoized distinct option strings
+
+
+def _trie_regex(words):
+    """Regex matching any of `words`, factored by common prefixes
+
+    A word that is a prefix of another is optional, so the longest word
+    starting at a position is the one matched there.
+    """
+    trie = dict()
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, dict())
+        node[""] = dict()
+
+    def emit(node):
+        alts = [re.escape(ch) + emit(child) for ch, child in node.items() if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(trie)
+
+
+# One scan finds the longest COLOR_SET entry starting at every position. The
+# entries matching at a position are all prefixes of that longest one, so
+# `_COLOR_PRIORITY` maps it to the best (lowest) COLOR_SET index among them,
+# and the minimum over positions is what the `COLOR_SET` loop would return.
+_COLOR_REGEX = re.compile(f"(?=({_trie_regex(COLOR_SET)}))")
+_COLOR_PRIORITY = {
+    color: min(i for i, c in enumerate(COLOR_SET) if color.startswith(c))
+    for color in COLOR_SET
+}
+
+# The first SIZE_PATTERNS entry that matches anywhere in the string. Each
+# alternative looks ahead for one pattern from the start, in list order, and
+# closes an empty named group whose name carries the pattern index. This is
+# not a single pass: the string is still rescanned once per pattern until one
+# matches, as in the loop, but inside one `match` call instead of a Python
+# loop of `re.search` calls.
+_SIZE_REGEX = re.compile(
+    r"\A(?:"
+    + "|".join(
+        rf"(?=[\s\S]*?(?:{pattern.pattern}))(?P<p{i}>)"
+        for i, pattern in enumerate(SIZE_PATTERNS)
+    )
+    + ")"
+)
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def match_color(color_string: str) -> Optional[str]:
+    """Returns the first COLOR_SET entry contained in the string, if any"""
+    found = _COLOR_REGEX.findall(color_string)
+    if not found:
+        return None
+    return COLOR_SET[min(_COLOR_PRIORITY[color] for color in found)]
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def match_size(size_string: str) -> Optional[str]:
+    """Returns the first SIZE_PATTERNS pattern found in the string, if any"""
+    m = _SIZE_REGEX.match(size_string)
+    if m is None:
+        return None
+    return SIZE_PATTERNS[int(m.lastgroup[1:])].pattern
+
+
 def normalize_color(color_string: str) -> str:
     """Extracts the first color found if exists"""
-    for norm_color in COLOR_SET:
-        if norm_color in color_string:
-            return norm_color
-    return color_string
+    if not isinstance(color_string, str):
+        # e.g. (option name, value) goal options: membership, not substrings
+        for norm_color in COLOR_SET:
+            if norm_color in color_string:
+                return norm_color
+        return color_string
+    norm_color = match_color(color_string)
+    return color_string if norm_color is None else norm_color
+
+
+def normalize_colors(color_strings: Iterable[str]) -> dict:
+    """Maps every distinct color string to its COLOR_SET entry
+
+    Colors no entry is found in map to "not_matched".
+    """
+    color_mapping = dict()
+    for c in set(color_strings):
+        norm_color = match_color(c)
+        color_mapping[c] = "not_matched" if norm_color is None else norm_color
+    return color_mapping
+
+
+def normalize_sizes(size_strings: Iterable[str]) -> dict:
+    """Maps every distinct size string to its SIZE_PATTERNS pattern
+
+    Sizes no pattern matches map to "numeric_size" if they are numbers and to
+    "not_matched" otherwise.
+    """
+    size_mapping = dict()
+    for s in set(size_strings):
+        pattern = match_size(s)
+        if pattern is not None:
+            size_mapping[s] = pattern
+        elif s.replace(".", "", 1).isdigit():
+            size_mapping[s] = "numeric_size"
+        else:
+            size_mapping[s] = "not_matched"
+    return size_mapping
 
 
 def normalize_color_size(product_prices: dict) -> Tuple[dict, dict]:
@@ -187,31 +292,10 @@ def normalize_color_size(product_prices: dict) -> Tuple[dict, dict]:
 
     # Create mapping of each original color value to corresponding set value
     color_mapping = {"N.A.": "not_matched"}
-    for c in all_colors:
-        matched = False
-        for base in COLOR_SET:
-            if base in c:
-                color_mapping[c] = base
-                matched = True
-                break
-        if not matched:
-            color_mapping[c] = "not_matched"
+    color_mapping.update(normalize_colors(all_colors))
 
     # Create mapping of each original size value to corresponding set value
     size_mapping = {"N.A.": "not_matched"}
-    for s in all_sizes:
-        matched = False
-        for pattern in SIZE_PATTERNS:
-            m = re.search(pattern, s)
-            if m is not None:
-                matched = True
-                size_mapping[s] = pattern.pattern
-                break
-        if not matched:
-            if s.replace(".", "", 1).isdigit():
-                size_mapping[s] = "numeric_size"
-                matched = True
-        if not matched:
-            size_mapping[s] = "not_matched"
+    size_mapping.update(normalize_sizes(all_sizes))
 
     return color_mapping, size_mapping
@@ -0,0 +1,325 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pages served by `SimServer`, with a direct text renderer.
+
+A `Page` keeps the action and template arguments of a response and renders
+its HTML only when it is read. For the simple text observation and the list
+of clickables it doesn't need the HTML at all: `render_text` and
+`get_clickables` walk the same data as the templates and emit what
+`WebAgentTextEnv.convert_html_to_text(html, simple=True)` and
+`WebAgentTextEnv.get_available_actions` recover from the HTML parsed with
+'html.parser', text node by text node.
+
+The text renderers mirror the templates in `templates/`; a change to the
+visible text or buttons of a template needs the same change here.
+"""
+
+from copy import copy
+from pprint import pformat
+
+from jinja2.utils import htmlsafe_json_dumps
+
+from .engine import ACTION_TO_TEMPLATE, END_BUTTON, map_action_to_html, parse_action
+
+# Characters BeautifulSoup treats as whitespace when collapsing text nodes
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+SEP = " [SEP] "
+# Classes of the buttons on the pages; `get_available_actions` finds them by "btn"
+SUCCESS_BUTTON = ["btn", "btn-success"]
+PRIMARY_BUTTON = ["btn", "btn-primary"]
+PURCHASE_BUTTON = ["btn", "btn-lg", "purchase"]
+
+_undefined = object()
+
+
+def _getattr(obj, name):
+    """Jinja's `obj.name` lookup: attribute first, then item"""
+    try:
+        return getattr(obj, name)
+    except AttributeError:
+        pass
+    try:
+        return obj[name]
+    except (TypeError, LookupError):
+        return _undefined
+
+
+def _str(value):
+    """Jinja's output of `{{ value }}` before escaping"""
+    return "" if value is _undefined else str(value)
+
+
+def _iter(value):
+    return () if value is _undefined else value
+
+
+def _string(text, pre=False):
+    """The string BeautifulSoup stores for the text between two tags
+
+    Returns None when there is no text node. Outside `<pre>`, whitespace-only
+    text is collapsed to a newline or a single space.
+    """
+    if not text:
+        return None
+    if not pre and not text.strip(ASCII_SPACES):
+        return "\n" if "\n" in text else " "
+    return text
+
+
+class _TextBuilder:
+    """Collects the visible text nodes of a page like `convert_html_to_text`"""
+
+    def __init__(self):
+        self.parts = []
+
+    def add(self, text, pre=False):
+        text = _string(text, pre)
+        if text is not None and text != "\n":
+            self.parts.append(text.strip())
+
+    def add_instruction(self, instruction_text, prefix="Instruction:"):
+        self.add(prefix)
+        self.add(_str(instruction_text))
+
+    def text(self):
+        return SEP.join(self.parts)
+
+
+def _text_search_page(kwargs):
+    builder = _TextBuilder()
+    builder.add("WebShop")
+    builder.add_instruction(kwargs["instruction_text"], prefix="Instruction: ")
+    builder.add("Search")
+    return builder.text()
+
+
+def _text_results_page(kwargs):
+    builder = _TextBuilder()
+    builder.add_instruction(kwargs["instruction_text"])
+    builder.add("Back to Search")
+    builder.add(f"Page {_str(kwargs['page'])} (Total results: {_str(kwargs['total'])})")
+    if kwargs["page"] > 1:
+        builder.add("< Prev")
+    builder.add("Next >")
+    for item in kwargs["products"]:
+        builder.add(_str(_getattr(item, "asin")))
+        builder.add(_str(_getattr(item, "Title")))
+        builder.add(_str(_getattr(item, "Price")))
+    return builder.text()
+
+
+def _text_item_page(kwargs):
+    product_info = kwargs["product_info"]
+    builder = _TextBuilder()
+    builder.add_instruction(kwargs.get("instruction_text"))
+    builder.add("Back to Search")
+    builder.add("< Prev")
+    for option_name, option_contents in product_info["options"].items():
+        builder.add(_str(option_name))
+        for option_content in option_contents:
+            builder.add(_str(option_content))
+    builder.add(_str(_getattr(product_info, "Title")))
+    builder.add(f"Price: {_str(_getattr(product_info, 'Price'))}")
+    builder.add(f"Rating: {_str(_getattr(product_info, 'Rating'))}")
+    for sub_page in ("Description", "Features", "Reviews"):
+        builder.add(sub_page)
+    if kwargs["show_attrs"]:
+        builder.add("Attributes")
+    builder.add(END_BUTTON)
+    return builder.text()
+
+
+def _text_sub_page(sub_page, kwargs):
+    product_info = kwargs["product_info"]
+    builder = _TextBuilder()
+    builder.add_instruction(kwargs.get("instruction_text"))
+    builder.add("Back to Search")
+    builder.add("< Prev")
+    if sub_page == "Description":
+        builder.add(_str(_getattr(product_info, "Description")))
+    elif sub_page == "Features":
+        for bulletpoint in _iter(_getattr(product_info, "BulletPoints")):
+            builder.add(f" {_str(bulletpoint)}")
+    elif sub_page == "Reviews":
+        for review in _iter(_getattr(product_info, "Reviews")):
+            builder.add(f'"{_str(_getattr(review, "title"))}"')
+            builder.add(_str(_getattr(review, "score")))
+            builder.add(_str(_getattr(review, "body")))
+    elif sub_page == "Attributes":
+        for attribute in _iter(_getattr(product_info, "Attributes")):
+            builder.add(f" {_str(attribute)}")
+        for name in ("category", "query", "product_category"):
+            builder.add(_str(_getattr(product_info, name)))
+    return builder.text()
+
+
+def _text_done_page(kwargs):
+    goal = kwargs.get("goal")
+    purchased = [
+        ("asin", kwargs["asin"]),
+        ("options", htmlsafe_json_dumps(kwargs["options"], sort_keys=True)),
+        ("attrs", kwargs.get("purchased_attrs")),
+        ("category", kwargs.get("category")),
+        ("query", kwargs.get("query")),
+        ("product category", kwargs.get("product_category")),
+    ]
+    target = [
+        ("asin", _getattr(goal, "asin")),
+        ("options", _getattr(goal, "goal_options")),
+        ("attrs", _getattr(goal, "attributes")),
+        ("price upper", _getattr(goal, "price_upper")),
+        ("instuction text", _getattr(goal, "instruction_text")),
+        ("category", _getattr(goal, "category")),
+        ("product category", _getattr(goal, "product_category")),
+        ("query", _getattr(goal, "query")),
+        ("Goal ", pformat(goal)),
+    ]
+    builder = _TextBuilder()
+    builder.add("Thank you for shopping with us!")
+    builder.add("Your code: ")
+    builder.add(_str(kwargs.get("mturk_code")), pre=True)
+    builder.add(" (Paste it in your MTurk interface.)")
+    for heading, fields in (("Purchased", purchased), ("Target", target)):
+        builder.add(heading)
+        for label, value in fields:
+            builder.add(label)
+            builder.add(_str(value), pre=True)
+    builder.add("Reward")
+    builder.add("Your score (min 0.0, max 1.0)")
+    builder.add(_str(kwargs["reward"]), pre=True)
+    builder.add("Reward Details ")
+    builder.add(pformat(kwargs.get("reward_info")), pre=True)
+    return builder.text()
+
+
+def render_text(action, **kwargs):
+    """Returns the simple text observation of the page `map_action_to_html` renders"""
+    action_name, action_arg = parse_action(action)
+    if action_name == "start":
+        return _text_search_page(kwargs)
+    elif action_name == "search":
+        return _text_results_page(kwargs)
+    elif action_name == "click" and action_arg == END_BUTTON:
+        return _text_done_page(kwargs)
+    elif action_name == "click" and action_arg in ACTION_TO_TEMPLATE:
+        return _text_sub_page(action_arg, kwargs)
+    elif action_name == "click":
+        return _text_item_page(kwargs)
+    else:
+        raise ValueError("Action name not recognized.")
+
+
+def _button(text, classes):
+    return text, {"class": classes, "type": "submit"}
+
+
+def get_clickables(action, **kwargs):
+    """Returns `(has_search_bar, text_to_clickable)` of the page `action` renders
+
+    Matches `get_available_actions` on the parsed HTML: buttons, then product
+    links, keyed by their lowercased text, then option radio buttons keyed by
+    their value. The clickables are dicts of the attributes the server reads
+    (`class`, `name`) in place of BeautifulSoup tags.
+    """
+    action_name, action_arg = parse_action(action)
+    has_search_bar = False
+    links = []
+    radios = []
+    if action_name == "start":
+        has_search_bar = True
+        buttons = [_button("Search", SUCCESS_BUTTON)]
+    elif action_name == "search":
+        buttons = [_button("Back to Search", SUCCESS_BUTTON)]
+        if kwargs["page"] > 1:
+            buttons.append(_button("< Prev", PRIMARY_BUTTON))
+        buttons.append(_button("Next >", PRIMARY_BUTTON))
+        for item in kwargs["products"]:
+            text = _string(_str(_getattr(item, "asin"))) or ""
+            links.append((text, {"class": ["product-link"]}))
+    elif action_name == "click" and action_arg == END_BUTTON:
+        buttons = []
+    elif action_name == "click" and action_arg in ACTION_TO_TEMPLATE:
+        buttons = [
+            _button("Back to Search", SUCCESS_BUTTON),
+            _button("< Prev", PRIMARY_BUTTON),
+        ]
+    elif action_name == "click":
+        buttons = [
+            _button("Back to Search", SUCCESS_BUTTON),
+            _button("< Prev", PRIMARY_BUTTON),
+        ]
+        sub_pages = ["Description", "Features", "Reviews"]
+        if kwargs["show_attrs"]:
+            sub_pages.append("Attributes")
+        buttons.extend(_button(sub_page, PRIMARY_BUTTON) for sub_page in sub_pages)
+        buttons.append(_button(END_BUTTON, PURCHASE_BUTTON))
+        for option_name, option_contents in kwargs["product_info"]["options"].items():
+            for option_content in option_contents:
+                value = _str(option_content)
+                radio = {"type": "radio", "name": _str(option_name), "value": value}
+                radios.append((value, radio))
+    else:
+        raise ValueError("Action name not recognized.")
+
+    text_to_clickable = {text.lower(): clickable for text, clickable in buttons + links}
+    text_to_clickable.update(radios)
+    return has_search_bar, text_to_clickable
+
+
+class Page:
+    """A page served by `SimServer`, rendered to HTML only when it is read
+
+    Arguments are the ones of `map_action_to_html`. The session keywords and
+    options are copied, so a later action can't change a page already served.
+    """
+
+    def __init__(self, action, **kwargs):
+        for key in ("keywords", "options"):
+            if kwargs.get(key) is not None:
+                kwargs[key] = copy(kwargs[key])
+        self.action = action
+        self.kwargs = kwargs
+        self._html = None
+        self._text = None
+        self._clickables = None
+
+    def render(self):
+        """Returns the page HTML, rendering it on first use"""
+        if self._html is None:
+            self._html = map_action_to_html(self.action, **self.kwargs)
+        return self._html
+
+    @property
+    def html(self):
+        return self.render()
+
+    @property
+    def text(self):
+        """Simple text observation of the page, without rendering HTML"""
+        if self._text is None:
+            self._text = render_text(self.action, **self.kwargs)
+        return self._text
+
+    def get_clickables(self):
+        if self._clickables is None:
+            self._clickables = get_clickables(self.action, **self.kwargs)
+        return self._clickables
+
+    @property
+    def instruction_text(self):
+        """Text of the search page's instruction header, None on other pages"""
+        if parse_action(self.action)[0] != "start":
+            return None
+        return "Instruction: " + (_string(_str(self.kwargs["instruction_text"])) or "")
@@ -0,0 +1,113 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Weighted sampling of goal indices.
+
+- `AliasSampler` draws an index in O(1) after an O(n) Vose alias table build,
+  one at a time from a `random.Random` or in batches from a NumPy `Generator`.
+- `sample_without_replacement` picks `k` distinct indices by weight in one
+  vectorized pass (Efraimidis-Spirakis keys).
+- `session_rng` derives a reproducible RNG stream per session from a seed, so
+  a session's draws don't depend on what other sessions or libraries did with
+  the global `random` state.
+"""
+
+import random
+
+import numpy as np
+
+DEFAULT_SEED = 233
+
+
+def build_alias_table(weights):
+    """Build a Vose alias table: returns `(prob, alias)` NumPy arrays
+
+    To sample, pick a column `i` uniformly, keep it with probability
+    `prob[i]`, otherwise take `alias[i]`.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    n = len(weights)
+    if n == 0 or weights.sum() <= 0:
+        raise ValueError("Cannot sample from empty or all-zero weights.")
+    scaled = weights * (n / weights.sum())
+    prob = np.ones(n)
+    alias = np.arange(n)
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+    while small and large:
+        lo, hi = small.pop(), large.pop()
+        prob[lo], alias[lo] = scaled[lo], hi
+        scaled[hi] -= 1.0 - scaled[lo]
+        (small if scaled[hi] < 1.0 else large).append(hi)
+    # Leftovers are 1 up to rounding error and keep prob 1
+    return prob, alias
+
+
+class AliasSampler:
+    """O(1) sampling of indices with probability proportional to `weights`"""
+
+    def __init__(self, weights):
+        self.prob, self.alias = build_alias_table(weights)
+        # Python lists are faster than NumPy scalars for single draws
+        self._prob = self.prob.tolist()
+        self._alias = self.alias.tolist()
+
+    def __len__(self):
+        return len(self._prob)
+
+    def sample(self, rng=random):
+        """Draw one index using a `random.Random`-like `rng`"""
+        i = rng.randrange(len(self._prob))
+        return i if rng.random() < self._prob[i] else self._alias[i]
+
+    def sample_batch(self, size, rng=None):
+        """Draw `size` indices at once using a NumPy `Generator`"""
+        if rng is None:
+            rng = np.random.default_rng()
+        columns = rng.integers(len(self._prob), size=size)
+        keep = rng.random(size) < self.prob[columns]
+        return np.where(keep, columns, self.alias[columns])
+
+
+def sample_without_replacement(weights, k, rng=None):
+    """Pick `k` distinct indices, each draw proportional to the remaining weights
+
+    Uses Efraimidis-Spirakis keys `log(u) / w` and keeps the `k` largest, which
+    has the same distribution as repeatedly drawing by weight and discarding
+    repeats. Indices are returned in draw order (largest key first). Indices of
+    zero weight are never drawn, so fewer than `k` may be returned.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    weights = np.asarray(weights, dtype=np.float64)
+    k = min(k, np.count_nonzero(weights > 0))
+    if k <= 0:
+        return []
+    with np.errstate(divide="ignore"):
+        keys = np.log(rng.random(len(weights))) / weights
+    top = np.argpartition(-keys, k - 1)[:k]
+    return top[np.argsort(-keys[top])].tolist()
+
+
+def session_rng(session_id, seed=DEFAULT_SEED):
+    """Returns a `random.Random` stream that only depends on the seed and session"""
+    # String seeds are hashed with SHA-512, so streams are stable across runs
+    return random.Random(f"{seed}:{session_id}")
+
+
+def numpy_rng(seed=DEFAULT_SEED, stream=None):
+    """Returns a NumPy `Generator` for `seed`, optionally an independent substream"""
+    if stream is None:
+        return np.random.default_rng(seed)
+    return np.random.default_rng(random.Random(f"{seed}:{stream}").getrandbits(128))
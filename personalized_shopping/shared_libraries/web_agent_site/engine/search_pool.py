@@ -0,0 +1,354 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Process-wide registry of warm `LuceneSearcher` instances.
+
+Booting the JVM and loading the Anserini classes dominates the first search of
+a process, so searchers are opened once per index path and shared by every
+`SimServer`. `prewarm` pays that cost ahead of the first agent turn and
+records how long each stage took.
+
+Search runs on one of two backends, chosen by `WEBSHOP_SEARCH_BACKEND`:
+"lucene" (Pyserini) or "bm25", the in-process `BM25Searcher` of `bm25.py`
+over a memory-mapped `bm25_<size>.npz` index (see
+`search_engine/build_bm25_index.py`), which needs no JVM and ranks like
+Lucene. The default is "lucene"; BM25 is only used when asked for, either
+explicitly or with "auto", which picks it when the index serving the requested
+catalog size has been built (`bm25_all.npz` or the exact-size one). The
+backend in use is printed when it is first chosen.
+
+When the full catalog index `indexes_all` is built (with its docid -> rank
+table, see `search_engine/build_docid_table.py`), every catalog size is served
+by it: `get_search_engine(num_products)` wraps the shared searcher in a
+`RankFilteredSearcher` that only returns the first `num_products` products of
+the catalog. Without it, the exact-size indexes are used as before.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+import numpy as np
+from rich import print
+
+from ..utils import BASE_DIR
+from .bm25 import BM25Searcher
+
+WARMUP_QUERY = "shoes"
+# Written by search_engine/build_docid_table.py
+DOCID_TABLE_NAME = "docid_to_asin.npy"
+RANK_TABLE_NAME = "docid_to_rank.npy"
+
+SEARCH_ENGINE_DIR = os.path.normpath(os.path.join(BASE_DIR, "../search_engine"))
+FULL_INDEX = "indexes_all"  # whole catalog, filtered by rank at query time
+SIZE_INDEXES = {
+    100: "indexes_100",
+    1000: "indexes_1k",
+    10000: "indexes_10k",
+    50000: "indexes_50k",
+}
+DEFAULT_NUM_PRODUCTS = 1000  # served when no size is given and there is no full index
+# BM25 backend indexes, written by search_engine/build_bm25_index.py
+BM25_FULL_INDEX = "bm25_all.npz"
+BM25_SIZE_INDEXES = {
+    100: "bm25_100.npz",
+    1000: "bm25_1k.npz",
+    10000: "bm25_10k.npz",
+    50000: "bm25_50k.npz",
+}
+SEARCH_BACKENDS = ("auto", "lucene", "bm25")
+DEFAULT_SEARCH_BACKEND = "lucene"
+ID_FIELD = "id"  # Lucene field holding the ASIN of a document
+CONTENTS_FIELD = "contents"
+
+_searchers = dict()
+_filtered_searchers = dict()
+_docid_tables = dict()
+_rank_tables = dict()
+_lock = threading.Lock()
+_timings = {"jvm_boot": None, "index_open": dict(), "first_query": dict()}
+_lucene_searcher_cls = None
+_reported_backends = set()
+
+
+def has_full_index(backend="lucene"):
+    if backend == "bm25":
+        return os.path.exists(os.path.join(SEARCH_ENGINE_DIR, BM25_FULL_INDEX))
+    return os.path.exists(os.path.join(SEARCH_ENGINE_DIR, FULL_INDEX, RANK_TABLE_NAME))
+
+
+def _has_bm25_index(num_products=None):
+    """Returns whether a BM25 index can serve a catalog of `num_products`"""
+    if has_full_index("bm25"):
+        return True
+    if num_products is None:
+        num_products = DEFAULT_NUM_PRODUCTS
+    name = BM25_SIZE_INDEXES.get(num_products)
+    return name is not None and os.path.exists(os.path.join(SEARCH_ENGINE_DIR, name))
+
+
+def get_search_backend(num_products=None):
+    """Returns "lucene" or "bm25", as set by `WEBSHOP_SEARCH_BACKEND`
+
+    "lucene" is the default; "auto" picks "bm25" only when a BM25 index serves
+    `num_products`.
+    """
+    setting = os.environ.get("WEBSHOP_SEARCH_BACKEND", DEFAULT_SEARCH_BACKEND)
+    setting = setting.lower()
+    if setting not in SEARCH_BACKENDS:
+        raise ValueError(
+            f"WEBSHOP_SEARCH_BACKEND must be one of {SEARCH_BACKENDS}, not {setting!r}."
+        )
+    backend = setting
+    if setting == "auto":
+        backend = "bm25" if _has_bm25_index(num_products) else "lucene"
+    if (setting, backend) not in _reported_backends:
+        _reported_backends.add((setting, backend))
+        print(f"Search backend: {backend} (WEBSHOP_SEARCH_BACKEND={setting}).")
+    return backend
+
+
+def get_index_path(num_products=None, backend=None):
+    """Returns the index serving a catalog of `num_products` on `backend`
+
+    This is the full catalog index when it has been built; any `num_products`
+    is then served by filtering it (see `get_search_engine`). Lucene indexes
+    are directories, BM25 indexes `.npz` files.
+    """
+    backend = backend or get_search_backend(num_products)
+    full_index, size_indexes = FULL_INDEX, SIZE_INDEXES
+    if backend == "bm25":
+        full_index, size_indexes = BM25_FULL_INDEX, BM25_SIZE_INDEXES
+    if has_full_index(backend):
+        indexes = full_index
+    elif num_products is None:
+        indexes = size_indexes[DEFAULT_NUM_PRODUCTS]
+    elif num_products in size_indexes:
+        indexes = size_indexes[num_products]
+    else:
+        raise NotImplementedError(
+            f"num_products being {num_products} needs the full catalog index "
+            f"{full_index} (see search_engine/run_indexing.sh)."
+        )
+    return os.path.join(SEARCH_ENGINE_DIR, indexes)
+
+
+def _get_lucene_searcher_cls():
+    """Import pyserini on first use; the import is what boots the JVM"""
+    global _lucene_searcher_cls
+    if _lucene_searcher_cls is None:
+        start = time.time()
+        from pyserini.search.lucene import LuceneSearcher
+
+        _timings["jvm_boot"] = time.time() - start
+        _lucene_searcher_cls = LuceneSearcher
+    return _lucene_searcher_cls
+
+
+def get_searcher(index_path):
+    """Returns the shared searcher for `index_path`, opening it on first use"""
+    index_path = os.path.abspath(index_path)
+    searcher = _searchers.get(index_path)
+    if searcher is not None:
+        return searcher
+    with _lock:
+        if index_path not in _searchers:
+            if index_path.endswith(".npz"):
+                start = time.time()
+                _searchers[index_path] = BM25Searcher(index_path)
+                _timings["index_open"][index_path] = time.time() - start
+                return _searchers[index_path]
+            searcher_cls = _get_lucene_searcher_cls()
+            start = time.time()
+            searcher = searcher_cls(index_path)
+            _timings["index_open"][index_path] = time.time() - start
+            table = _load_table(index_path, DOCID_TABLE_NAME, searcher.num_docs)
+            if table is not None:
+                _docid_tables[id(searcher)] = table
+            table = _load_table(index_path, RANK_TABLE_NAME, searcher.num_docs)
+            if table is not None:
+                _rank_tables[id(searcher)] = table
+            _searchers[index_path] = searcher
+        return _searchers[index_path]
+
+
+def _load_table(index_path, table_name, num_docs):
+    """Memory-map a per-docid table of an index if it is present and current"""
+    table_path = os.path.join(index_path, table_name)
+    if not os.path.exists(table_path):
+        return None
+    table = np.load(table_path, mmap_mode="r")
+    if len(table) != num_docs:
+        # The index was rebuilt after the table; fall back to stored docids
+        print(f"Ignoring stale {table_path} ({len(table)} != {num_docs} docs).")
+        return None
+    return table
+
+
+def get_docid_table(search_engine):
+    """Returns the docid -> ASIN table of a registry searcher, or None"""
+    return _docid_tables.get(id(search_engine))
+
+
+def _autoclass(name):
+    """Java class `name`; pyserini is imported on use as it boots the JVM"""
+    from pyserini.pyclass import autoclass
+
+    return autoclass(name)
+
+
+def get_filter_docids(rank_table, num_products):
+    """Returns `(exclude, docids)` of the smaller side of the rank cut
+
+    The docids ranked below `num_products` if they are at most half of the
+    index (`exclude` is False), otherwise the ones ranked at or above it.
+    """
+    in_catalog = np.asarray(rank_table) < num_products
+    if 2 * np.count_nonzero(in_catalog) <= len(in_catalog):
+        return False, np.flatnonzero(in_catalog)
+    return True, np.flatnonzero(~in_catalog)
+
+
+class RankFilteredSearcher:
+    """A shared searcher restricted to the first `num_products` of the catalog
+
+    Queries are the searcher's bag-of-words query with a filter clause on the
+    ASINs ranked below `num_products`, so scoring and `k` behave as on an
+    index holding only those products (BM25 statistics are the full
+    catalog's). The filter is built when the searcher is created, which
+    `get_search_engine` (and so `prewarm`) does, never on a query; when it
+    would list more than half of the catalog, the ASINs ranked at or above
+    `num_products` are excluded instead.
+    """
+
+    def __init__(self, searcher, num_products):
+        from pyserini.analysis import get_lucene_analyzer
+
+        rank_table = _rank_tables.get(id(searcher))
+        docid_table = _docid_tables.get(id(searcher))
+        if rank_table is None or docid_table is None:
+            raise ValueError(
+                "Filtering by num_products needs the docid -> ASIN and rank tables "
+                "of the index (build_docid_table.py --collection)."
+            )
+        self.searcher = searcher
+        self.num_products = num_products
+        self.num_docs = min(num_products, searcher.num_docs)
+        # The searcher's own analyzer and query generator for string queries
+        self._analyzer = get_lucene_analyzer()
+        self._query_generator = _autoclass(
+            "io.anserini.search.query.BagOfWordsQueryGenerator"
+        )()
+        self._boolean_query_builder = _autoclass(
+            "org.apache.lucene.search.BooleanQuery$Builder"
+        )
+        self._occur = _autoclass("org.apache.lucene.search.BooleanClause$Occur")
+        self._filter = self._build_filter(docid_table, rank_table)
+
+    def _build_filter(self, docid_table, rank_table):
+        """Returns `(occur, query)` of the ASIN set clause"""
+        exclude, docids = get_filter_docids(rank_table, self.num_products)
+        occur = self._occur.MUST_NOT if exclude else self._occur.FILTER
+        terms = _autoclass("java.util.ArrayList")()
+        bytes_ref = _autoclass("org.apache.lucene.util.BytesRef")
+        for asin in docid_table[docids]:
+            terms.add(bytes_ref(bytes(asin)))  # the table holds ASCII bytes
+        query = _autoclass("org.apache.lucene.search.TermInSetQuery")(ID_FIELD, terms)
+        return occur, query
+
+    def build_query(self, q):
+        """The Lucene query of `q` restricted to the first `num_products`"""
+        occur, filter_query = self._filter
+        builder = self._boolean_query_builder()
+        builder.add(
+            self._query_generator.buildQuery(CONTENTS_FIELD, self._analyzer, q),
+            self._occur.MUST,
+        )
+        builder.add(filter_query, occur)
+        return builder.build()
+
+    def search(self, q, k=10):
+        return self.searcher.search(self.build_query(q), k=k)
+
+    def batch_search(self, queries, qids, k=10, threads=1):
+        """Run the filtered queries on up to `threads` threads
+
+        Pyserini only batches query strings (through a Java `QueryGenerator`,
+        which can't be subclassed from Python), so the Lucene queries go
+        through `search` on a thread pool instead.
+        """
+        threads = min(threads, len(queries))
+        if threads <= 1:
+            return {qid: self.search(q, k=k) for q, qid in zip(queries, qids)}
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return dict(zip(qids, executor.map(lambda q: self.search(q, k=k), queries)))
+
+
+def get_search_engine(num_products=None):
+    """Returns the shared searcher serving a catalog of `num_products`
+
+    On the full catalog index, a size smaller than the catalog gets a shared
+    `RankFilteredSearcher` (or a restricted `BM25Searcher`); on an exact-size
+    index the searcher itself.
+    """
+    searcher = get_searcher(get_index_path(num_products))
+    if num_products is None or num_products >= searcher.num_docs:
+        return searcher
+    key = (id(searcher), num_products)
+    search_engine = _filtered_searchers.get(key)
+    if search_engine is not None:
+        return search_engine
+    with _lock:
+        if key not in _filtered_searchers:
+            if isinstance(searcher, BM25Searcher):
+                # Its documents are in catalog order, hits carry their ASIN
+                search_engine = searcher.restrict(num_products)
+            else:
+                search_engine = RankFilteredSearcher(searcher, num_products)
+                _docid_tables[id(search_engine)] = _docid_tables[id(searcher)]
+            _filtered_searchers[key] = search_engine
+        return _filtered_searchers[key]
+
+
+def prewarm(num_products=None, index_path=None):
+    """Boot the JVM (Lucene backend), open the index and run a first query"""
+    if index_path is None:
+        index_path = get_index_path(num_products)
+        searcher = get_search_engine(num_products)
+    else:
+        searcher = get_searcher(index_path)
+    index_path = os.path.abspath(index_path)
+    if index_path not in _timings["first_query"]:
+        start = time.time()
+        searcher.search(WARMUP_QUERY, k=1)
+        _timings["first_query"][index_path] = time.time() - start
+        print(f"Search engine warmed up: {get_searcher_timings(index_path)}")
+    return searcher
+
+
+def get_searcher_timings(index_path=None):
+    """Returns the recorded JVM boot, index open and first query times (seconds)"""
+    if index_path is None:
+        return {
+            "jvm_boot": _timings["jvm_boot"],
+            "index_open": dict(_timings["index_open"]),
+            "first_query": dict(_timings["first_query"]),
+        }
+    index_path = os.path.abspath(index_path)
+    return {
+        "jvm_boot": _timings["jvm_boot"],
+        "index_open": _timings["index_open"].get(index_path),
+        "first_query": _timings["first_query"].get(index_path),
+    }
@@ -0,0 +1,226 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bounded store for the per-session state of a `SimServer`.
+
+Sessions are kept in least-recently-used order. A session is evicted when the
+store grows past `maxsize` or when it has not been touched for `ttl` seconds;
+only `store[session_id]` and assignments touch a session, `in` and `get` peek.
+Finished sessions (`done=True`) can be spilled to an append-only JSONL log as
+they leave the store, so episodes remain available for later analysis, and an
+`on_evict` callback lets owners of per-session state drop theirs too.
+"""
+
+from collections import OrderedDict
+from collections.abc import MutableMapping
+import json
+import sys
+import threading
+import time
+
+from rich import print
+
+SESSION_STORE_SIZE = 10000  # live sessions kept per server
+SESSION_TTL = None  # seconds of inactivity before a session expires
+
+# Session fields written to the spill log
+SPILL_FIELDS = ("asin", "options", "actions", "reward", "verbose_info")
+SPILL_GOAL_FIELDS = ("asin", "instruction_text", "attributes", "goal_options")
+
+_MISSING = object()
+
+
+def _json_default(obj):
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return str(obj)
+
+
+def _deep_sizeof(obj, seen):
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(
+            _deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(v, seen) for v in obj)
+    return size
+
+
+class SessionStore(MutableMapping):
+    """`user_sessions` mapping with LRU and TTL eviction"""
+
+    def __init__(
+        self,
+        maxsize=SESSION_STORE_SIZE,
+        ttl=SESSION_TTL,
+        spill_path=None,
+        on_evict=None,
+    ):
+        """
+        Arguments:
+
+        maxsize (`int`) -- Maximum number of live sessions (None for no limit)
+        ttl (`float`) -- Seconds a session may stay untouched (None to disable)
+        spill_path (`str`) -- JSONL file finished sessions are appended to when
+          they are evicted
+        on_evict (`func`) -- Called with the id of every session evicted by
+          size or age (not on `del`), after the store's lock is released
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.spill_path = spill_path
+        self.on_evict = on_evict
+        self.evicted = 0
+        self.expired = 0
+        self.spilled = 0
+        self._sessions = OrderedDict()  # session_id -> (last access, session)
+        self._lock = threading.RLock()
+
+    def _is_expired(self, last_access, now):
+        return self.ttl is not None and now - last_access > self.ttl
+
+    def __getitem__(self, session_id):
+        now = time.time()
+        with self._lock:
+            last_access, session = self._sessions[session_id]
+            expired = self._is_expired(last_access, now)
+            if expired:
+                self._evict(session_id, expired=True)
+            else:
+                self._sessions[session_id] = (now, session)
+                self._sessions.move_to_end(session_id)
+        if expired:
+            self._notify_evicted([session_id])
+            raise KeyError(session_id)
+        return session
+
+    def __contains__(self, session_id):
+        return self.get(session_id, _MISSING) is not _MISSING
+
+    def get(self, session_id, default=None):
+        """Returns a live session without refreshing its LRU position or TTL
+
+        Like `in`, this is a read-only peek: only `store[session_id]` counts
+        as an access.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        if entry is None or self._is_expired(entry[0], now):
+            return default
+        return entry[1]
+
+    def __setitem__(self, session_id, session):
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = (now, session)
+            self._sessions.move_to_end(session_id)
+            evicted = self._evict_expired(now)
+            while self.maxsize is not None and len(self._sessions) > self.maxsize:
+                evicted.append(next(iter(self._sessions)))
+                self._evict(evicted[-1])
+        self._notify_evicted(evicted)
+
+    def __delitem__(self, session_id):
+        with self._lock:
+            if session_id not in self._sessions:
+                raise KeyError(session_id)
+            self._evict(session_id, counted=False)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._sessions))
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def evict_expired(self, now=None):
+        """Drop sessions idle for longer than `ttl`; least recently used go first"""
+        with self._lock:
+            evicted = self._evict_expired(time.time() if now is None else now)
+        self._notify_evicted(evicted)
+
+    def _evict_expired(self, now):
+        evicted = []
+        if self.ttl is None:
+            return evicted
+        while self._sessions:
+            session_id, (last_access, _) = next(iter(self._sessions.items()))
+            if not self._is_expired(last_access, now):
+                break
+            self._evict(session_id, expired=True)
+            evicted.append(session_id)
+        return evicted
+
+    def _notify_evicted(self, session_ids):
+        # Outside the lock, so the callback may take locks of its own
+        if self.on_evict is not None:
+            for session_id in session_ids:
+                self.on_evict(session_id)
+
+    def _evict(self, session_id, expired=False, counted=True):
+        _, session = self._sessions.pop(session_id)
+        if counted:
+            self.evicted += 1
+            self.expired += expired
+        if self.spill_path is not None and session.get("done"):
+            self._spill(session_id, session)
+
+    def _spill(self, session_id, session):
+        record = {"session_id": session_id, "time": time.time()}
+        record.update({k: session.get(k) for k in SPILL_FIELDS})
+        goal = session.get("goal") or dict()
+        record["goal"] = {k: goal.get(k) for k in SPILL_GOAL_FIELDS}
+        try:
+            with open(self.spill_path, "a") as f:
+                f.write(
+                    json.dumps(record, separators=(",", ":"), default=_json_default)
+                    + "\n"
+                )
+            self.spilled += 1
+        except OSError as e:
+            print(f"Could not spill session {session_id}: {e}")
+
+    def flush(self):
+        """Spill and drop every finished session still in the store"""
+        with self._lock:
+            for session_id in [
+                session_id
+                for session_id, (_, session) in self._sessions.items()
+                if session.get("done")
+            ]:
+                self._evict(session_id, counted=False)
+
+    def memory_bytes(self):
+        """Approximate memory held by the live sessions (walks every session)"""
+        with self._lock:
+            sessions = [session for _, session in self._sessions.values()]
+        seen = set()
+        return sum(_deep_sizeof(session, seen) for session in sessions)
+
+    def stats(self):
+        """Gauges and counters of the store"""
+        return dict(
+            live_sessions=len(self._sessions),
+            memory_bytes=self.memory_bytes(),
+            evicted=self.evicted,
+            expired=self.expired,
+            spilled=self.spilled,
+            maxsize=self.maxsize,
+            ttl=self.ttl,
+        )
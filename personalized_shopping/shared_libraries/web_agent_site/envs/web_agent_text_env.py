@@ -13,41 +13,67 @@
 # limitations under the License.
 
 from collections import defaultdict
+from contextlib import contextmanager, nullcontext
 import json
 import random
 import string
-import time
-from bs4 import BeautifulSoup
+import threading
+from bs4 import BeautifulSoup, FeatureNotFound
 from bs4.element import Comment
 from flask import Flask
 import gym
 from gym.envs.registration import register
-import numpy as np
-import torch
+from .. import instrumentation
+from ..engine.catalog import get_goal_products, is_catalog, load_catalog
 from ..engine.engine import (
     ACTION_TO_TEMPLATE,
     BACK_TO_SEARCH,
     END_BUTTON,
     NEXT_PAGE,
     PREV_PAGE,
+    SEARCH_CACHE_SIZE,
+    SEARCH_CACHE_TTL,
+    SearchCache,
     get_product_per_page,
+    get_product_record,
+    get_search_cache_key,
     get_top_n_product_from_keywords,
     init_search_engine,
     load_products,
     map_action_to_html,
     parse_action,
+    template_registry,
 )
-from ..engine.goal import get_goals, get_reward
+from ..engine.goal import (
+    SyntheticGoalSpace,
+    build_attribute_match_table,
+    get_goals,
+    get_reward,
+    load_noun_index,
+    noun_index,
+    save_noun_index,
+)
+from ..engine.pages import Page
+from ..engine.sampler import (
+    DEFAULT_SEED,
+    AliasSampler,
+    numpy_rng,
+    sample_without_replacement,
+    session_rng,
+)
+from ..engine.session_store import SESSION_STORE_SIZE, SESSION_TTL, SessionStore
 from ..utils import (
     DEFAULT_FILE_PATH,
     FEAT_CONV,
     FEAT_IDS,
-    random_idx,
 )
 
 
 app = Flask(__name__)
 
+DEFAULT_HTML_PARSER = "html.parser"
+INSTRUMENTED_ACTIONS = ("search", "click")  # other action names are pooled
+
 
 class WebAgentTextEnv(gym.Env):
     """Gym environment for Text mode of WebShop environment"""
@@ -72,10 +98,27 @@ class WebAgentTextEnv(gym.Env):
         session
         session_prefix
         show_attrs
+        search_cache_size
+        search_cache_ttl
+        noun_index_path
+        attribute_match_table
+        goal_seed
+        html_parser (`str`) -- BeautifulSoup parser backend, e.g. 'lxml'
+          (default 'html.parser')
+        direct_render (`bool`) -- Build the 'text' observation and the list of
+          clickables straight from the page data instead of parsing the HTML
+          (default True; only used with 'html.parser', which it matches)
         """
         super(WebAgentTextEnv, self).__init__()
         self.observation_mode = observation_mode
         self.kwargs = kwargs
+        self.html_parser = get_html_parser(self.kwargs.get("html_parser"))
+        self.direct_render = (
+            self.kwargs.get("direct_render", True)
+            and self.html_parser == DEFAULT_HTML_PARSER
+        )
+        self._parsed_html = None
+        self._parsed_html_source = None
 
         self.file_path = file_path
 
@@ -93,6 +136,14 @@ class WebAgentTextEnv(gym.Env):
                 self.kwargs.get("num_products"),
                 self.kwargs.get("human_goals"),
                 self.kwargs.get("show_attrs", False),
+                self.kwargs.get("search_cache_size", SEARCH_CACHE_SIZE),
+                self.kwargs.get("search_cache_ttl", SEARCH_CACHE_TTL),
+                self.kwargs.get("noun_index_path"),
+                self.kwargs.get("attribute_match_table", False),
+                self.kwargs.get("goal_seed", DEFAULT_SEED),
+                self.kwargs.get("session_store_size", SESSION_STORE_SIZE),
+                self.kwargs.get("session_ttl", SESSION_TTL),
+                self.kwargs.get("session_log_path"),
             )
             if server is None
             else server
@@ -102,6 +153,7 @@ class WebAgentTextEnv(gym.Env):
         self.session = self.kwargs.get("session")
         self.session_prefix = self.kwargs.get("session_prefix")
         if self.kwargs.get("get_image", 0):
+            torch = import_torch()
             self.feats = torch.load(FEAT_CONV)
             self.ids = torch.load(FEAT_IDS)
             self.ids = {url: idx for idx, url in enumerate(self.ids)}
@@ -109,11 +161,15 @@ class WebAgentTextEnv(gym.Env):
         self.prev_actions = []
         self.num_prev_obs = self.kwargs.get("num_prev_obs", 0)
         self.num_prev_actions = self.kwargs.get("num_prev_actions", 0)
-        self.reset()
+        self.reset(session=self.session)
 
     def step(self, action):
         """Takes an action, updates WebShop environment, and returns (observation, reward, done, info)
 
+        `info["page_data"]` holds the structured payload of the resulting page
+        (product records on a results page, the item and selected options on an
+        item page), so callers don't need to scrape the HTML.
+
         Arguments:
 
         action (`str`): An action should be of the following structure:
@@ -121,6 +177,13 @@ class WebAgentTextEnv(gym.Env):
           - click[value]
         If action not valid, perform nothing.
         """
+        action_name, _ = parse_action(action)
+        if action_name not in INSTRUMENTED_ACTIONS:
+            action_name = "other"
+        with instrumentation.action(action_name), instrumentation.timer("step"):
+            return self._step(action)
+
+    def _step(self, action):
         info = {}
         self.get_available_actions()
 
@@ -150,11 +213,19 @@ class WebAgentTextEnv(gym.Env):
                 text_list.append(self.prev_obs[-i])
         state = " [SEP] ".join(text_list[::-1])
         self.prev_obs.append(ob)
+        info["page_data"] = self.browser.page_data
         return state, status["reward"], status["done"], info
 
     def get_available_actions(self):
         """Returns list of available actions at the current step"""
-        html_obj = self._parse_html()
+        if self.direct_render:
+            has_search_bar, self.text_to_clickable = self.browser.page.get_clickables()
+            return dict(
+                has_search_bar=has_search_bar,
+                clickables=list(self.text_to_clickable.keys()),
+            )
+
+        html_obj = self.parse_html()
 
         # Collect search bar, buttons, links, and options as clickables
         search_bar = html_obj.find(id="search_input")
@@ -176,7 +247,7 @@ class WebAgentTextEnv(gym.Env):
 
     def get_image(self):
         """Scrape image from page HTML and return as a list of pixel values"""
-        html_obj = self._parse_html(self.browser.page_source)
+        html_obj = self.parse_html(self.browser.page_source)
         image_url = html_obj.find(id="product-image")
         if image_url is not None:
             image_url = image_url["src"]
@@ -184,17 +255,26 @@ class WebAgentTextEnv(gym.Env):
                 image_idx = self.ids[image_url]
                 image = self.feats[image_idx]
                 return image
-        return torch.zeros(512)
+        return import_torch().zeros(512)
 
     def get_instruction_text(self):
         """Get corresponding instruction text for current environment session"""
-        html_obj = self._parse_html(self.browser.page_source)
+        if self.direct_render and self.browser.page.instruction_text is not None:
+            return self.browser.page.instruction_text
+        html_obj = self.parse_html(self.browser.page_source)
         instruction_text = html_obj.find(id="instruction-text").h4.text
         return instruction_text
 
-    def _parse_html(self, html=None):
+    def assign_instruction_text(self, instruction_text):
+        """Override the instruction text of this environment's session only"""
+        self.server.assign_instruction_text(self.session, instruction_text)
+
+    def parse_html(self, html=None):
         """Returns web request result wrapped in BeautifulSoup object
 
+        The parsed DOM of the last page is cached, so the action list, the text
+        observation and the tools all share a single parse per page.
+
         Arguments:
 
         url (`str`): If no url or html is provided, use the current
@@ -202,21 +282,27 @@ class WebAgentTextEnv(gym.Env):
         """
         if html is None:
             html = self.state["html"]
-        html_obj = BeautifulSoup(html, "html.parser")
-        return html_obj
+        if self._parsed_html is None or html != self._parsed_html_source:
+            with instrumentation.timer("parse"):
+                self._parsed_html = BeautifulSoup(html, self.html_parser)
+            self._parsed_html_source = html
+        return self._parsed_html
 
     @property
     def observation(self):
         """Compiles state into either the `html` or `text` observation mode"""
-        html = self.state["html"]
         if self.observation_mode == "html":
-            return html
+            return self.browser.page_source
         elif self.observation_mode == "text":
-            return self.convert_html_to_text(html, simple=True)
+            with instrumentation.timer("text"):
+                if self.direct_render:
+                    return self.browser.page.text
+                return self.convert_html_to_text(self.browser.page_source, simple=True)
         elif self.observation_mode == "text_rich":
-            return self.convert_html_to_text(html, simple=False)
+            with instrumentation.timer("text"):
+                return self.convert_html_to_text(self.browser.page_source, simple=False)
         elif self.observation_mode == "url":
-            return self.state["url"]
+            return self.browser.current_url
         else:
             raise ValueError(f"Observation mode {self.observation_mode} not supported.")
 
@@ -230,18 +316,21 @@ class WebAgentTextEnv(gym.Env):
         return dict(
             url=self.browser.current_url,
             html=self.browser.page_source,
+            page_data=self.browser.page_data,
             instruction_text=self.instruction_text,
         )
 
     def convert_html_to_text(self, html, simple=False):
         """Strip HTML of tags and add separators to convert observation into simple mode"""
-        texts = self._parse_html(html).findAll(text=True)
+        texts = self.parse_html(html).findAll(text=True)
         visible_texts = filter(tag_visible, texts)
         if simple:
             # For `simple` mode, return just [SEP] separators
             return " [SEP] ".join(t.strip() for t in visible_texts if t != "\n")
         else:
             # Otherwise, return an observation with tags mapped to specific, unique separators
+            session = self.server.user_sessions.get(self.session)
+            clicked_asins = session.get("asins", ()) if session is not None else ()
             observation = ""
             for t in visible_texts:
                 if t == "\n":
@@ -255,7 +344,7 @@ class WebAgentTextEnv(gym.Env):
                     else:
                         processed_t = f"  [button] {t} [button_]"
                 elif t.parent.get("class") == ["product-link"]:  # product asins
-                    if f"{t}" in self.server.user_sessions[self.session]["asins"]:
+                    if f"{t}" in clicked_asins:
                         processed_t = f"\n[clicked button] {t} [clicked button_]"
                     else:
                         processed_t = f"\n[button] {t} [button_]"
@@ -266,13 +355,17 @@ class WebAgentTextEnv(gym.Env):
 
     def reset(self, session=None, instruction_text=None):
         """Create a new session and reset environment variables"""
+        with instrumentation.action("reset"), instrumentation.timer("step"):
+            return self._reset(session, instruction_text)
+
+    def _reset(self, session, instruction_text):
         session_int = None
         if session is not None:
             self.session = str(session)
             if isinstance(session, int):
                 session_int = session
         else:
-            self.session = "".join(random.choices(string.ascii_lowercase, k=10))
+            self.session = self.server.new_session_id()
         if self.session_prefix is not None:
             self.session = self.session_prefix + self.session
 
@@ -297,6 +390,43 @@ class WebAgentTextEnv(gym.Env):
         pass
 
 
+def import_torch():
+    """Import torch on first use; it is only needed for image features"""
+    import torch
+
+    # Workaround to Resolve the PyTorch-Streamlit Incompatibility Issue
+    torch.classes.__path__ = []
+    return torch
+
+
+def get_html_parser(name=None):
+    """Returns the BeautifulSoup parser to use, falling back to `html.parser`
+
+    Other backends (e.g. 'lxml') are much faster but must be installed.
+    """
+    if name is None or name == DEFAULT_HTML_PARSER:
+        return DEFAULT_HTML_PARSER
+    try:
+        BeautifulSoup("", name)
+    except FeatureNotFound:
+        print(f"HTML parser {name} is not available, using {DEFAULT_HTML_PARSER}.")
+        return DEFAULT_HTML_PARSER
+    return name
+
+
+@contextmanager
+def flask_context():
+    with app.app_context(), app.test_request_context():
+        yield
+
+
+def render_context():
+    """Context to render pages in; only the "flask" render mode needs Flask's"""
+    if template_registry.needs_app_context:
+        return flask_context()
+    return nullcontext()
+
+
 def tag_visible(element):
     ignore = {"style", "script", "head", "title", "meta", "[document]"}
     return element.parent.name not in ignore and not isinstance(element, Comment)
@@ -314,6 +444,14 @@ class SimServer:
         num_products=None,
         human_goals=0,
         show_attrs=False,
+        search_cache_size=SEARCH_CACHE_SIZE,
+        search_cache_ttl=SEARCH_CACHE_TTL,
+        noun_index_path=None,
+        attribute_match_table=False,
+        goal_seed=DEFAULT_SEED,
+        session_store_size=SESSION_STORE_SIZE,
+        session_ttl=SESSION_TTL,
+        session_log_path=None,
     ):
         """Constructor for simulated server serving WebShop application
 
@@ -325,23 +463,56 @@ class SimServer:
         num_products (`int`) -- Number of products to search across
         human_goals (`bool`) -- If true, load human goals; otherwise, load synthetic
           goals
+        search_cache_size (`int`) -- Number of search results kept in the LRU cache
+        search_cache_ttl (`float`) -- Seconds a cached search result stays valid
+        noun_index_path (`str`) -- JSON file caching the spaCy nouns of product
+          names used by the type reward; created if missing
+        attribute_match_table (`bool`) -- Precompute the fuzzy matches between
+          all catalog and goal attributes instead of memoizing them on demand
+        goal_seed (`int`) -- Seed of the goal shuffle and of the per-session
+          goal draws
+        session_store_size (`int`) -- Number of live sessions kept; the least
+          recently used are evicted beyond it
+        session_ttl (`float`) -- Seconds an idle session is kept
+        session_log_path (`str`) -- JSONL file finished sessions are appended to
+          when they leave the store
         """
         # Load all products, goals, and search engine
         self.base_url = base_url
-        self.all_products, self.product_item_dict, self.product_prices, _ = (
-            load_products(
-                filepath=file_path,
-                num_products=num_products,
-                human_goals=human_goals,
-            )
+        # Compiled catalogs are memory-mapped and decoded lazily per product
+        load_fn = load_catalog if is_catalog(file_path) else load_products
+        (
+            self.all_products,
+            self.product_item_dict,
+            self.product_prices,
+            attribute_to_asins,
+        ) = load_fn(
+            filepath=file_path,
+            num_products=num_products,
+            human_goals=human_goals,
         )
         self.search_engine = init_search_engine(num_products=num_products)
-        self.goals = get_goals(self.all_products, self.product_prices, human_goals)
+        self.search_cache = SearchCache(search_cache_size, search_cache_ttl)
+        if noun_index_path is not None:
+            load_noun_index(noun_index_path)
+        num_nouns = len(noun_index)
+        self.goals = get_goals(
+            get_goal_products(self.all_products), self.product_prices, human_goals
+        )
+        if noun_index_path is not None and len(noun_index) > num_nouns:
+            save_noun_index(noun_index_path)
+        if attribute_match_table:
+            build_attribute_match_table(attribute_to_asins, self.goals)
         self.show_attrs = show_attrs
 
         # Fix outcome for random shuffling of goals
-        random.seed(233)
-        random.shuffle(self.goals)
+        self.goal_seed = goal_seed
+        rng = random.Random(goal_seed)
+        if isinstance(self.goals, SyntheticGoalSpace):
+            # Synthetic goals are decoded on demand; shuffle their index instead
+            self.goals.shuffle(rng)
+        else:
+            rng.shuffle(self.goals)
 
         # Apply `filter_goals` parameter if exists to select speific goal(s)
         if filter_goals is not None:
@@ -349,37 +520,122 @@ class SimServer:
                 goal for (i, goal) in enumerate(self.goals) if filter_goals(i, goal)
             ]
 
-        # Imposes `limit` on goals via random selection
+        # Imposes `limit` on goals via weighted sampling without replacement
         if limit_goals != -1 and limit_goals < len(self.goals):
-            self.weights = [goal["weight"] for goal in self.goals]
-            self.cum_weights = [0] + np.cumsum(self.weights).tolist()
-            idxs = []
-            while len(idxs) < limit_goals:
-                idx = random_idx(self.cum_weights)
-                if idx not in idxs:
-                    idxs.append(idx)
+            if isinstance(self.goals, SyntheticGoalSpace):
+                idxs = self.goals.sample_without_replacement(limit_goals, rng)
+            else:
+                idxs = sample_without_replacement(
+                    [goal["weight"] for goal in self.goals],
+                    limit_goals,
+                    numpy_rng(goal_seed, "limit_goals"),
+                )
             self.goals = [self.goals[i] for i in idxs]
         print(f"Loaded {len(self.goals)} goals.")
 
         # Set extraneous housekeeping variables
-        self.weights = [goal["weight"] for goal in self.goals]
-        self.cum_weights = [0] + np.cumsum(self.weights).tolist()
-        self.user_sessions = dict()
-        self.search_time = 0
-        self.render_time = 0
-        self.sample_time = 0
-        self.assigned_instruction_text = None  # TODO: very hacky, should remove
+        self.set_goal_weights()
+        # Sessions reset without an id get one from this stream, so their goals
+        # are reproducible too
+        self._session_id_rng = session_rng("session_ids", goal_seed)
+        self._session_id_lock = threading.Lock()
+        self.user_sessions = SessionStore(
+            session_store_size, session_ttl, session_log_path
+        )
+        # Instruction text overrides; the per-session ones take precedence so
+        # concurrent sessions sharing this server don't see each other's text
+        self.assigned_instruction_text = None
+        self.assigned_instruction_texts = dict()
+
+    @property
+    def search_cache_hits(self):
+        return self.search_cache.hits
+
+    @property
+    def search_cache_misses(self):
+        return self.search_cache.misses
+
+    # Seconds spent per stage, read from the process-wide latency histograms
+    # (only recorded while `instrumentation` is enabled)
+    @property
+    def search_time(self):
+        return instrumentation.total_seconds("search")
+
+    @property
+    def render_time(self):
+        return instrumentation.total_seconds("render")
+
+    @property
+    def sample_time(self):
+        return instrumentation.total_seconds("sample")
+
+    def set_search_engine(self, search_engine):
+        """Swap the search index, dropping results cached for the previous one"""
+        self.search_engine = search_engine
+        self.search_cache.clear()
+
+    def set_goal_weights(self):
+        """Prepare weighted goal sampling for the current `self.goals`"""
+        if isinstance(self.goals, SyntheticGoalSpace):
+            # The goal space samples from its own per-product alias table
+            self.weights = None
+            self.goal_sampler = None
+        else:
+            self.weights = [goal["weight"] for goal in self.goals]
+            self.goal_sampler = AliasSampler(self.weights) if self.goals else None
+
+    def sample_goal_idx(self, rng=random):
+        """Draw a goal index with probability proportional to the goal weight"""
+        if isinstance(self.goals, SyntheticGoalSpace):
+            return self.goals.sample(rng)
+        return self.goal_sampler.sample(rng)
+
+    def new_session_id(self):
+        """Draw a random session id from the server's seeded stream"""
+        with self._session_id_lock:
+            return "".join(self._session_id_rng.choices(string.ascii_lowercase, k=10))
+
+    def assign_instruction_text(self, session_id, instruction_text):
+        """Override the instruction text shown to a single session"""
+        if instruction_text is None:
+            self.assigned_instruction_texts.pop(session_id, None)
+        else:
+            self.assigned_instruction_texts[session_id] = instruction_text
+
+    def get_assigned_instruction_text(self, session_id):
+        """Returns the instruction text override in effect for a session, if any"""
+        return self.assigned_instruction_texts.get(
+            session_id, self.assigned_instruction_text
+        )
+
+    @staticmethod
+    def new_session_state():
+        """Per-session fields a session starts from, and is reset to"""
+        return {
+            "keywords": None,
+            "page": None,
+            "asin": None,
+            "asins": set(),
+            "options": dict(),
+            "actions": defaultdict(int),
+        }
+
+    def end_session(self, session_id):
+        """Drop all state kept for a session"""
+        self.user_sessions.pop(session_id, None)
+        self.assigned_instruction_texts.pop(session_id, None)
 
     @app.route("/", methods=["GET", "POST"])
     def index(self, session_id, **kwargs):
         """Redirect to the search page with the given session ID"""
-        html = map_action_to_html(
+        response = Page(
             "start",
             session_id=session_id,
             instruction_text=kwargs["instruction_text"],
         )
         url = f"{self.base_url}/{session_id}"
-        return html, url
+        self.user_sessions[session_id]["page_data"] = {"page_type": "index"}
+        return response, url
 
     @app.route("/", methods=["GET", "POST"])
     def search_results(self, session_id, **kwargs):
@@ -396,15 +652,20 @@ class SimServer:
         session["asin"] = None
         session["options"] = {}
 
-        # Perform search on keywords from items and record amount of time it takes
-        old_time = time.time()
-        top_n_products = get_top_n_product_from_keywords(
-            keywords,
-            self.search_engine,
-            self.all_products,
-            self.product_item_dict,
+        # Perform search on keywords from items
+        cache_key = get_search_cache_key(keywords, self.search_engine)
+        top_n_products = (
+            self.search_cache.get(cache_key) if cache_key is not None else None
         )
-        self.search_time += time.time() - old_time
+        if top_n_products is None:
+            top_n_products = get_top_n_product_from_keywords(
+                keywords,
+                self.search_engine,
+                self.all_products,
+                self.product_item_dict,
+            )
+            if cache_key is not None:
+                self.search_cache.put(cache_key, top_n_products)
 
         # Get product list from search result asins and get list of corresponding URLs
         products = get_product_per_page(top_n_products, page)
@@ -415,9 +676,8 @@ class SimServer:
             f"{keywords_url_string}/{page}"
         )
 
-        # Render HTML search page and record amount of time taken
-        old_time = time.time()
-        html = map_action_to_html(
+        # Build search page (the HTML is rendered when the page is first read)
+        response = Page(
             "search",
             session_id=session_id,
             products=products,
@@ -427,10 +687,16 @@ class SimServer:
             # This is used for reward computation
             # instruction_text=session['goal']['instruction_text'],
             # This is used for rendering the page
-            instruction_text=self.assigned_instruction_text,
+            instruction_text=self.get_assigned_instruction_text(session_id),
         )
-        self.render_time += time.time() - old_time
-        return html, url
+        session["page_data"] = {
+            "page_type": "search_results",
+            "keywords": keywords,
+            "page": page,
+            "total": len(top_n_products),
+            "products": [get_product_record(p) for p in products],
+        }
+        return response, url
 
     @app.route("/", methods=["GET", "POST"])
     def item_page(self, session_id, **kwargs):
@@ -464,7 +730,7 @@ class SimServer:
             f'{session["page"]}/{option_string}'
         )
 
-        html = map_action_to_html(
+        response = Page(
             "click",
             session_id=session_id,
             product_info=product_info,
@@ -475,10 +741,16 @@ class SimServer:
             # This is used for reward computation
             # instruction_text=session['goal']['instruction_text'],
             # This is used for rendering the page
-            instruction_text=self.assigned_instruction_text,
+            instruction_text=self.get_assigned_instruction_text(session_id),
             show_attrs=self.show_attrs,
         )
-        return html, url
+        session["page_data"] = {
+            "page_type": "item_page",
+            "product": get_product_record(product_info),
+            "options": product_info["options"],
+            "selected_options": dict(session["options"]),
+        }
+        return response, url
 
     @app.route("/", methods=["GET", "POST"])
     def item_sub_page(self, session_id, **kwargs):
@@ -502,7 +774,7 @@ class SimServer:
             f'{session["asin"]}/{keywords_url_string}/{session["page"]}/'
             f'{clickable_name}/{session["options"]}'
         )
-        html = map_action_to_html(
+        response = Page(
             f"click[{clickable_name}]",
             session_id=session_id,
             product_info=product_info,
@@ -513,9 +785,15 @@ class SimServer:
             # This is used for reward computation
             # instruction_text=session['goal']['instruction_text'],
             # This is used for rendering the page
-            instruction_text=self.assigned_instruction_text,
+            instruction_text=self.get_assigned_instruction_text(session_id),
         )
-        return html, url
+        session["page_data"] = {
+            "page_type": "item_sub_page",
+            "sub_page": clickable_name,
+            "product": get_product_record(product_info),
+            "selected_options": dict(session["options"]),
+        }
+        return response, url
 
     @app.route("/", methods=["GET", "POST"])
     def done(self, session_id, **kwargs):
@@ -527,13 +805,14 @@ class SimServer:
         price = self.product_prices.get(session["asin"])
 
         # Calculate reward for selected product and set variables for page details
-        reward, info = get_reward(
-            purchased_product,
-            goal,
-            price=price,
-            options=session["options"],
-            verbose=True,
-        )
+        with instrumentation.timer("reward"):
+            reward, info = get_reward(
+                purchased_product,
+                goal,
+                price=price,
+                options=session["options"],
+                verbose=True,
+            )
 
         self.user_sessions[session_id]["verbose_info"] = info
         self.user_sessions[session_id]["done"] = True
@@ -543,7 +822,7 @@ class SimServer:
             f"{self.base_url}/done/{session_id}/"
             f'{session["asin"]}/{session["options"]}'
         )
-        html = map_action_to_html(
+        response = Page(
             f"click[{END_BUTTON}]",
             session_id=session_id,
             reward=reward,
@@ -552,71 +831,80 @@ class SimServer:
             # This is used for reward computation
             # instruction_text=session['goal']['instruction_text'],
             # This is used for rendering the page
-            instruction_text=self.assigned_instruction_text,
+            instruction_text=self.get_assigned_instruction_text(session_id),
         )
-        return html, url, reward
+        session["page_data"] = {
+            "page_type": "done",
+            "asin": session["asin"],
+            "selected_options": dict(session["options"]),
+            "reward": reward,
+        }
+        return response, url, reward
 
     def receive(self, session_id, current_url, session_int=None, **kwargs):
-        """Map action to the corresponding page"""
+        """Map action to the corresponding page
+
+        Returns the `Page` (its HTML is rendered on first access), its URL, the
+        reward status and a structured payload describing the page (see
+        `page_data` in each handler).
+        """
         status = dict(reward=0.0, done=False)
 
-        with app.app_context(), app.test_request_context():
+        with render_context():
             # Create/determine goal, instruction_text from current session
-            if session_id not in self.user_sessions:
-                idx = (
-                    session_int
-                    if (session_int is not None and isinstance(session_int, int))
-                    else random_idx(self.cum_weights)
+            try:
+                session = self.user_sessions[session_id]
+            except KeyError:
+                session = None
+            if session is None:
+                with instrumentation.timer("sample"):
+                    idx = (
+                        session_int
+                        if (session_int is not None and isinstance(session_int, int))
+                        else self.sample_goal_idx(
+                            session_rng(session_id, self.goal_seed)
+                        )
+                    )
+                    goal = self.goals[idx]
+                session = {"goal": goal, "done": False, **self.new_session_state()}
+                self.user_sessions[session_id] = session
+                if kwargs and "keywords" not in kwargs:
+                    # The session was evicted mid-episode and the page it
+                    # clicked on is gone with it, so start over from the index
+                    kwargs = dict()
+            instruction_text = session["goal"]["instruction_text"]
+            assigned_instruction_text = self.get_assigned_instruction_text(session_id)
+            if assigned_instruction_text is not None:
+                instruction_text = assigned_instruction_text
+                # Copy the goal; it is shared with every other session drawing it
+                session["goal"] = dict(
+                    session["goal"], instruction_text=instruction_text
                 )
-                goal = self.goals[idx]
-                instruction_text = goal["instruction_text"]
-                self.user_sessions[session_id] = {"goal": goal, "done": False}
-            else:
-                instruction_text = self.user_sessions[session_id]["goal"][
-                    "instruction_text"
-                ]
-            if self.assigned_instruction_text is not None:
-                instruction_text = (
-                    self.assigned_instruction_text
-                )  # TODO: very hacky, should remove
-                self.user_sessions[session_id]["goal"][
-                    "instruction_text"
-                ] = instruction_text
-            session = self.user_sessions[session_id]
 
             if not kwargs:
                 # If no action, reset the session variables
                 kwargs["instruction_text"] = instruction_text
-                html, url = self.index(session_id, **kwargs)
-                self.user_sessions[session_id].update(
-                    {
-                        "keywords": None,
-                        "page": None,
-                        "asin": None,
-                        "asins": set(),
-                        "options": dict(),
-                        "actions": defaultdict(int),
-                    }
-                )
+                response, url = self.index(session_id, **kwargs)
+                session.update(self.new_session_state())
             elif "keywords" in kwargs:
                 # If search keywords are available, run a search
-                html, url = self.search_results(session_id, **kwargs)
+                response, url = self.search_results(session_id, **kwargs)
             elif "clickable_name" in kwargs:
                 clickable_name = kwargs["clickable_name"].lower()
                 if clickable_name == END_BUTTON.lower():
                     # If "buy now" clicked, calculate reward and flag session as terminated
-                    html, url, reward = self.done(session_id, **kwargs)
+                    response, url, reward = self.done(session_id, **kwargs)
                     status["reward"] = reward
                     status["done"] = True
                 elif clickable_name == BACK_TO_SEARCH.lower():
                     # If "back to search" clicked, recursively reset the session back to search page
-                    html, url, status = self.receive(session_id, current_url)
+                    response, url, status, _ = self.receive(session_id, current_url)
                 elif (
                     clickable_name == NEXT_PAGE.lower()
                     and self.get_page_name(current_url) == "search_results"
                 ):
                     # If "next page" clicked from search results, re-render with `page` enumerated
-                    html, url, status = self.receive(
+                    response, url, status, _ = self.receive(
                         session_id,
                         current_url,
                         keywords=session["keywords"],
@@ -627,7 +915,7 @@ class SimServer:
                     and self.get_page_name(current_url) == "search_results"
                 ):
                     # If "prev page" clicked from search results, re-render with `page` denumerated
-                    html, url, status = self.receive(
+                    response, url, status, _ = self.receive(
                         session_id,
                         current_url,
                         keywords=session["keywords"],
@@ -638,13 +926,13 @@ class SimServer:
                     and self.get_page_name(current_url) == "item_sub_page"
                 ):
                     # If "prev page" clicked from sub page, return to corresponding item page
-                    html, url = self.item_page(session_id, **kwargs)
+                    response, url = self.item_page(session_id, **kwargs)
                 elif (
                     clickable_name == PREV_PAGE.lower()
                     and self.get_page_name(current_url) == "item_page"
                 ):
                     # If "prev page" clicked from item page, return to search results page
-                    html, url = self.search_results(
+                    response, url = self.search_results(
                         session_id,
                         keywords=session["keywords"],
                         page=session["page"],
@@ -652,11 +940,14 @@ class SimServer:
                     )
                 elif clickable_name in [k.lower() for k in ACTION_TO_TEMPLATE]:
                     # Render item_sub_page if clickable is description, features, or reviews
-                    html, url = self.item_sub_page(session_id, **kwargs)
+                    response, url = self.item_sub_page(session_id, **kwargs)
                 else:
                     # Otherwise, render current item page
-                    html, url = self.item_page(session_id, **kwargs)
-            return html, url, status
+                    response, url = self.item_page(session_id, **kwargs)
+            if template_registry.needs_app_context:
+                # Flask's `url_for` only works inside the contexts entered above
+                response.render()
+            return response, url, status, session["page_data"]
 
     def get_page_name(self, url):
         """Determine which page (i.e.
@@ -678,24 +969,37 @@ class SimBrowser:
     def __init__(self, server):
         self.server = server
         self.current_url = None
-        self.page_source = None
+        self.page = None
+        self.page_data = None
         self.session_id = None
+        # Sent with every request, so a session evicted mid-episode comes back
+        # with the goal it was started with
+        self.session_int = None
+
+    @property
+    def page_source(self):
+        """HTML of the current page"""
+        return self.page.html if self.page is not None else None
 
     def get(self, url, session_id=None, session_int=None):
         """Set browser variables to corresponding link, page HTML for URL"""
         self.session_id = url.split("/")[-1] if session_id is None else session_id
-        self.page_source, _, _ = self.server.receive(
+        self.session_int = session_int
+        self.page, _, _, self.page_data = self.server.receive(
             self.session_id, self.current_url, session_int=session_int
         )
         self.current_url = url
 
     def click(self, clickable_name, text_to_clickable):
         """Wrapper for `receive` handler for performing click action on current page"""
-        self.page_source, self.current_url, status = self.server.receive(
-            self.session_id,
-            current_url=self.current_url,
-            clickable_name=clickable_name,
-            text_to_clickable=text_to_clickable,
+        self.page, self.current_url, status, self.page_data = (
+            self.server.receive(
+                self.session_id,
+                current_url=self.current_url,
+                session_int=self.session_int,
+                clickable_name=clickable_name,
+                text_to_clickable=text_to_clickable,
+            )
         )
         return status
 
@@ -703,10 +1007,13 @@ class SimBrowser:
         """Wrapper for `receive` handler for performing search action on current page"""
         if isinstance(keywords, str):
             keywords = keywords.split(" ")
-        self.page_source, self.current_url, status = self.server.receive(
-            self.session_id,
-            current_url=self.current_url,
-            keywords=keywords,
+        self.page, self.current_url, status, self.page_data = (
+            self.server.receive(
+                self.session_id,
+                current_url=self.current_url,
+                session_int=self.session_int,
+                keywords=keywords,
+            )
         )
         return status
 
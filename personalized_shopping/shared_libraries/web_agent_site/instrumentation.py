@@ -0,0 +1,213 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Latency histograms for the stages of an environment step.
+
+Each stage of a turn is timed with `timer(stage)`:
+
+    search     -- Lucene query                 doc_fetch  -- hits to products
+    render     -- Jinja template rendering     parse      -- BeautifulSoup parse
+    text       -- HTML to text observation     reward     -- reward scoring
+    sample     -- goal draw of a new session   step       -- whole env step
+    artifact   -- tool artifact save
+
+Samples are labelled with the action type of the step they belong to (set by
+`action(name)` around the step), so a slow turn can be traced to a stage and
+an action. Recording is off unless `WEBSHOP_INSTRUMENT=1` or `enable()` is
+called; a disabled `timer` is a shared no-op context manager.
+
+`snapshot()` returns the histograms as a dict (`to_json()` serializes it) and
+`to_prometheus()` renders them in the Prometheus text exposition format.
+"""
+
+from bisect import bisect_left
+import contextlib
+import json
+import os
+import threading
+import time
+
+ENABLED = os.environ.get("WEBSHOP_INSTRUMENT", "0") == "1"
+METRIC_NAME = "webshop_stage_seconds"
+# Upper bounds of the histogram buckets, 100us to 50s, plus an implicit +Inf
+BUCKETS = tuple(float(f"{m}e{e}") for e in range(-4, 2) for m in (1, 2.5, 5))
+QUANTILES = (0.5, 0.9, 0.99)
+NO_ACTION = ""
+
+_histograms = dict()  # (stage, action) -> Histogram
+_lock = threading.Lock()
+_local = threading.local()
+_null_timer = contextlib.nullcontext()
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = self.buckets[i - 1] if i > 0 else 0.0
+                hi = self.buckets[i] if i < len(self.buckets) else self.max
+                lo, hi = max(lo, self.min), min(hi, self.max)
+                return lo + (hi - lo) * (rank - seen) / n
+            seen += n
+        return self.max
+
+    def to_dict(self):
+        return dict(
+            count=self.count,
+            sum=self.sum,
+            min=self.min,
+            max=self.max,
+            mean=self.sum / self.count if self.count else None,
+            **{f"p{round(q * 100)}": self.quantile(q) for q in QUANTILES},
+            buckets={
+                str(le): n for le, n in zip(self.buckets + ("+Inf",), self.counts)
+            },
+        )
+
+
+def enable(enabled=True):
+    """Turn recording on or off for the whole process"""
+    global ENABLED
+    ENABLED = enabled
+
+
+def is_enabled():
+    return ENABLED
+
+
+def record(stage, seconds, action=None):
+    """Add one sample to the histogram of `stage`"""
+    if action is None:
+        action = getattr(_local, "action", NO_ACTION)
+    key = (stage, action)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+
+class _Timer:
+    __slots__ = ("stage", "action", "start")
+
+    def __init__(self, stage, action=None):
+        self.stage = stage
+        self.action = action
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.stage, time.perf_counter() - self.start, self.action)
+        return False
+
+
+def timer(stage, action=None):
+    """Context manager timing a stage; a no-op while recording is disabled
+
+    `action` overrides the action type set by `action()`, e.g. in coroutines
+    where a thread-local label would leak between tasks.
+    """
+    if not ENABLED:
+        return _null_timer
+    return _Timer(stage, action)
+
+
+@contextlib.contextmanager
+def action(name):
+    """Label the stages timed in this thread with the action type `name`"""
+    previous = getattr(_local, "action", NO_ACTION)
+    _local.action = name
+    try:
+        yield
+    finally:
+        _local.action = previous
+
+
+def reset():
+    """Drop all recorded samples"""
+    with _lock:
+        _histograms.clear()
+
+
+def snapshot():
+    """Returns `{stage: {action: histogram dict}}` for every recorded series"""
+    with _lock:
+        series = {key: h.to_dict() for key, h in _histograms.items()}
+    result = dict()
+    for (stage, action_name), histogram in sorted(series.items()):
+        result.setdefault(stage, dict())[action_name] = histogram
+    return result
+
+
+def total_seconds(stage):
+    """Sum of the recorded seconds of `stage` over every action type"""
+    with _lock:
+        return sum(h.sum for (s, _), h in _histograms.items() if s == stage)
+
+
+def to_json(**kwargs):
+    return json.dumps(snapshot(), **kwargs)
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus(name=METRIC_NAME):
+    """Render the histograms in the Prometheus text exposition format"""
+    with _lock:
+        series = sorted(
+            (key, list(h.counts), h.sum, h.count) for key, h in _histograms.items()
+        )
+    lines = [
+        f"# HELP {name} Latency of WebShop environment step stages in seconds.",
+        f"# TYPE {name} histogram",
+    ]
+    for (stage, action_name), counts, total, count in series:
+        labels = (
+            f'stage="{_escape_label(stage)}",action="{_escape_label(action_name)}"'
+        )
+        cumulative = 0
+        for le, n in zip(BUCKETS + ("+Inf",), counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {total!r}")
+        lines.append(f"{name}_count{{{labels}}} {count}")
+    return "\n".join(lines) + "\n"
@@ -12,67 +12,36 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+
 from google.adk.tools import ToolContext
 from google.genai import types
 
-from ..shared_libraries.init_env import get_webshop_env
-
-
-async def search(keywords: str, tool_context: ToolContext) -> str:
-    """Search for keywords in the webshop.
-
-    Args:
-      keywords(str): The keywords to search for.
-      tool_context(ToolContext): The function context.
+from ..shared_libraries.env_executor import ENV_TIMEOUT, run_env_call
+from ..shared_libraries.init_env import webshop_session
+from ..shared_libraries.web_agent_site import instrumentation
 
-    Returns:
-      str: The search result displayed in a webpage with product details including images and ASINs.
-    """
-    from bs4 import BeautifulSoup
 
-    webshop_env = get_webshop_env()
+def _search(keywords, tool_context):
+    """Step the session's environment; runs on the environment pool"""
     status = {"reward": None, "done": False}
     action_string = f"search[{keywords}]"
-    webshop_env.server.assigned_instruction_text = f"Find me {keywords}."
-    print(f"env instruction_text: {webshop_env.instruction_text}")
-    _, status["reward"], status["done"], _ = webshop_env.step(action_string)
+    # Each ADK session drives its own environment; the lock keeps concurrent
+    # calls from the same session from interleaving their steps
+    with webshop_session(tool_context) as webshop_env:
+        webshop_env.assign_instruction_text(f"Find me {keywords}.")
+        print(f"env instruction_text: {webshop_env.instruction_text}")
+        _, status["reward"], status["done"], info = webshop_env.step(action_string)
+        ob = webshop_env.observation
+        html = webshop_env.state["html"]
 
-    ob = webshop_env.observation
     index = ob.find("Back to Search")
     if index >= 0:
         ob = ob[index:]
 
-    # Extract product details from HTML
-    html = webshop_env.state["html"]
-    soup = BeautifulSoup(html, "html.parser")
-
-    # Extract product information
-    products_info = []
-    product_links = soup.find_all(class_="product-link")
-
-    for link in product_links:
-        asin = link.get_text().strip()
-        # Find the parent container to get associated product details
-        product_container = link.find_parent("div", class_="item")
-        if product_container:
-            # Extract image
-            img_tag = product_container.find("img")
-            image_url = img_tag.get("src") if img_tag else None
-
-            # Extract title
-            title_tag = product_container.find("h4")
-            title = title_tag.get_text().strip() if title_tag else "N/A"
-
-            # Extract price
-            price_tag = product_container.find("p")
-            price = price_tag.get_text().strip() if price_tag else "N/A"
-
-            products_info.append({
-                "asin": asin,
-                "title": title,
-                "price": price,
-                "image": image_url
-            })
+    # Product records come straight from the environment; no HTML scraping
+    page_data = info.get("page_data") or {}
+    products_info = page_data.get("products", [])
 
     # Enhance observation with product details
     if products_info:
@@ -81,7 +50,7 @@ async def search(keywords: str, tool_context: ToolContext) -> str:
             enhanced_ob += f"\n{i}. Product ID (ASIN): {product['asin']}\n"
             enhanced_ob += f"   Title: {product['title']}\n"
             enhanced_ob += f"   Price: {product['price']}\n"
-            if product['image']:
+            if product["image"]:
                 enhanced_ob += f"   Image URL: {product['image']}\n"
         ob = enhanced_ob
 
@@ -91,14 +60,34 @@ async def search(keywords: str, tool_context: ToolContext) -> str:
     print(f"observation: {ob}")
     print("#" * 50)
 
-    # Show artifact in the UI.
+    return ob, html
+
+
+async def search(keywords: str, tool_context: ToolContext) -> str:
+    """Search for keywords in the webshop.
+
+    Args:
+      keywords(str): The keywords to search for.
+      tool_context(ToolContext): The function context.
+
+    Returns:
+      str: The search result displayed in a webpage with product details including images and ASINs.
+    """
     try:
-        await tool_context.save_artifact(
-            "html",
-            types.Part.from_uri(
-                file_uri=webshop_env.state["html"], mime_type="text/html"
-            ),
+        ob, html = await run_env_call(_search, keywords, tool_context)
+    except asyncio.TimeoutError:
+        return (
+            f"Error: the webshop did not respond within {ENV_TIMEOUT} seconds. "
+            "Please try again."
         )
+
+    # Show artifact in the UI.
+    try:
+        with instrumentation.timer("artifact", action="search"):
+            await tool_context.save_artifact(
+                "html",
+                types.Part.from_uri(file_uri=html, mime_type="text/html"),
+            )
     except ValueError as e:
         print(f"Error saving artifact: {e}")
 
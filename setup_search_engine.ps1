@@ -59,7 +59,7 @@ uv run python -m pyserini.index.lucene `
     --index indexes_1k `
     --generator DefaultLuceneDocumentGenerator `
     --threads 1 `
-    --storePositions --storeDocvectors --storeRaw
+    --storePositions --storeDocvectors
 
 if ($LASTEXITCODE -ne 0) {
     Write-Host "Index creation failed!" -ForegroundColor Red
@@ -67,6 +67,14 @@ if ($LASTEXITCODE -ne 0) {
     exit 1
 }
 
+uv run python build_docid_table.py indexes_1k
+
+if ($LASTEXITCODE -ne 0) {
+    Write-Host "Docid table creation failed!" -ForegroundColor Red
+    Pop-Location
+    exit 1
+}
+
 Pop-Location
 
 Write-Host ""
@@ -0,0 +1,113 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Shared fixtures: a small raw product catalog and a search engine over it."""
+
+from collections import namedtuple
+import json
+import random
+
+import pytest
+
+from personalized_shopping.shared_libraries.web_agent_site.envs import (
+    web_agent_text_env,
+)
+from personalized_shopping.shared_libraries.web_agent_site.utils import (
+    DEFAULT_ATTR_PATH,
+)
+
+Hit = namedtuple("Hit", ["docid", "lucene_docid", "score"])
+
+NUM_RAW_PRODUCTS = 60
+WORDS = ["red", "cotton", "shirt", "dress", "men", "women", "leather", "shoes"]
+COLORS = ["Black", "Navy Blue", "white/grey", "Red"]
+SIZES = ["Small", "Medium", "X-Large", "10.5"]
+CATEGORIES = ["fashion", "beauty", "garden"]
+
+
+def random_raw_product(rng, asin):
+    """A raw catalog record with the fields `normalize_product` reads"""
+    options = dict()
+    if rng.random() < 0.7:
+        options["color"] = [
+            {"value": v, "image": None} for v in rng.sample(COLORS, rng.randint(1, 3))
+        ]
+    if rng.random() < 0.5:
+        options["Size"] = [{"value": v} for v in rng.sample(SIZES, rng.randint(1, 3))]
+    pricing = rng.choice(["", "$12.99", "$5.00$25.50", "$1,299.00"])
+    category = rng.choice(CATEGORIES)
+    return {
+        "asin": asin,
+        "name": " ".join(rng.choices(WORDS, k=rng.randint(2, 6))).title(),
+        "full_description": " ".join(rng.choices(WORDS, k=8)),
+        "small_description": rng.choice(
+            ["soft cotton", ["machine wash", "imported"]]
+        ),
+        "images": [f"https://example.com/{asin}.jpg"],
+        "product_category": f"{category.title()} › {rng.choice(WORDS).title()}",
+        "category": category,
+        "query": f" {rng.choice(WORDS)} {rng.choice(WORDS)} ",
+        "page": 1,
+        "pricing": pricing or None,
+        "customization_options": options or None,
+        "brand": "Acme",
+        "seller_id": "A1",
+    }
+
+
+@pytest.fixture(scope="session")
+def raw_catalog(tmp_path_factory):
+    """Path of a raw catalog whose ASINs all have entries in the attribute file"""
+    with open(DEFAULT_ATTR_PATH) as f:
+        attributes = json.load(f)
+    # Mix products that have synthetic goals with ones that have none
+    with_goals = [a for a, v in attributes.items() if v.get("instruction")]
+    without_goals = [a for a, v in attributes.items() if not v.get("instruction")]
+    asins = with_goals[: NUM_RAW_PRODUCTS // 2] + without_goals[: NUM_RAW_PRODUCTS // 2]
+    rng = random.Random(0)
+    rng.shuffle(asins)
+    products = [random_raw_product(rng, asin) for asin in asins]
+    path = tmp_path_factory.mktemp("data") / "items_shuffle.json"
+    with open(path, "w") as f:
+        json.dump(products, f)
+    return str(path)
+
+
+class FakeSearcher:
+    """Ranks the catalog's products by how many query words their name has"""
+
+    def __init__(self, products):
+        self.names = [(p["asin"], p["name"].lower().split()) for p in products]
+
+    def search(self, q, k=10):
+        words = q.lower().split()
+        scores = [
+            (sum(name.count(w) for w in words), i, asin)
+            for i, (asin, name) in enumerate(self.names)
+        ]
+        scores = sorted((s for s in scores if s[0]), key=lambda s: (-s[0], s[1]))
+        return [Hit(asin, i, float(score)) for score, i, asin in scores[:k]]
+
+
+@pytest.fixture
+def fake_search_engine(raw_catalog, monkeypatch):
+    """Serve `SimServer` searches from a `FakeSearcher` instead of Lucene"""
+    with open(raw_catalog) as f:
+        search_engine = FakeSearcher(json.load(f))
+    monkeypatch.setattr(
+        web_agent_text_env,
+        "init_search_engine",
+        lambda num_products=None: search_engine,
+    )
+    return search_engine
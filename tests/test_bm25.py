@@ -0,0 +1,152 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Differential test of the vectorized BM25 backend against a per-document scorer."""
+
+from collections import Counter
+import json
+import random
+
+import numpy as np
+import pytest
+
+from personalized_shopping.shared_libraries.web_agent_site.engine import bm25
+
+# Outputs of Anserini's DefaultEnglishAnalyzer
+ANALYZED = {
+    "Men's Running Shoes, size 10.5": ["men", "run", "shoe", "size", "10.5"],
+    "it’s 3.5mm x 2,000.00 ft U.S.A. e-mail": [
+        "3.5mm",
+        "x",
+        "2,000.00",
+        "ft",
+        "u.s.a",
+        "e",
+        "mail",
+    ],
+    "the Generalizations of relational databases": ["gener", "relat", "databas"],
+    "❤️ women's \U0001f44d\U0001f3fd dress": [
+        "❤️",
+        "women",
+        "\U0001f44d\U0001f3fd",
+        "dress",
+    ],
+    "naïve café ½ İSTANBUL": ["naïv", "café", "istanbul"],
+    "caresses ponies hopping happily": ["caress", "poni", "hop", "happili"],
+}
+# Field length -> (norm byte, decoded length) of Lucene's SmallFloat.intToByte4
+LENGTH_NORMS = {
+    0: (0, 0),
+    23: (23, 23),
+    40: (40, 40),
+    100: (57, 96),
+    1000: (87, 984),
+    123456: (143, 122904),
+}
+WORDS = [
+    "shoe", "shoes", "women's", "men", "dress", "red", "blue", "cotton", "the",
+    "size", "10.5", "running", "gift", "set", "pack", "leather", "❤️",
+]  # fmt: skip
+NUM_PRODUCTS = 120
+
+
+def random_docs(num_docs=200, seed=0):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(num_docs):
+        # Lengths past 40 terms exercise the quantized norms
+        words = rng.choices(WORDS, k=rng.choice([0, 1, 3, 8, 30, 70, 150]))
+        docs.append((f"B{rng.randrange(10**8):08d}{i:03d}", " ".join(words)))
+    return docs
+
+
+def random_queries(num_queries=100, seed=1):
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choices(WORDS + ["unseen"], k=rng.randint(1, 5)))
+        for _ in range(num_queries)
+    ] + ["", "the", "unseen"]
+
+
+def reference_search(docs, q, k, num_products=None):
+    """Score every document on its own, the way Lucene's BM25Scorer does"""
+    analyzed = [Counter(bm25.analyze(contents)) for _, contents in docs]
+    lengths = [sum(tf.values()) for tf in analyzed]
+    doc_count = sum(1 for length in lengths if length)
+    cache = bm25.norm_inverse_cache(np.float32(sum(lengths) / doc_count))
+    scored = []
+    for (asin, _), tf, length in list(zip(docs, analyzed, lengths))[:num_products]:
+        score = 0.0
+        for term, count in Counter(bm25.analyze(q)).items():
+            if tf[term]:
+                doc_freq = sum(1 for other in analyzed if other[term])
+                weight = np.float32(count) * bm25.idf(doc_freq, doc_count)
+                norm = np.float32(1) + np.float32(tf[term]) * cache[
+                    bm25.encode_length(length)
+                ]
+                score += float(weight - weight / norm)
+        if score:
+            scored.append((np.float32(score), asin))
+    scored.sort(key=lambda hit: (-hit[0], hit[1]))
+    scores = bm25.adjust_score_ties(np.array([s for s, _ in scored[:k]], np.float32))
+    return [(asin, float(s)) for (_, asin), s in zip(scored, scores)]
+
+
+@pytest.fixture(scope="module")
+def searcher(tmp_path_factory):
+    collection_dir = tmp_path_factory.mktemp("resources_all")
+    docs = random_docs()
+    for shard, start in enumerate(range(0, len(docs), 64)):
+        with open(collection_dir / f"shard_{shard:05d}.jsonl", "w") as f:
+            for asin, contents in docs[start : start + 64]:
+                f.write(json.dumps({"id": asin, "contents": contents}) + "\n")
+    index_path = str(collection_dir.parent / "bm25_all.npz")
+    bm25.build_index(str(collection_dir), index_path, workers=1)
+    return docs, bm25.BM25Searcher(index_path)
+
+
+def test_analyze_matches_lucene():
+    for text, terms in ANALYZED.items():
+        assert bm25.analyze(text) == terms, text
+
+
+def test_length_norms_match_lucene():
+    for length, (norm, decoded) in LENGTH_NORMS.items():
+        assert bm25.encode_length(length) == norm
+        assert bm25.decode_length(norm) == decoded
+
+
+def test_search_matches_reference(searcher):
+    docs, search_engine = searcher
+    for q in random_queries():
+        hits = [(hit.docid, hit.score) for hit in search_engine.search(q, k=10)]
+        assert hits == reference_search(docs, q, k=10), q
+
+
+def test_restrict_matches_reference(searcher):
+    docs, search_engine = searcher
+    restricted = search_engine.restrict(NUM_PRODUCTS)
+    assert restricted.num_docs == NUM_PRODUCTS
+    for q in random_queries():
+        hits = [(hit.docid, hit.score) for hit in restricted.search(q, k=50)]
+        assert hits == reference_search(docs, q, k=50, num_products=NUM_PRODUCTS), q
+
+
+def test_batch_search_matches_search(searcher):
+    _, search_engine = searcher
+    queries = random_queries()
+    qids = [str(i) for i in range(len(queries))]
+    results = search_engine.batch_search(queries, qids, k=20)
+    for q, qid in zip(queries, qids):
+        assert results[qid] == search_engine.search(q, k=20), q
@@ -0,0 +1,89 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Round trip of the compiled catalog against loading the raw catalog."""
+
+import random
+
+import pytest
+
+from personalized_shopping.shared_libraries.web_agent_site.engine import catalog
+from personalized_shopping.shared_libraries.web_agent_site.engine.engine import (
+    load_products,
+)
+from personalized_shopping.shared_libraries.web_agent_site.engine.goal import (
+    get_synthetic_goals,
+)
+
+
+@pytest.fixture(scope="module")
+def compiled_catalog(raw_catalog):
+    return catalog.compile_catalog(
+        raw_catalog, catalog.get_catalog_path(raw_catalog), human_goals=False
+    )
+
+
+def load_seeded(load_fn, path, num_products):
+    # Price ranges are drawn with `random`, so both loads share one seed
+    random.seed(0)
+    return load_fn(path, num_products=num_products, human_goals=False)
+
+
+@pytest.mark.parametrize("num_products", [None, 25])
+def test_catalog_matches_load_products(raw_catalog, compiled_catalog, num_products):
+    assert catalog.is_catalog(compiled_catalog)
+    assert not catalog.is_catalog(raw_catalog)
+    expected = load_seeded(load_products, raw_catalog, num_products)
+    got = load_seeded(catalog.load_catalog, compiled_catalog, num_products)
+    all_products, product_item_dict, product_prices, attribute_to_asins = got
+
+    assert isinstance(all_products, catalog.LazyProductList)
+    assert isinstance(product_item_dict, catalog.LazyProductDict)
+    assert list(all_products) == expected[0]
+    assert list(all_products[5:10]) == expected[0][5:10]
+    assert dict(product_item_dict) == expected[1]
+    assert product_prices == expected[2]
+    assert attribute_to_asins == expected[3]
+    assert "B000000000" not in product_item_dict
+    with pytest.raises(KeyError):
+        product_item_dict["B000000000"]
+
+
+@pytest.mark.parametrize("num_products", [None, 25])
+def test_goals_from_goal_fields(raw_catalog, compiled_catalog, num_products):
+    all_products, _, product_prices, _ = load_seeded(
+        load_products, raw_catalog, num_products
+    )
+    random.seed(1)
+    expected = list(get_synthetic_goals(all_products, product_prices))
+
+    lazy_products = load_seeded(catalog.load_catalog, compiled_catalog, num_products)[0]
+    goal_products = catalog.get_goal_products(lazy_products)
+    assert goal_products is not lazy_products
+    assert [p["asin"] for p in goal_products] == [
+        p["asin"] for p in all_products if catalog.has_goals(p, human_goals=False)
+    ]
+    random.seed(1)
+    assert list(get_synthetic_goals(goal_products, product_prices)) == expected
+    assert expected
+
+
+def test_other_format_versions_are_rejected(compiled_catalog, tmp_path):
+    with open(compiled_catalog, "rb") as f:
+        data = f.read()
+    old_catalog = tmp_path / "old.catalog"
+    old_catalog.write_bytes(catalog.CATALOG_MAGIC_PREFIX + b"01\n" + data[len(catalog.CATALOG_MAGIC) :])
+    assert catalog.is_catalog(old_catalog)
+    with pytest.raises(ValueError, match="compile it again"):
+        catalog.load_catalog(old_catalog, human_goals=False)
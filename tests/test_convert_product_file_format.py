@@ -0,0 +1,140 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sharding, hashing and collection links of the Lucene collection converter."""
+
+import hashlib
+import itertools
+import json
+import os
+import sys
+
+import pytest
+
+from personalized_shopping.shared_libraries import web_agent_site
+from personalized_shopping.shared_libraries.search_engine import (
+    convert_product_file_format as convert,
+)
+from personalized_shopping.shared_libraries.web_agent_site import engine
+from personalized_shopping.shared_libraries.web_agent_site.engine.engine import (
+    iter_products,
+)
+
+
+@pytest.fixture
+def converter(tmp_path, monkeypatch):
+    """Run the converter in `tmp_path`, with collection sizes of 20 and 50"""
+    # The script imports the engine as `web_agent_site` from its own directory
+    monkeypatch.setitem(sys.modules, "web_agent_site", web_agent_site)
+    monkeypatch.setitem(sys.modules, "web_agent_site.engine", engine)
+    monkeypatch.setitem(sys.modules, "web_agent_site.engine.engine", engine.engine)
+    monkeypatch.setattr(convert, "SIZES", {"20": 20, "50": 50})
+    monkeypatch.chdir(tmp_path)
+    return convert
+
+
+def test_shard_bounds():
+    bounds = list(itertools.islice(convert.shard_bounds(), 14))
+    assert bounds[:4] == [(0, 100), (100, 1000), (1000, 5000), (5000, 10000)]
+    assert bounds[-4:] == [
+        (40000, 45000),
+        (45000, 50000),
+        (50000, 55000),
+        (55000, 60000),
+    ]
+    # Every collection size is a shard boundary
+    ends = {end for _, end in bounds}
+    assert set(convert.SIZES.values()) <= ends
+    assert all(start < end for start, end in bounds)
+    assert all(a[1] == b[0] for a, b in zip(bounds, bounds[1:]))
+
+    bounds = list(itertools.islice(convert.shard_bounds(shard_size=300), 6))
+    assert [end for _, end in bounds] == [100, 300, 600, 900, 1000, 1200]
+
+
+def test_iter_shards():
+    shards = list(convert.iter_shards(range(1234), shard_size=500))
+    assert [(start, len(batch)) for start, batch in shards] == [
+        (0, 100),
+        (100, 400),
+        (500, 500),
+        (1000, 234),
+    ]
+    assert [p for _, batch in shards for p in batch] == list(range(1234))
+    assert list(convert.iter_shards([], shard_size=500)) == []
+
+
+def read_docs(shard_dir, manifest):
+    docs = []
+    for shard in manifest["shards"]:
+        with open(os.path.join(shard_dir, shard["name"])) as f:
+            docs.extend(json.loads(line) for line in f)
+    return docs
+
+
+def test_build_shards(converter, raw_catalog, capsys):
+    manifest = converter.build_shards(raw_catalog, workers=2, shard_size=15)
+    shards = manifest["shards"]
+    assert [(s["name"], s["start"], s["end"]) for s in shards] == [
+        ("shard_00000.jsonl", 0, 15),
+        ("shard_00001.jsonl", 15, 20),
+        ("shard_00002.jsonl", 20, 30),
+        ("shard_00003.jsonl", 30, 45),
+        ("shard_00004.jsonl", 45, 50),
+        ("shard_00005.jsonl", 50, 60),
+    ]
+    with open(os.path.join(converter.SHARD_DIR, converter.MANIFEST_NAME)) as f:
+        assert json.load(f) == manifest
+    for shard in shards:
+        with open(os.path.join(converter.SHARD_DIR, shard["name"]), "rb") as f:
+            assert hashlib.sha256(f.read()).hexdigest() == shard["sha256"]
+
+    # The docs are those of the serially normalized catalog, in catalog order
+    expected = [
+        convert.product_to_doc(p) for p in iter_products(raw_catalog, human_goals=False)
+    ]
+    assert read_docs(converter.SHARD_DIR, manifest) == json.loads(json.dumps(expected))
+
+    # A rebuild leaves unchanged shards alone and drops stale ones
+    stale = os.path.join(converter.SHARD_DIR, "shard_00009.jsonl")
+    open(stale, "w").close()
+    capsys.readouterr()
+    assert converter.build_shards(raw_catalog, workers=1, shard_size=15) == manifest
+    assert "written" not in capsys.readouterr().out
+    assert not os.path.exists(stale)
+
+
+def test_link_collections(converter, raw_catalog):
+    manifest = converter.build_shards(raw_catalog, workers=1, shard_size=15)
+    converter.link_collections(manifest)
+    for size_name, size in [("20", 20), ("50", 50), ("all", 60)]:
+        resource_dir = f"resources_{size_name}"
+        shards = [s for s in manifest["shards"] if s["end"] <= size]
+        assert sorted(os.listdir(resource_dir)) == [s["name"] for s in shards]
+        assert len(read_docs(resource_dir, {"shards": shards})) == size
+        stamp = hashlib.sha256(
+            "".join(f"{s['sha256']}\n" for s in shards).encode()
+        ).hexdigest()
+        with open(resource_dir + convert.STAMP_SUFFIX) as f:
+            assert f.read() == stamp + "\n"
+
+    # Stamps only change with the shards of their collection
+    with open("resources_20" + convert.STAMP_SUFFIX) as f:
+        stamp_20 = f.read()
+    manifest["shards"][-1]["sha256"] = "0" * 64
+    converter.link_collections(manifest)
+    with open("resources_20" + convert.STAMP_SUFFIX) as f:
+        assert f.read() == stamp_20
+    with open("resources_all" + convert.STAMP_SUFFIX) as f:
+        assert f.read() != stamp_20
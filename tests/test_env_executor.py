@@ -0,0 +1,102 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Timeouts and concurrency of environment calls run on the worker pool."""
+
+import asyncio
+import importlib
+import threading
+import time
+
+import pytest
+
+from personalized_shopping.shared_libraries import env_executor
+from personalized_shopping.shared_libraries.init_env import WebshopEnvManager
+
+
+@pytest.fixture
+def manager(raw_catalog, fake_search_engine):
+    manager = WebshopEnvManager(num_products=None, file_path=raw_catalog)
+    manager.get_env("s1")
+    manager.get_env("s2")
+    return manager
+
+
+def step(manager, session_id, events, wait=None):
+    """Hold the session like a tool step does, logging when it runs"""
+    with manager.session(session_id) as env:
+        events.append(("start", session_id))
+        if wait is not None:
+            wait()
+        env.step("search[shirt]")
+        events.append(("end", session_id))
+
+
+@pytest.mark.asyncio
+async def test_timeout_keeps_the_session_serialized(manager):
+    events, release = [], threading.Event()
+    with pytest.raises(asyncio.TimeoutError):
+        await env_executor.run_env_call(
+            step, manager, "s1", events, lambda: release.wait(10), timeout=0.05
+        )
+    # The timed-out step still runs and holds the session's lock
+    assert events == [("start", "s1")]
+    try:
+        call = asyncio.ensure_future(
+            env_executor.run_env_call(step, manager, "s1", events)
+        )
+        await asyncio.sleep(0.2)
+        assert not call.done()
+        assert events == [("start", "s1")]
+    finally:
+        release.set()
+    await call
+    assert events == [("start", "s1"), ("end", "s1"), ("start", "s1"), ("end", "s1")]
+
+
+@pytest.mark.asyncio
+async def test_sessions_overlap(manager):
+    events = []
+    # Each step only goes on once the other session's step is running too
+    barrier = threading.Barrier(2, timeout=10)
+    await asyncio.gather(
+        env_executor.run_env_call(step, manager, "s1", events, barrier.wait),
+        env_executor.run_env_call(step, manager, "s2", events, barrier.wait),
+    )
+    assert sorted(events[:2]) == [("start", "s1"), ("start", "s2")]
+    assert sorted(events[2:]) == [("end", "s1"), ("end", "s2")]
+
+
+@pytest.fixture
+def reload_executor(monkeypatch):
+    """Re-read the module's settings from the environment"""
+    yield lambda: importlib.reload(env_executor)
+    monkeypatch.undo()
+    env_executor.shutdown_env_executor()
+    importlib.reload(env_executor)
+
+
+@pytest.mark.asyncio
+async def test_zero_timeout_waits_forever(monkeypatch, reload_executor):
+    monkeypatch.setenv("WEBSHOP_ENV_TIMEOUT", "0.05")
+    assert reload_executor().ENV_TIMEOUT == 0.05
+    with pytest.raises(asyncio.TimeoutError):
+        await env_executor.run_env_call(time.sleep, 0.3)
+
+    monkeypatch.setenv("WEBSHOP_ENV_TIMEOUT", "0")
+    monkeypatch.setenv("WEBSHOP_ENV_WORKERS", "2")
+    module = reload_executor()
+    assert module.ENV_TIMEOUT is None
+    assert module.get_env_executor()._max_workers == 2
+    assert await module.run_env_call(lambda: time.sleep(0.3) or "done") == "done"
@@ -0,0 +1,194 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Differential tests of the batch reward scorer and the lazy goal space."""
+
+from collections import Counter, defaultdict
+import itertools
+import json
+import random
+
+import pytest
+
+from personalized_shopping.shared_libraries.web_agent_site.engine.engine import (
+    load_products,
+)
+from personalized_shopping.shared_libraries.web_agent_site.engine.goal import (
+    PRICE_RANGE,
+    SyntheticGoalSpace,
+    get_reward,
+    get_rewards,
+    get_synthetic_goals,
+)
+
+# Goal attributes that only match a product's title, features or description
+TEXT_ATTRIBUTES = ["cotton", "leather", "machine wash", "red"]
+
+
+def eager_synthetic_goals(all_products, product_prices):
+    """Every goal of every product, expanded up front with `itertools.product`"""
+    goals = []
+    cnt_atts = defaultdict(int)
+    for product in all_products:
+        if product.get("instruction_text") is None:
+            continue
+        asin = product["asin"]
+        attributes = product["instruction_attributes"]
+        price_range = [p for p in PRICE_RANGE if p > product_prices[asin]][:4]
+        if len(price_range) >= 2:
+            _, price_upper = sorted(random.sample(price_range, 2))
+            price_text = f", and price lower than {price_upper:.2f} dollars"
+        else:
+            price_upper = 1000000
+            price_text = ""
+
+        options = product["options"]
+        option_names = sorted(options)
+        for combination in itertools.product(*(options[n] for n in option_names)):
+            goal_options = dict(zip(option_names, combination))
+            option_text = ", and ".join(f"{k}: {v}" for k, v in goal_options.items())
+            option_text = " with " + option_text if option_text else ""
+            goals.append(
+                {
+                    "asin": asin,
+                    "category": product["category"],
+                    "query": product["query"],
+                    "name": product["name"],
+                    "product_category": product["product_category"],
+                    "instruction_text": (
+                        f'{product["instruction_text"]}{option_text}{price_text}'
+                    ),
+                    "attributes": attributes,
+                    "price_upper": price_upper,
+                    "goal_options": goal_options,
+                    "title": product["Title"],
+                }
+            )
+            for att in attributes:
+                cnt_atts[att] += 1
+    for goal in goals:
+        goal["weight"] = sum(1.0 / cnt_atts[att] for att in goal["attributes"]) / len(
+            goal["attributes"]
+        )
+    return goals
+
+
+def goal_key(goal):
+    return json.dumps(goal, sort_keys=True)
+
+
+@pytest.fixture(scope="module")
+def products(raw_catalog):
+    random.seed(0)
+    all_products, product_item_dict, product_prices, _ = load_products(
+        raw_catalog, human_goals=False
+    )
+    random.seed(0)
+    goals = get_synthetic_goals(all_products, product_prices)
+    return all_products, product_item_dict, product_prices, goals
+
+
+def random_episodes(all_products, product_item_dict, goals, num_episodes, seed=0):
+    rng = random.Random(seed)
+    episodes = []
+    for _ in range(num_episodes):
+        goal = goals[rng.randrange(len(goals))]
+        if rng.random() < 0.3:
+            # Human goals list their option values instead of a dict
+            goal = dict(goal, goal_options=list(goal["goal_options"].values()))
+        if rng.random() < 0.3:
+            goal = dict(goal, attributes=goal["attributes"] + TEXT_ATTRIBUTES[:2])
+        if rng.random() < 0.5:
+            product = product_item_dict[goal["asin"]]
+        else:
+            product = rng.choice(all_products)
+        options = {
+            name: rng.choice(values)
+            for name, values in product["options"].items()
+            if rng.random() < 0.7
+        }
+        episodes.append((product["asin"], options, goal))
+    return episodes
+
+
+def test_get_rewards_matches_get_reward(products):
+    all_products, product_item_dict, product_prices, goals = products
+    episodes = random_episodes(all_products, product_item_dict, goals, 300)
+    assert any(not options for _, options, _ in episodes)
+    assert any(not goal["goal_options"] for _, _, goal in episodes)
+
+    expected = [
+        get_reward(
+            product_item_dict[asin],
+            goal,
+            price=product_prices.get(asin),
+            options=options,
+            verbose=True,
+        )
+        for asin, options, goal in episodes
+    ]
+    got = get_rewards(episodes, product_item_dict, product_prices, verbose=True)
+    for episode, (reward, info), (expected_reward, expected_info) in zip(
+        episodes, got, expected
+    ):
+        assert reward == expected_reward, episode
+        assert info == expected_info, episode
+    assert len(got) == len(expected)
+    assert get_rewards(episodes, product_item_dict, product_prices) == [
+        reward for reward, _ in expected
+    ]
+
+
+def test_goal_space_matches_eager_goals(products):
+    all_products, _, product_prices, goals = products
+    random.seed(0)
+    expected = eager_synthetic_goals(all_products, product_prices)
+    assert isinstance(goals, SyntheticGoalSpace)
+    assert len(goals) == len(expected)
+    assert any(len(goal["goal_options"]) > 1 for goal in expected)
+    for i, goal in enumerate(expected):
+        assert goals[i] == goal, i
+        assert goals[i]["weight"] == goal["weight"], i
+    assert goals[-1] == expected[-1]
+    assert goals[3:9] == expected[3:9]
+    with pytest.raises(IndexError):
+        goals[len(goals)]
+
+
+def test_goal_space_shuffle_and_sample(products):
+    all_products, _, product_prices, _ = products
+    random.seed(0)
+    goals = get_synthetic_goals(all_products, product_prices)
+    random.seed(0)
+    expected = eager_synthetic_goals(all_products, product_prices)
+    goals.shuffle(random.Random(1))
+
+    # The shuffle permutes the goals
+    shuffled = [goal_key(goal) for goal in goals]
+    assert shuffled != [goal_key(goal) for goal in expected]
+    assert sorted(shuffled) == sorted(goal_key(goal) for goal in expected)
+
+    # Sampled indices point at goals drawn in proportion to the eager weights
+    rng = random.Random(2)
+    num_samples = 20000
+    counts = Counter(goals[goals.sample(rng)]["asin"] for _ in range(num_samples))
+    weights = Counter()
+    for goal in expected:
+        weights[goal["asin"]] += goal["weight"]
+    total = sum(weights.values())
+    for asin, weight in weights.items():
+        assert abs(counts[asin] / num_samples - weight / total) < 0.015, asin
+
+    idxs = goals.sample_without_replacement(len(goals) // 2, rng)
+    assert len(idxs) == len(set(idxs)) == len(goals) // 2
@@ -0,0 +1,56 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+
+# Seconds `import personalized_shopping` may take in a fresh interpreter
+IMPORT_TIME_BUDGET = float(os.environ.get("IMPORT_TIME_BUDGET", "10"))
+
+IMPORT_SCRIPT = """
+import json, sys, threading, time
+start = time.perf_counter()
+import personalized_shopping
+elapsed = time.perf_counter() - start
+# Library code the tools and scripts use must not start the prewarm either
+import personalized_shopping.shared_libraries.init_env
+print(json.dumps({
+    "elapsed": elapsed,
+    "heavy_modules": sorted(
+        {"spacy", "torch", "pyserini", "jnius", "google.adk"} & set(sys.modules)
+    ),
+    "threads": sorted(t.name for t in threading.enumerate()),
+}))
+"""
+
+
+def test_import_is_fast_and_lazy():
+    """Importing the package must not load spaCy, torch, ADK or the JVM."""
+    # The default environment: prewarming is left to the agent's start-up
+    env = dict(os.environ)
+    env.pop("WEBSHOP_PREWARM", None)
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    assert stats["heavy_modules"] == []
+    assert stats["threads"] == ["MainThread"]
+    assert stats["elapsed"] < IMPORT_TIME_BUDGET
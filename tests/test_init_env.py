@@ -0,0 +1,50 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-session environments of `WebshopEnvManager` over one shared server."""
+
+from personalized_shopping.shared_libraries.init_env import WebshopEnvManager
+
+
+def test_sessions_share_the_server(raw_catalog, fake_search_engine):
+    manager = WebshopEnvManager(num_products=None, file_path=raw_catalog)
+    with manager.session("s1") as env1, manager.session("s2") as env2:
+        assert env1 is not env2
+        assert env1.server is env2.server is manager.server
+        env1.step("search[shirt]")
+        assert env2.browser.page_data["page_type"] == "index"
+    assert manager.get_env("s1") is env1
+    assert len(manager) == 2
+
+    manager.close_session("s1")
+    assert len(manager) == 1
+    assert "s1" not in manager.server.user_sessions
+
+
+def test_evicted_sessions_drop_their_env(raw_catalog, fake_search_engine):
+    manager = WebshopEnvManager(num_products=None, file_path=raw_catalog)
+    env = manager.get_env("s1")
+    manager.server.user_sessions.maxsize = 2
+    manager.get_env("s2")
+    manager.get_env("s3")
+    assert len(manager) == 2
+    assert "s1" not in manager.server.user_sessions
+
+    # A session coming back gets a new environment and can be stepped again
+    with manager.session("s1") as new_env:
+        assert new_env is not env
+        _, _, done, info = new_env.step("search[shirt]")
+    assert not done
+    assert info["page_data"]["page_type"] == "search_results"
+    assert len(manager) == 2
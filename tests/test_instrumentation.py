@@ -0,0 +1,186 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Latency histograms, action labels and exports of the step instrumentation."""
+
+import json
+import threading
+
+import pytest
+
+from personalized_shopping.shared_libraries.web_agent_site import instrumentation
+from personalized_shopping.shared_libraries.web_agent_site.envs.web_agent_text_env import (
+    SimServer,
+)
+from personalized_shopping.shared_libraries.web_agent_site.instrumentation import (
+    BUCKETS,
+    Histogram,
+)
+
+
+@pytest.fixture
+def recording(monkeypatch):
+    monkeypatch.setattr(instrumentation, "ENABLED", True)
+    instrumentation.reset()
+    yield
+    instrumentation.reset()
+
+
+def test_bucket_placement():
+    for i, le in enumerate(BUCKETS):
+        histogram = Histogram()
+        # Buckets hold values up to and including their upper bound
+        histogram.observe(le)
+        histogram.observe(le * 1.0001)
+        expected = [0] * (len(BUCKETS) + 1)
+        expected[i] += 1
+        expected[i + 1] += 1
+        assert histogram.counts == expected, le
+
+    histogram = Histogram()
+    for value in [0.0, 1e-6, 51.0, 1e9]:
+        histogram.observe(value)
+    assert histogram.counts[0] == 2
+    assert histogram.counts[-1] == 2
+    assert (histogram.count, histogram.sum) == (4, 0.0 + 1e-6 + 51.0 + 1e9)
+    assert (histogram.min, histogram.max) == (0.0, 1e9)
+
+
+def test_quantiles():
+    histogram = Histogram()
+    assert histogram.quantile(0.5) is None
+    assert histogram.to_dict()["mean"] is None
+
+    for _ in range(50):
+        histogram.observe(0.0002)
+        histogram.observe(0.02)
+    # Interpolated inside the bucket, which is clipped to the observed range
+    assert histogram.quantile(0.5) == pytest.approx(0.00025)
+    assert histogram.quantile(0.9) == pytest.approx(0.018)
+    assert histogram.quantile(0.99) == pytest.approx(0.0198)
+    assert histogram.quantile(1.0) == pytest.approx(0.02)
+    assert histogram.quantile(0.0) == pytest.approx(0.0002)
+
+    stats = histogram.to_dict()
+    assert stats["p50"] == histogram.quantile(0.5)
+    assert stats["p99"] == histogram.quantile(0.99)
+    assert stats["mean"] == pytest.approx(0.0101)
+    assert stats["buckets"]["0.00025"] == stats["buckets"]["0.025"] == 50
+    assert stats["buckets"]["+Inf"] == 0
+
+    # A single value is every quantile
+    histogram = Histogram()
+    histogram.observe(3.0)
+    assert [histogram.quantile(q) for q in (0.01, 0.5, 1.0)] == [3.0, 3.0, 3.0]
+
+
+def test_disabled_timer_is_a_noop(monkeypatch):
+    monkeypatch.setattr(instrumentation, "ENABLED", False)
+    instrumentation.reset()
+    assert instrumentation.timer("search") is instrumentation.timer("render")
+    with instrumentation.action("search"), instrumentation.timer("search"):
+        pass
+    assert instrumentation.snapshot() == {}
+
+    instrumentation.enable()
+    try:
+        assert instrumentation.is_enabled()
+        with instrumentation.timer("search"):
+            pass
+    finally:
+        instrumentation.enable(False)
+        instrumentation.reset()
+    assert not instrumentation.is_enabled()
+
+
+def test_action_labels_are_thread_local(recording):
+    barrier = threading.Barrier(2, timeout=10)
+
+    def step(name):
+        with instrumentation.action(name):
+            barrier.wait()  # both threads have set their label
+            with instrumentation.timer("step"):
+                pass
+            barrier.wait()
+
+    threads = [threading.Thread(target=step, args=(n,)) for n in ("search", "click")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with instrumentation.action("reset"):
+        with instrumentation.action("click"):
+            instrumentation.record("text", 0.1)
+        instrumentation.record("text", 0.2)
+        # An explicit action wins over the thread's label
+        with instrumentation.timer("artifact", action="search"):
+            pass
+    instrumentation.record("text", 0.3)
+
+    snapshot = instrumentation.snapshot()
+    assert sorted(snapshot["step"]) == ["click", "search"]
+    assert all(h["count"] == 1 for h in snapshot["step"].values())
+    assert {a: h["sum"] for a, h in snapshot["text"].items()} == {
+        "click": 0.1,
+        "reset": 0.2,
+        instrumentation.NO_ACTION: 0.3,
+    }
+    assert list(snapshot["artifact"]) == ["search"]
+
+
+def test_to_json(recording):
+    instrumentation.record("search", 0.003, action="search")
+    instrumentation.record("render", 0.02, action="click")
+    data = json.loads(instrumentation.to_json())
+    assert data == instrumentation.snapshot()
+    assert list(data) == ["render", "search"]
+    search = data["search"]["search"]
+    assert search["count"] == 1
+    assert search["p50"] == search["min"] == search["max"] == 0.003
+    assert list(search["buckets"]) == [str(le) for le in BUCKETS] + ["+Inf"]
+    assert search["buckets"]["0.005"] == 1
+
+
+def test_to_prometheus(recording):
+    instrumentation.record("search", 0.003, action='a"b\\c\nd')
+    instrumentation.record("search", 0.0001, action='a"b\\c\nd')
+    instrumentation.record("search", 60.0, action='a"b\\c\nd')
+    lines = instrumentation.to_prometheus().splitlines()
+    name = instrumentation.METRIC_NAME
+    labels = 'stage="search",action="a\\"b\\\\c\\nd"'
+    assert lines[:2] == [
+        f"# HELP {name} Latency of WebShop environment step stages in seconds.",
+        f"# TYPE {name} histogram",
+    ]
+    # Bucket counts are cumulative
+    assert lines[2] == f'{name}_bucket{{{labels},le="0.0001"}} 1'
+    assert lines[7] == f'{name}_bucket{{{labels},le="0.005"}} 2'
+    assert lines[19] == f'{name}_bucket{{{labels},le="50.0"}} 2'
+    assert lines[20] == f'{name}_bucket{{{labels},le="+Inf"}} 3'
+    assert lines[21] == f"{name}_sum{{{labels}}} {0.003 + 0.0001 + 60.0!r}"
+    assert lines[22] == f"{name}_count{{{labels}}} 3"
+    assert len(lines) == 23
+    assert instrumentation.to_prometheus().endswith("\n")
+
+
+def test_server_stage_times(recording, raw_catalog, fake_search_engine):
+    server = SimServer("http://127.0.0.1:3000", raw_catalog, num_products=None)
+    assert (server.search_time, server.render_time, server.sample_time) == (0, 0, 0)
+    server.receive("s1", None)
+    page, _, _, _ = server.receive("s1", None, keywords=["shirt"])
+    assert page.html  # pages are rendered when first read
+    assert server.sample_time == instrumentation.total_seconds("sample") > 0
+    assert server.search_time == instrumentation.total_seconds("search") > 0
+    assert server.render_time == instrumentation.total_seconds("render") > 0
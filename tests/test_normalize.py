@@ -0,0 +1,120 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Differential test of the compiled color/size normalizers."""
+
+import itertools
+import random
+import re
+
+from personalized_shopping.shared_libraries.web_agent_site.engine.normalize import (
+    COLOR_SET,
+    SIZE_PATTERNS,
+    SIZE_SET,
+    normalize_color,
+    normalize_color_size,
+    normalize_colors,
+)
+
+
+def reference_normalize_color(color_string):
+    for norm_color in COLOR_SET:
+        if norm_color in color_string:
+            return norm_color
+    return color_string
+
+
+def reference_normalize_color_size(product_prices):
+    all_colors, all_sizes = set(), set()
+    for (_, color, size), _ in product_prices.items():
+        all_colors.add(color.lower())
+        all_sizes.add(size.lower())
+
+    color_mapping = {"N.A.": "not_matched"}
+    for c in all_colors:
+        matched = False
+        for base in COLOR_SET:
+            if base in c:
+                color_mapping[c] = base
+                matched = True
+                break
+        if not matched:
+            color_mapping[c] = "not_matched"
+
+    size_mapping = {"N.A.": "not_matched"}
+    for s in all_sizes:
+        matched = False
+        for pattern in SIZE_PATTERNS:
+            m = re.search(pattern, s)
+            if m is not None:
+                matched = True
+                size_mapping[s] = pattern.pattern
+                break
+        if not matched:
+            if s.replace(".", "", 1).isdigit():
+                size_mapping[s] = "numeric_size"
+                matched = True
+        if not matched:
+            size_mapping[s] = "not_matched"
+
+    return color_mapping, size_mapping
+
+
+def option_strings():
+    rng = random.Random(0)
+    words = COLOR_SET + SIZE_SET + [
+        "N.A.", "w x", "l", "h", "neck", "sleeve", "women", "men", "|", "wide",
+        "narrow", "petite", "inch", "plus", "mm", "ft", "feet", "meter", "yards",
+        "*", "-", '"', "f", "m", "cm", "g", "by", "x", "12", "3.5", "10.5.1",
+        "stonewash", "ashy", "redwine", "\n", "é", "",
+    ]
+    strings = list(words)
+    strings += [a + b for a, b in itertools.product(COLOR_SET, repeat=2)]
+    for _ in range(20000):
+        k = rng.randint(1, 4)
+        sep = rng.choice(["", " ", "-", " / ", "\n"])
+        strings.append(sep.join(rng.choice(words) for _ in range(k)))
+    letters = "".join(sorted(set("".join(COLOR_SET + SIZE_SET)))) + ' 0123456789."*|'
+    for _ in range(20000):
+        strings.append("".join(rng.choice(letters) for _ in range(rng.randint(0, 12))))
+    return strings
+
+
+def test_normalize_color_matches_reference():
+    strings = option_strings()
+    for s in strings:
+        assert normalize_color(s) == reference_normalize_color(s), s
+    # Goal options of synthetic goals are (option name, value) tuples
+    for option in [("color", "red"), ("size", "stonewash"), ("color", "navy blue")]:
+        assert normalize_color(option) == reference_normalize_color(option)
+
+
+def test_normalize_color_size_matches_reference():
+    strings = option_strings()
+    rng = random.Random(1)
+    product_prices = {
+        ("B000000000", rng.choice(strings), s): 1.0 for s in strings
+    }
+    assert normalize_color_size(product_prices) == reference_normalize_color_size(
+        product_prices
+    )
+
+
+def test_normalize_colors():
+    strings = option_strings()
+    expected = {
+        s: next((c for c in COLOR_SET if c in s), "not_matched") for s in strings
+    }
+    assert normalize_colors(strings) == expected
+    assert expected["stonewash"] == "ash"
@@ -0,0 +1,152 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Differential test of the direct text renderer against parsing the HTML."""
+
+import random
+
+from bs4 import BeautifulSoup
+
+from personalized_shopping.shared_libraries.web_agent_site.engine.engine import (
+    ACTION_TO_TEMPLATE,
+    END_BUTTON,
+    map_action_to_html,
+)
+from personalized_shopping.shared_libraries.web_agent_site.engine.pages import (
+    Page,
+    get_clickables,
+    render_text,
+)
+from personalized_shopping.shared_libraries.web_agent_site.envs.web_agent_text_env import (
+    tag_visible,
+)
+
+# Fragments that exercise escaping and BeautifulSoup's whitespace collapsing
+WHITESPACE_PIECES = ["", " ", "\n", "\n\n", " \t", "\xa0", "\r\n", "\x0c", " pad "]
+MARKUP_PIECES = ["<b>bold</b>", "&amp;", "&", "'", '"', "<!-- c -->", "<script>"]
+PIECES = WHITESPACE_PIECES + MARKUP_PIECES + ["shirt", "x\ny", "é"]
+
+
+def reference_text(html):
+    texts = BeautifulSoup(html, "html.parser").find_all(string=True)
+    return " [SEP] ".join(t.strip() for t in filter(tag_visible, texts) if t != "\n")
+
+
+def reference_clickables(html):
+    html_obj = BeautifulSoup(html, "html.parser")
+    has_search_bar = html_obj.find(id="search_input") is not None
+    buttons = html_obj.find_all(class_="btn")
+    product_links = html_obj.find_all(class_="product-link")
+    clickables = {
+        b.get_text().lower(): (b.get("class"), b.get("name"))
+        for b in buttons + product_links
+    }
+    for opt in html_obj.select('input[type="radio"]'):
+        clickables[opt.get("value")] = (opt.get("class"), opt.get("name"))
+    return has_search_bar, list(clickables.items())
+
+
+def random_string(rng):
+    return "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 3)))
+
+
+def random_product(rng):
+    return {
+        "asin": rng.choice(["B07ABC1234", random_string(rng)]),
+        "Title": random_string(rng),
+        "Price": rng.choice(["$10.99", 3.5, None, random_string(rng)]),
+        "Rating": rng.choice(["N.A.", 4.5, random_string(rng)]),
+        "MainImage": "https://example.com/image.jpg",
+        "Description": random_string(rng),
+        "BulletPoints": [random_string(rng) for _ in range(rng.randint(0, 3))],
+        "Reviews": [
+            {
+                "title": random_string(rng),
+                "score": rng.choice([1, "3", 5]),
+                "body": random_string(rng),
+            }
+            for _ in range(rng.randint(0, 2))
+        ],
+        "Attributes": [random_string(rng) for _ in range(rng.randint(0, 3))],
+        "category": random_string(rng),
+        "query": random_string(rng),
+        "product_category": random_string(rng),
+        "options": {
+            random_string(rng): [random_string(rng) for _ in range(rng.randint(0, 3))]
+            for _ in range(rng.randint(0, 2))
+        },
+        "option_to_image": {},
+    }
+
+
+def generate_pages(num_products=300, seed=0):
+    rng = random.Random(seed)
+    for _ in range(num_products):
+        product = random_product(rng)
+        instruction_text = rng.choice(["Find me a shirt", random_string(rng), None])
+        options = {k: v[0] for k, v in product["options"].items() if v}
+        page_kwargs = dict(
+            session_id="abc",
+            product_info=product,
+            keywords=["shirt", random_string(rng)],
+            page=rng.randint(1, 3),
+            asin=product["asin"],
+            options=options,
+            instruction_text=instruction_text,
+        )
+        yield "start", dict(session_id="abc", instruction_text=instruction_text)
+        yield "search", dict(
+            session_id="abc",
+            products=[product, random_product(rng)],
+            keywords=page_kwargs["keywords"],
+            page=page_kwargs["page"],
+            total=rng.choice([0, 50]),
+            instruction_text=instruction_text,
+        )
+        yield "click", dict(page_kwargs, show_attrs=rng.random() < 0.5)
+        for sub_page in ACTION_TO_TEMPLATE:
+            yield f"click[{sub_page}]", page_kwargs
+        yield f"click[{END_BUTTON}]", dict(
+            session_id="abc",
+            reward=rng.choice([0.0, 0.5, 1]),
+            asin=product["asin"],
+            options=options,
+            instruction_text=instruction_text,
+        )
+
+
+def test_render_text_matches_html():
+    for action, kwargs in generate_pages():
+        html = map_action_to_html(action, **kwargs)
+        assert render_text(action, **kwargs) == reference_text(html), action
+
+
+def test_clickables_match_html():
+    for action, kwargs in generate_pages():
+        html = map_action_to_html(action, **kwargs)
+        has_search_bar, text_to_clickable = get_clickables(action, **kwargs)
+        clickables = [
+            (text, (clickable.get("class"), clickable.get("name")))
+            for text, clickable in text_to_clickable.items()
+        ]
+        assert (has_search_bar, clickables) == reference_clickables(html), action
+
+
+def test_instruction_text_matches_html():
+    for action, kwargs in generate_pages(num_products=100):
+        if action != "start":
+            continue
+        html = map_action_to_html(action, **kwargs)
+        h4 = BeautifulSoup(html, "html.parser").find(id="instruction-text").h4
+        assert Page(action, **kwargs).instruction_text == h4.text
@@ -0,0 +1,64 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The per-page DOM cache of `WebAgentTextEnv.parse_html`."""
+
+from bs4 import BeautifulSoup
+
+from personalized_shopping.shared_libraries.web_agent_site.envs.web_agent_text_env import (
+    WebAgentTextEnv,
+)
+
+
+def reference_clickables(html):
+    html_obj = BeautifulSoup(html, "html.parser")
+    buttons = html_obj.find_all(class_="btn") + html_obj.find_all(class_="product-link")
+    clickables = [b.get_text().lower() for b in buttons]
+    clickables += [o.get("value") for o in html_obj.select('input[type="radio"]')]
+    return html_obj.find(id="search_input") is not None, clickables
+
+
+def test_parsed_page_is_replaced_after_each_step(raw_catalog, fake_search_engine):
+    env = WebAgentTextEnv(
+        observation_mode="text",
+        file_path=raw_catalog,
+        num_products=None,
+        direct_render=False,
+        html_parser="html.parser",
+    )
+    env.reset()
+    index_dom = env.parse_html()
+    assert env.parse_html() is index_dom  # one parse per page
+    assert env.get_available_actions() == {
+        "has_search_bar": True,
+        "clickables": ["search"],
+    }
+
+    dom = index_dom
+    steps = [("search[shirt]", True), (None, True), ("click[description]", True)]
+    # `next >` is not on the item page, so that step keeps the page as it is
+    steps += [("click[< prev]", True), ("click[next >]", False)]
+    steps += [("click[< prev]", True)]
+    for action, changes_page in steps:
+        if action is None:
+            # Open the first product of the results page
+            action = f"click[{env.get_available_actions()['clickables'][2]}]"
+        html = env.state["html"]
+        env.step(action)
+        assert (env.state["html"] != html) == changes_page, action
+        assert (env.parse_html() is not dom) == changes_page, action
+        dom = env.parse_html()
+        available = env.get_available_actions()
+        expected = reference_clickables(env.state["html"])
+        assert (available["has_search_bar"], available["clickables"]) == expected
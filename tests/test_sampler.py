@@ -0,0 +1,137 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Seeded tests of the alias sampler and the weighted sampling helpers."""
+
+from collections import Counter
+import random
+
+import numpy as np
+import pytest
+
+from personalized_shopping.shared_libraries.web_agent_site.engine.sampler import (
+    AliasSampler,
+    build_alias_table,
+    numpy_rng,
+    sample_without_replacement,
+    session_rng,
+)
+from personalized_shopping.shared_libraries.web_agent_site.envs.web_agent_text_env import (
+    WebAgentTextEnv,
+)
+
+WEIGHTS = [1.0, 0.0, 3.0, 6.0, 0.5, 2.5, 0.0, 7.0]
+NUM_SAMPLES = 50000
+TOLERANCE = 0.01
+
+
+def expected_frequencies(weights):
+    weights = np.asarray(weights)
+    return weights / weights.sum()
+
+
+def test_alias_table_is_exact():
+    prob, alias = build_alias_table(WEIGHTS)
+    # Column i keeps i with prob[i] and gives the rest to alias[i]
+    implied = prob.copy()
+    np.add.at(implied, alias, 1.0 - prob)
+    np.testing.assert_allclose(implied / len(WEIGHTS), expected_frequencies(WEIGHTS))
+
+    for weights in ([], [0.0, 0.0]):
+        with pytest.raises(ValueError):
+            build_alias_table(weights)
+
+
+def test_alias_sampler_frequencies():
+    sampler = AliasSampler(WEIGHTS)
+    assert len(sampler) == len(WEIGHTS)
+    rng = random.Random(0)
+    counts = Counter(sampler.sample(rng) for _ in range(NUM_SAMPLES))
+    batch_counts = np.bincount(
+        sampler.sample_batch(NUM_SAMPLES, numpy_rng(0)), minlength=len(WEIGHTS)
+    )
+    expected = expected_frequencies(WEIGHTS)
+    for i, frequency in enumerate(expected):
+        assert abs(counts[i] / NUM_SAMPLES - frequency) < TOLERANCE, i
+        assert abs(batch_counts[i] / NUM_SAMPLES - frequency) < TOLERANCE, i
+        if frequency == 0:
+            assert counts[i] == batch_counts[i] == 0
+
+
+def test_sample_without_replacement():
+    rng = numpy_rng(0)
+    nonzero = [i for i, w in enumerate(WEIGHTS) if w > 0]
+    for k in range(len(WEIGHTS) + 2):
+        idxs = sample_without_replacement(WEIGHTS, k, rng)
+        assert len(idxs) == len(set(idxs)) == min(k, len(nonzero))
+        assert set(idxs) <= set(nonzero)
+    assert sample_without_replacement(WEIGHTS, 0, rng) == []
+
+    # The first index drawn follows the weights
+    first = Counter(
+        sample_without_replacement(WEIGHTS, 3, rng)[0] for _ in range(NUM_SAMPLES)
+    )
+    for i, frequency in enumerate(expected_frequencies(WEIGHTS)):
+        assert abs(first[i] / NUM_SAMPLES - frequency) < TOLERANCE, i
+
+
+def test_session_rng_streams_are_stable():
+    # String seeds are hashed with SHA-512: the values don't change across runs
+    rng = session_rng("abc")
+    assert [rng.randrange(1000) for _ in range(5)] == [215, 481, 955, 278, 756]
+    rng = session_rng("abc", seed=1)
+    assert [rng.randrange(1000) for _ in range(5)] == [755, 450, 10, 785, 588]
+
+    draws = lambda rng: [rng.random() for _ in range(10)]  # noqa: E731
+    assert draws(session_rng("abc")) == draws(session_rng("abc"))
+    assert draws(session_rng("abc")) != draws(session_rng("abd"))
+    # Other users of the global `random` state don't shift a session's stream
+    expected = draws(session_rng("abc"))
+    random.random()
+    assert draws(session_rng("abc")) == expected
+
+    assert numpy_rng(0, "limit_goals").integers(1000, size=5).tolist() == [
+        105,
+        987,
+        247,
+        813,
+        720,
+    ]
+    assert (
+        numpy_rng(0, "a").integers(1 << 30) != numpy_rng(0, "b").integers(1 << 30)
+    )
+
+
+def test_goal_sequence_is_reproducible(raw_catalog, fake_search_engine):
+    def goal_sequence(goal_seed=233):
+        env = WebAgentTextEnv(
+            observation_mode="text",
+            file_path=raw_catalog,
+            num_products=None,
+            goal_seed=goal_seed,
+        )
+        goals = []
+        for _ in range(5):
+            env.reset()  # a random session id
+            goal = env.server.user_sessions[env.session]["goal"]
+            # The price cap in the text is drawn when the catalog is loaded
+            goals.append((env.session, goal["asin"], goal["goal_options"]))
+        return goals
+
+    expected = goal_sequence()
+    # Other users of the global `random` state don't change the sequence
+    random.seed(1)
+    assert goal_sequence() == expected
+    assert len({session for session, _, _ in expected}) == len(expected)
+    assert goal_sequence(goal_seed=1) != expected
@@ -0,0 +1,154 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The search result cache and how `SimServer` keys and invalidates it."""
+
+import pytest
+
+from personalized_shopping.shared_libraries.web_agent_site.engine import engine
+from personalized_shopping.shared_libraries.web_agent_site.engine.engine import (
+    SearchCache,
+    get_search_cache_key,
+)
+from personalized_shopping.shared_libraries.web_agent_site.envs.web_agent_text_env import (
+    SimServer,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(engine.time, "time", clock)
+    return clock
+
+
+class CountingSearcher:
+    """Wraps a searcher and counts the queries that reach it"""
+
+    def __init__(self, searcher):
+        self.searcher = searcher
+        self.queries = []
+
+    def search(self, q, k=10):
+        self.queries.append(q)
+        return self.searcher.search(q, k=k)
+
+
+def test_lru_eviction():
+    cache = SearchCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # `a` is now the most recently used
+    cache.put("c", 3)  # evicts `b`
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    cache.put("a", 4)  # overwriting refreshes `a`, so `c` goes next
+    cache.put("d", 5)
+    assert cache.get("c") is None
+    assert cache.get("a") == 4
+
+    disabled = SearchCache(maxsize=0)
+    disabled.put("a", 1)
+    assert len(disabled) == 0
+    assert disabled.get("a") is None
+
+
+def test_ttl_expiry(clock):
+    cache = SearchCache(maxsize=4, ttl=10)
+    cache.put("a", 1)
+    clock.now += 10
+    assert cache.get("a") == 1
+    clock.now += 0.5
+    assert cache.get("a") is None
+    assert len(cache) == 0  # expired entries are dropped on lookup
+
+    cache.put("b", 2)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_hit_and_miss_counters(clock):
+    cache = SearchCache(maxsize=4, ttl=10)
+    assert cache.get("a") is None
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("a")
+    clock.now += 11
+    cache.get("a")  # expired, counted as a miss
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_cache_key_normalization():
+    searcher = object()
+    key = get_search_cache_key(["Red", " Shirt "], searcher)
+    assert key == (id(searcher), ("red", "shirt"))
+    assert get_search_cache_key(["red", "", "shirt"], searcher) == key
+    # The key belongs to one index
+    assert get_search_cache_key(["red", "shirt"], object()) != key
+    # Special searches keep their arguments as they are
+    assert get_search_cache_key(["<a>", "B0ABC"], searcher) == (
+        id(searcher),
+        ("<a>", "B0ABC"),
+    )
+
+
+def test_random_searches_are_never_cached():
+    searcher = object()
+    assert get_search_cache_key(["<r>"], searcher) is None
+    assert get_search_cache_key([" <r> "], searcher) is None
+    assert get_search_cache_key([" ", ""], searcher) is None
+
+
+@pytest.fixture
+def server(raw_catalog, fake_search_engine):
+    server = SimServer("http://127.0.0.1:3000", raw_catalog, num_products=None)
+    server.set_search_engine(CountingSearcher(fake_search_engine))
+    return server
+
+
+def test_server_reuses_cached_results(server):
+    server.receive("s1", None)
+    _, _, _, first = server.receive("s1", None, keywords=["Shirt"])
+    _, _, _, second = server.receive("s1", None, keywords=["shirt"])
+    assert second["products"] == first["products"]
+    assert server.search_engine.queries == ["Shirt"]
+    assert (server.search_cache_hits, server.search_cache_misses) == (1, 1)
+
+    # Random searches go around the cache
+    server.receive("s1", None, keywords=["<r>"])
+    assert len(server.search_cache) == 1
+    assert server.search_cache_misses == 1
+
+
+def test_set_search_engine_clears_cache(server, fake_search_engine):
+    server.receive("s1", None)
+    server.receive("s1", None, keywords=["shirt"])
+    assert len(server.search_cache) == 1
+
+    searcher = CountingSearcher(fake_search_engine)
+    server.set_search_engine(searcher)
+    assert len(server.search_cache) == 0
+    server.receive("s1", None, keywords=["shirt"])
+    assert searcher.queries == ["shirt"]
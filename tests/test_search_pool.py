@@ -0,0 +1,233 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Backend choice, and rank filtering over mocked tables and Lucene classes."""
+
+from collections import namedtuple
+import random
+import sys
+import threading
+import types
+
+import numpy as np
+import pytest
+
+from personalized_shopping.shared_libraries.web_agent_site.engine import search_pool
+
+Hit = namedtuple("Hit", ["docid", "lucene_docid", "score"])
+NUM_DOCS = 20
+
+
+class TermInSetQuery:
+    def __init__(self, field, terms):
+        self.field = field
+        self.terms = set(terms)
+
+
+class BooleanQueryBuilder:
+    def __init__(self):
+        self.clauses = []
+
+    def add(self, query, occur):
+        self.clauses.append((query, occur))
+
+    def build(self):
+        return self.clauses
+
+
+class BagOfWordsQueryGenerator:
+    def buildQuery(self, field, analyzer, q):
+        return "bow", q
+
+
+class ArrayList(list):
+    def add(self, value):
+        self.append(value)
+
+
+class JavaClasses:
+    """Stands in for `_autoclass`, counting the BytesRef objects made"""
+
+    def __init__(self):
+        self.num_bytes_refs = 0
+        self.classes = {
+            "io.anserini.search.query.BagOfWordsQueryGenerator": (
+                BagOfWordsQueryGenerator
+            ),
+            "org.apache.lucene.search.BooleanQuery$Builder": BooleanQueryBuilder,
+            "org.apache.lucene.search.BooleanClause$Occur": types.SimpleNamespace(
+                MUST="MUST", FILTER="FILTER", MUST_NOT="MUST_NOT"
+            ),
+            "java.util.ArrayList": ArrayList,
+            "org.apache.lucene.util.BytesRef": self.bytes_ref,
+            "org.apache.lucene.search.TermInSetQuery": TermInSetQuery,
+        }
+
+    def bytes_ref(self, value):
+        self.num_bytes_refs += 1
+        return value.decode()
+
+    def __call__(self, name):
+        return self.classes[name]
+
+
+class FakeLuceneSearcher:
+    """Evaluates the built queries: every doc matches the bag of words"""
+
+    def __init__(self, asins):
+        self.asins = asins
+        self.num_docs = len(asins)
+        self.barrier = None  # makes concurrent searches wait for each other
+
+    def search(self, query, k=10):
+        if self.barrier is not None:
+            self.barrier.wait()
+        hits = []
+        for docid, asin in enumerate(self.asins):
+            keep = True
+            for clause, occur in query:
+                if occur == "FILTER":
+                    keep &= asin in clause.terms
+                elif occur == "MUST_NOT":
+                    keep &= asin not in clause.terms
+                else:
+                    assert (occur, clause) == ("MUST", ("bow", "shoes"))
+            if keep:
+                hits.append(Hit(asin, docid, 1.0))
+        return hits[:k]
+
+
+@pytest.fixture
+def java(monkeypatch):
+    java = JavaClasses()
+    monkeypatch.setattr(search_pool, "_autoclass", java)
+    analysis = types.ModuleType("pyserini.analysis")
+    analysis.get_lucene_analyzer = lambda: "analyzer"
+    monkeypatch.setitem(sys.modules, "pyserini", types.ModuleType("pyserini"))
+    monkeypatch.setitem(sys.modules, "pyserini.analysis", analysis)
+    return java
+
+
+@pytest.fixture
+def searcher(monkeypatch):
+    asins = [f"B{i:09d}" for i in range(NUM_DOCS)]
+    ranks = list(range(NUM_DOCS))
+    random.Random(0).shuffle(ranks)
+    searcher = FakeLuceneSearcher(asins)
+    monkeypatch.setitem(
+        search_pool._docid_tables, id(searcher), np.array(asins, dtype="S10")
+    )
+    monkeypatch.setitem(
+        search_pool._rank_tables, id(searcher), np.array(ranks, dtype=np.int64)
+    )
+    return searcher
+
+
+def test_get_filter_docids():
+    ranks = np.array([3, 0, 4, 1, 2])
+    exclude, docids = search_pool.get_filter_docids(ranks, 2)
+    assert not exclude and docids.tolist() == [1, 3]
+    exclude, docids = search_pool.get_filter_docids(ranks, 4)
+    assert exclude and docids.tolist() == [2]
+    exclude, docids = search_pool.get_filter_docids(ranks, 5)
+    assert exclude and docids.tolist() == []
+
+
+@pytest.mark.parametrize(
+    "num_products,occur,num_terms",
+    [(1, "FILTER", 1), (7, "FILTER", 7), (10, "FILTER", 10), (15, "MUST_NOT", 5)],
+)
+def test_rank_filtered_searcher(java, searcher, num_products, occur, num_terms):
+    ranks = search_pool._rank_tables[id(searcher)]
+    expected = {
+        asin for asin, rank in zip(searcher.asins, ranks) if rank < num_products
+    }
+    filtered = search_pool.RankFilteredSearcher(searcher, num_products)
+    # The filter is built with the searcher, not on its first query
+    assert java.num_bytes_refs == num_terms
+
+    clauses = filtered.build_query("shoes")
+    assert [clause_occur for _, clause_occur in clauses] == ["MUST", occur]
+    assert clauses[1][0].field == search_pool.ID_FIELD
+    assert len(clauses[1][0].terms) == num_terms
+
+    hits = filtered.search("shoes", k=NUM_DOCS)
+    assert {hit.docid for hit in hits} == expected
+    assert len(filtered.search("shoes", k=3)) == min(3, num_products)
+    results = filtered.batch_search(["shoes", "shoes"], ["q1", "q2"], k=NUM_DOCS)
+    assert results == {"q1": hits, "q2": hits}
+    assert java.num_bytes_refs == num_terms
+
+
+def test_rank_filtered_batch_search_is_threaded(java, searcher):
+    filtered = search_pool.RankFilteredSearcher(searcher, 7)
+    qids = [f"q{i}" for i in range(4)]
+    expected = filtered.batch_search(["shoes"] * 4, qids, k=5)
+    assert list(expected) == qids
+    # Each search only returns once all four are running
+    searcher.barrier = threading.Barrier(4, timeout=10)
+    assert filtered.batch_search(["shoes"] * 4, qids, k=5, threads=4) == expected
+
+
+def test_rank_filtered_searcher_needs_tables(java):
+    with pytest.raises(ValueError):
+        search_pool.RankFilteredSearcher(FakeLuceneSearcher(["B000000000"]), 1)
+
+
+@pytest.mark.parametrize(
+    "built,num_products,backend,index",
+    [
+        ([], 1000, "lucene", "indexes_1k"),
+        (["bm25_100.npz"], 100, "bm25", "bm25_100.npz"),
+        (["bm25_100.npz"], 1000, "lucene", "indexes_1k"),
+        (["bm25_100.npz"], None, "lucene", "indexes_1k"),
+        (["bm25_1k.npz"], None, "bm25", "bm25_1k.npz"),
+        (["bm25_1k.npz"], 1000, "bm25", "bm25_1k.npz"),
+        (["bm25_1k.npz"], 10000, "lucene", "indexes_10k"),
+        (["bm25_all.npz"], 10000, "bm25", "bm25_all.npz"),
+        (["bm25_all.npz"], 123, "bm25", "bm25_all.npz"),
+    ],
+)
+def test_auto_backend_serves_the_requested_size(
+    tmp_path, monkeypatch, built, num_products, backend, index
+):
+    monkeypatch.setattr(search_pool, "SEARCH_ENGINE_DIR", str(tmp_path))
+    monkeypatch.setattr(search_pool, "_reported_backends", set())
+    monkeypatch.setenv("WEBSHOP_SEARCH_BACKEND", "auto")
+    for name in built:
+        (tmp_path / name).touch()
+    assert search_pool.get_search_backend(num_products) == backend
+    assert search_pool.get_index_path(num_products) == str(tmp_path / index)
+
+
+def test_search_backend_setting(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(search_pool, "SEARCH_ENGINE_DIR", str(tmp_path))
+    monkeypatch.setattr(search_pool, "_reported_backends", set())
+    (tmp_path / "bm25_all.npz").touch()
+    # A built BM25 index is only used when asked for
+    monkeypatch.delenv("WEBSHOP_SEARCH_BACKEND", raising=False)
+    assert search_pool.get_search_backend(1000) == "lucene"
+    assert search_pool.get_index_path(1000) == str(tmp_path / "indexes_1k")
+    monkeypatch.setenv("WEBSHOP_SEARCH_BACKEND", "BM25")
+    assert search_pool.get_search_backend(1000) == "bm25"
+    monkeypatch.setenv("WEBSHOP_SEARCH_BACKEND", "LUCENE")
+    assert search_pool.get_search_backend() == "lucene"
+    # The choice is printed once per setting
+    assert capsys.readouterr().out.splitlines() == [
+        "Search backend: lucene (WEBSHOP_SEARCH_BACKEND=lucene).",
+        "Search backend: bm25 (WEBSHOP_SEARCH_BACKEND=bm25).",
+    ]
+    monkeypatch.setenv("WEBSHOP_SEARCH_BACKEND", "solr")
+    with pytest.raises(ValueError):
+        search_pool.get_search_backend()
@@ -0,0 +1,194 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Eviction and spilling of `SessionStore`, and sessions coming back after it."""
+
+import json
+
+import pytest
+
+from personalized_shopping.shared_libraries.web_agent_site.engine import (
+    session_store,
+)
+from personalized_shopping.shared_libraries.web_agent_site.envs.web_agent_text_env import (
+    SimBrowser,
+    SimServer,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(session_store.time, "time", clock)
+    return clock
+
+
+def test_lru_eviction():
+    evicted = []
+    store = session_store.SessionStore(maxsize=2, on_evict=evicted.append)
+    store["a"] = {"done": False}
+    store["b"] = {"done": False}
+    store["a"]  # `a` is now the most recently used
+    store["c"] = {"done": False}
+    assert list(store) == ["a", "c"]
+    assert "b" not in store
+    assert evicted == ["b"]
+
+    # Deleting is not an eviction
+    del store["a"]
+    assert evicted == ["b"]
+    assert store.stats()["evicted"] == 1
+    with pytest.raises(KeyError):
+        del store["a"]
+
+
+def test_ttl_eviction(clock):
+    evicted = []
+    store = session_store.SessionStore(ttl=10, on_evict=evicted.append)
+    store["a"] = {"done": False}
+    store["b"] = {"done": False}
+    clock.now += 6
+    store["b"]  # touching `b` restarts its TTL
+    clock.now += 6
+    assert "a" not in store
+    assert evicted == []  # peeking doesn't evict; the next write does
+    store["c"] = {"done": False}
+    assert evicted == ["a"]
+    assert store["b"] == {"done": False}
+
+    clock.now += 11
+    store.evict_expired()
+    assert len(store) == 0
+    assert evicted == ["a", "c", "b"]
+    assert store.stats()["expired"] == 3
+
+
+def test_peeks_do_not_touch_sessions(clock):
+    store = session_store.SessionStore(maxsize=2, ttl=10)
+    store["a"] = {"done": False}
+    store["b"] = {"done": False}
+    clock.now += 6
+    assert "a" in store
+    assert store.get("a") == {"done": False}
+    assert store.get("x", "missing") == "missing"
+    store["c"] = {"done": False}  # `a` is still the least recently used
+    assert list(store) == ["b", "c"]
+
+    clock.now += 6
+    assert store.get("b") is None  # peeks don't restart the TTL either
+    assert "b" not in store
+    assert "c" in store
+
+
+def test_spill_finished_sessions(tmp_path, clock):
+    spill_path = tmp_path / "sessions.jsonl"
+    store = session_store.SessionStore(maxsize=1, spill_path=str(spill_path))
+    goal = {"asin": "B1", "instruction_text": "i want a shirt", "weight": 1.0}
+    store["a"] = {
+        "goal": goal,
+        "done": True,
+        "asin": "B2",
+        "options": {"color": "red"},
+        "asins": {"B2"},
+        "reward": 0.5,
+    }
+    store["b"] = {"goal": goal, "done": False}  # evicts `a`
+    store["c"] = {"goal": goal, "done": False}  # evicts `b`, which isn't done
+    store["c"]["done"] = True
+    store.flush()
+
+    records = [json.loads(line) for line in spill_path.read_text().splitlines()]
+    assert [r["session_id"] for r in records] == ["a", "c"]
+    assert records[0]["asin"] == "B2"
+    assert records[0]["options"] == {"color": "red"}
+    assert records[0]["reward"] == 0.5
+    assert records[0]["goal"]["instruction_text"] == "i want a shirt"
+    assert "weight" not in records[0]["goal"]
+    assert store.stats()["spilled"] == 2
+    assert len(store) == 0
+
+
+@pytest.fixture
+def server(raw_catalog, fake_search_engine):
+    return SimServer(
+        "http://127.0.0.1:3000",
+        raw_catalog,
+        num_products=None,
+        session_store_size=1,
+    )
+
+
+def test_evicted_session_comes_back(server):
+    server.receive("s1", None)
+    _, url, _, page_data = server.receive("s1", None, keywords=["shirt"])
+    assert page_data["page_type"] == "search_results"
+    goal = server.user_sessions["s1"]["goal"]
+    server.receive("s2", None)  # evicts `s1`
+    assert "s1" not in server.user_sessions
+
+    # A search from an evicted session starts it over with the same goal
+    _, url, _, page_data = server.receive("s1", url, keywords=["shirt"])
+    assert page_data["page_type"] == "search_results"
+    session = server.user_sessions["s1"]
+    assert session["goal"] == goal
+    assert session["actions"] == {"search": 1}
+    assert session["asins"] == set()
+
+    # So does any other click, which lands back on the index page
+    asin = page_data["products"][0]["asin"]
+    server.receive("s2", None)
+    _, url, status, page_data = server.receive(
+        "s1",
+        url,
+        clickable_name=asin,
+        text_to_clickable={asin: {"class": ["product-link"]}},
+    )
+    assert page_data == {"page_type": "index"}
+    assert status == {"reward": 0.0, "done": False}
+    assert server.user_sessions["s1"]["asin"] is None
+
+    # From there the episode runs as usual
+    server.receive("s1", url, keywords=["shirt"])
+    _, _, _, page_data = server.receive(
+        "s1",
+        url,
+        clickable_name=asin,
+        text_to_clickable={asin: {"class": ["product-link"]}},
+    )
+    assert page_data["page_type"] == "item_page"
+    assert server.user_sessions["s1"]["asins"] == {asin.upper()}
+
+
+def test_evicted_session_keeps_its_goal_index(server):
+    browser = SimBrowser(server)
+    browser.get(f"{server.base_url}/s1", session_id="s1", session_int=3)
+    assert server.user_sessions["s1"]["goal"] == server.goals[3]
+    browser.search(["shirt"])
+    server.receive("s2", None)  # evicts `s1`
+
+    # The session comes back on the goal it was started with
+    browser.search(["dress"])
+    assert browser.page_data["page_type"] == "search_results"
+    assert server.user_sessions["s1"]["goal"] == server.goals[3]
+    server.receive("s2", None)
+    browser.click("back to search", {})
+    assert server.user_sessions["s1"]["goal"] == server.goals[3]
@@ -0,0 +1,107 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Differential tests of the template registry against Flask's own rendering."""
+
+import os
+import random
+
+from flask import render_template_string, url_for
+from test_pages import generate_pages
+
+from personalized_shopping.shared_libraries.web_agent_site.engine import engine
+from personalized_shopping.shared_libraries.web_agent_site.engine.engine import (
+    PAGE_ENDPOINTS,
+    TEMPLATE_DIR,
+    TemplateRegistry,
+    build_url,
+    map_action_to_html,
+)
+from personalized_shopping.shared_libraries.web_agent_site.envs.web_agent_text_env import (
+    flask_context,
+)
+
+# Characters that werkzeug quotes differently in paths and query strings
+URL_PIECES = [" ", "+", "&", "=", "?", "#", "%", "/", ":", "'", '"', "<r>", "é", "~"]
+URL_PIECES += ["shirt", "Navy Blue", "10.5", "", "\n", "[", "{", "$", "!", "@"]
+
+
+def random_value(rng):
+    return "".join(rng.choice(URL_PIECES) for _ in range(rng.randint(0, 4)))
+
+
+def generate_url_arguments(num_urls=2000, seed=0):
+    rng = random.Random(seed)
+    for _ in range(num_urls):
+        endpoint = rng.choice(PAGE_ENDPOINTS)
+        values = dict(
+            session_id=rng.choice(["abc", 7, random_value(rng)]),
+            keywords=[random_value(rng) for _ in range(rng.randint(0, 3))],
+            page=rng.choice([1, 2, None]),
+            asin=rng.choice([None, "B07ABC1234", random_value(rng)]),
+            options={
+                random_value(rng): random_value(rng) for _ in range(rng.randint(0, 2))
+            },
+            sub_page=rng.choice([None, "Description", random_value(rng)]),
+        )
+        # Drop a random subset of the arguments, keeping their order
+        yield endpoint, {k: v for k, v in values.items() if rng.random() < 0.7}
+    for _ in range(num_urls // 10):
+        yield "static", dict(filename=rng.choice(["style.css", random_value(rng)]))
+
+
+def render_pages(registry, monkeypatch, num_products):
+    monkeypatch.setattr(engine, "template_registry", registry)
+    with flask_context():
+        return [
+            map_action_to_html(action, **kwargs)
+            for action, kwargs in generate_pages(num_products=num_products)
+        ]
+
+
+def test_templates_are_compiled_once():
+    registry = TemplateRegistry(mode="flask")
+    with flask_context():
+        registry.preload()
+        for name in os.listdir(TEMPLATE_DIR):
+            if name.endswith(".html"):
+                assert registry.get_template(name) is registry.get_template(name)
+
+
+def test_flask_mode_matches_render_template_string(monkeypatch):
+    registry = TemplateRegistry(mode="flask")
+    registry_render = registry.render
+    rendered = []
+
+    def render(name, **context):
+        with open(os.path.join(TEMPLATE_DIR, name)) as f:
+            rendered.append(render_template_string(f.read(), **context))
+        return registry_render(name, **context)
+
+    monkeypatch.setattr(registry, "render", render)
+    pages = render_pages(registry, monkeypatch, num_products=50)
+    assert pages == rendered
+
+
+def test_build_url_matches_url_for():
+    with flask_context():
+        for endpoint, values in generate_url_arguments():
+            expected = url_for(endpoint, **values)
+            assert build_url(endpoint, **values) == expected, (endpoint, values)
+
+
+def test_fast_and_flask_modes_render_same_html(monkeypatch):
+    fast_pages = render_pages(TemplateRegistry(mode="fast"), monkeypatch, 100)
+    flask_pages = render_pages(TemplateRegistry(mode="flask"), monkeypatch, 100)
+    assert fast_pages == flask_pages